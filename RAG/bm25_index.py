@@ -0,0 +1,165 @@
+import json
+import math
+import os
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from llama_index.core.schema import NodeRelationship, NodeWithScore, RelatedNodeInfo, TextNode
+
+# BM25 sparse index over the same chunks as the vector store.
+#
+# build_rag.py keeps one JSON sidecar per collection with each chunk's text,
+# metadata and precomputed term frequencies; the RAG service loads it once and
+# builds numpy postings, so a query costs one pass over its terms' postings.
+
+FORMAT_VERSION = 1
+FILTER_KEYS = ("doc_type", "ext")
+
+# Identifiers such as numericInput, viewsTree, fontSize.px, Tag_1 stay whole
+# and also count by their parts (numeric, input, font, size, px, ...)
+_TOKEN = re.compile(r"[A-Za-z0-9_]+(?:\.[A-Za-z0-9_]+)*")
+_PARTS = re.compile(r"[._]|(?<=[a-z0-9])(?=[A-Z])")
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is",
+    "it", "of", "on", "or", "that", "the", "this", "to", "with",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    tokens: List[str] = []
+    for raw in _TOKEN.findall(text or ""):
+        tokens.append(raw.lower())
+        parts = [p for p in _PARTS.split(raw) if p]
+        if len(parts) > 1:
+            tokens.extend(p.lower() for p in parts)
+    return [t for t in tokens if t not in _STOPWORDS]
+
+
+def _node_record(node: Any) -> Dict[str, Any]:
+    text = node.get_content()
+    return {
+        "id": node.node_id,
+        "ref_doc_id": node.ref_doc_id,
+        "text": text,
+        "metadata": node.metadata or {},
+        "excluded_llm_metadata_keys": list(node.excluded_llm_metadata_keys),
+        "tf": dict(Counter(tokenize(text))),
+    }
+
+
+class BM25Index:
+    """Okapi BM25 over chunk records; writers add/delete/save, readers search."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.records: List[Dict[str, Any]] = []
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._doc_len = np.zeros(0, dtype=np.float32)
+        self._filter_values: Dict[str, np.ndarray] = {}
+        self._dirty = True
+
+    # --------------------
+    # Writing (build_rag.py)
+    # --------------------
+
+    def add(self, nodes: List[Any]) -> None:
+        self.records.extend(_node_record(n) for n in nodes)
+        self._dirty = True
+
+    def delete(self, ref_doc_id: str) -> None:
+        self.records = [r for r in self.records if r.get("ref_doc_id") != ref_doc_id]
+        self._dirty = True
+
+    def save(self, path: Path) -> None:
+        tmp = Path(str(path) + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": FORMAT_VERSION, "k1": self.k1, "b": self.b, "records": self.records},
+                      f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "BM25Index":
+        """Load a sidecar; a missing file loads as an empty index."""
+        if not os.path.exists(path):
+            return cls()
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported BM25 index version {data.get('version')} at {path}")
+        index = cls(data.get("k1", 1.2), data.get("b", 0.75))
+        index.records = data.get("records", [])
+        return index
+
+    # --------------------
+    # Querying (RAG service)
+    # --------------------
+
+    def _build(self) -> None:
+        postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        doc_len = np.zeros(len(self.records), dtype=np.float32)
+        for i, r in enumerate(self.records):
+            for term, tf in r["tf"].items():
+                docs, tfs = postings.setdefault(term, ([], []))
+                docs.append(i)
+                tfs.append(tf)
+            doc_len[i] = sum(r["tf"].values())
+        self._postings = {
+            t: (np.asarray(d, dtype=np.int32), np.asarray(f, dtype=np.float32))
+            for t, (d, f) in postings.items()
+        }
+        self._doc_len = doc_len
+        self._filter_values = {
+            key: np.array([(r.get("metadata") or {}).get(key) for r in self.records], dtype=object)
+            for key in FILTER_KEYS
+        }
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def search(self, query: str, top_k: int, filters: Optional[Dict[str, str]] = None) -> List[NodeWithScore]:
+        if self._dirty:
+            self._build()
+        n = len(self.records)
+        terms = set(tokenize(query))
+        if n == 0 or not terms:
+            return []
+
+        avg_len = float(self._doc_len.mean()) or 1.0
+        norm = self.k1 * (1 - self.b + self.b * self._doc_len / avg_len)
+        scores = np.zeros(n, dtype=np.float32)
+        for term in terms:
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            docs, tfs = posting
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm[docs])
+
+        for key, value in (filters or {}).items():
+            if key not in self._filter_values:
+                raise ValueError(f"Filtering on {key!r} is not supported; use one of {FILTER_KEYS}")
+            scores[self._filter_values[key] != value] = 0.0
+
+        k = min(top_k, int(np.count_nonzero(scores)))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [NodeWithScore(node=self._to_node(int(i)), score=float(scores[i])) for i in top]
+
+    def _to_node(self, row: int) -> TextNode:
+        rec = self.records[row]
+        node = TextNode(
+            id_=rec["id"],
+            text=rec["text"],
+            metadata=rec.get("metadata") or {},
+            excluded_llm_metadata_keys=rec.get("excluded_llm_metadata_keys") or [],
+        )
+        if rec.get("ref_doc_id"):
+            node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(node_id=rec["ref_doc_id"])
+        return node
@@ -1,11 +1,18 @@
+import argparse
+import json
 import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Dict, List, Tuple
 
 # ✅ Set embed model FIRST (before importing VectorStoreIndex, readers, etc.)
 from llama_index.core import Settings
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from embed_backend import build_embed_model
 
-Settings.embed_model = HuggingFaceEmbedding(model_name="BAAI/bge-small-en-v1.5")
+# PyTorch or ONNX Runtime, per RAG_EMBED_BACKEND (must match the server's)
+Settings.embed_model = build_embed_model(os.getenv("RAG_EMBED_MODEL", "BAAI/bge-small-en-v1.5"))
 Settings.chunk_size = 800
 Settings.chunk_overlap = 120
 
@@ -13,79 +20,62 @@ Settings.chunk_overlap = 120
 # Required paths and hosts were previously undefined causing runtime errors.
 # These defaults make local runs smooth while allowing overrides via env.
 DATA_DIR = Path(os.environ.get("RAG_DATA_DIR", "../ai_reference"))
+# Duro project exports (.config tar archives) indexed straight from the archive; "" disables
+CONFIG_DIR = os.getenv("RAG_CONFIG_DIR", "../duro_examples")
 QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
 # Unify collection env var with server: prefer RAG_COLLECTION, fallback to QDRANT_COLLECTION
 COLLECTION = os.getenv("RAG_COLLECTION") or os.getenv("QDRANT_COLLECTION", "durusai_docs")
+# Vector store backend: "qdrant" (server) or "numpy" (embedded, memory-mapped files)
+RAG_BACKEND = os.getenv("RAG_BACKEND", "qdrant")
+NUMPY_STORE_DIR = Path(os.getenv(
+    "RAG_NUMPY_DIR",
+    str(Path(__file__).resolve().parent / f"vector_store_{COLLECTION}"),
+))
+# Stored precision for the numpy backend: float32, float16 or int8
+NUMPY_STORE_DTYPE = os.getenv("RAG_NUMPY_DTYPE", "float32")
+# BM25 sidecar over the same chunks, used by hybrid retrieval in the server
+BM25_PATH = Path(os.getenv(
+    "RAG_BM25_PATH",
+    str(Path(__file__).resolve().parent / f"bm25_{COLLECTION}.json"),
+))
+# Ingestion pipeline tuning (overridable on the command line)
+INGEST_WORKERS = int(os.getenv("RAG_INGEST_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+EMBED_BATCH_SIZE = int(os.getenv("RAG_EMBED_BATCH_SIZE", "64"))
+EMBED_THREADS = int(os.getenv("RAG_EMBED_THREADS", "0"))
+UPSERT_BATCH_SIZE = int(os.getenv("RAG_UPSERT_BATCH_SIZE", "256"))
+UPSERT_MAX_IN_FLIGHT = int(os.getenv("RAG_UPSERT_MAX_IN_FLIGHT", "4"))
+# Sidecar manifest of per-file content hashes used by --incremental runs
+MANIFEST_PATH = Path(os.getenv(
+    "RAG_MANIFEST_PATH",
+    str(Path(__file__).resolve().parent / f"rag_manifest_{COLLECTION}.json"),
+))
 
 # ✅ Now import the rest
 import qdrant_client
-from llama_index.core import VectorStoreIndex, StorageContext
-from llama_index.core.schema import Document
-from llama_index.core.readers import SimpleDirectoryReader
 from llama_index.vector_stores.qdrant import QdrantVectorStore
-from llama_index.readers.json import JSONReader
+from loaders import scan_config_archives, scan_files, file_sha256
+from ingest_pipeline import configure_embed_threads, run_pipeline
+from numpy_store import DTYPES, NumpyVectorStore
+from bm25_index import BM25Index
 # IMPORTANT:
 # Set your embed model + LLM in env or code.
 # If you're using OpenAI via LlamaIndex, export OPENAI_API_KEY.
 # Otherwise configure a local embedding model in Settings before indexing.
 
-def load_text_docs(data_dir: Path):
-    # SimpleDirectoryReader supports .md and many common types.  [oai_citation:2‡LlamaIndex](https://developers.llamaindex.ai/python/framework/module_guides/loading/simpledirectoryreader/?utm_source=chatgpt.com)
-    return SimpleDirectoryReader(
-        input_dir=str(data_dir),
-        recursive=True,
-        required_exts=[".txt"],
-        filename_as_id=True,
-    ).load_data()
-
-def load_json_docs(data_dir: Path):
-    # LlamaIndex recommends a JSON-specific loader for JSON.  [oai_citation:3‡LlamaIndex](https://developers.llamaindex.ai/python/framework/module_guides/loading/simpledirectoryreader/?utm_source=chatgpt.com)
-    reader = JSONReader(levels_back=2, collapse_length=200)
-    docs: list[Document] = []
-
-    for p in data_dir.rglob("*.json"):
-        # Skip obvious noise/secrets if needed
-        if p.name.lower() in {"package-lock.json", "tsconfig.json"}:
-            continue
-
-        json_docs = reader.load_data(input_file=str(p))
-        for d in json_docs:
-            # Helpful metadata for filtering later
-            d.metadata = {
-                **(d.metadata or {}),
-                "path": str(p),
-                "doc_type": "hmi_config",
-                "ext": ".json",
-            }
-        docs.extend(json_docs)
-
-    return docs
-
-def main():
-    if not DATA_DIR.exists():
-        raise SystemExit(f"RAG_DATA_DIR not found: {DATA_DIR.resolve()}")
-
-    print(f"Loading docs from: {DATA_DIR.resolve()}")
-
-    text_docs = load_text_docs(DATA_DIR)
-    json_docs = load_json_docs(DATA_DIR)
-
-    # Tag text docs too and ensure path metadata is present for attribution
-    for d in text_docs:
-        existing_meta = d.metadata or {}
-        # SimpleDirectoryReader typically provides file_path; keep it if present
-        path = existing_meta.get("file_path") or existing_meta.get("filename") or existing_meta.get("id") or None
-        d.metadata = {
-            **existing_meta,
-            "doc_type": "docs",
-            "ext": ".txt",
-            # normalized path key used by server for source formatting
-            **({"path": path} if path else {}),
-        }
-
-    docs = text_docs + json_docs
-    print(f"Loaded {len(docs)} documents")
-
+def connect_vector_store(rebuild: bool = False):
+    """(client, vector_store). With `rebuild`, the store starts empty (numpy rows / Qdrant collection dropped)."""
+    if RAG_BACKEND == "numpy":
+        # Writers work on an in-memory copy; persist() swaps the files in
+        store = NumpyVectorStore(str(NUMPY_STORE_DIR), NUMPY_STORE_DTYPE, mmap=False)
+        if rebuild:
+            store.clear(NUMPY_STORE_DTYPE)
+        elif store.count and store.dtype != NUMPY_STORE_DTYPE:
+            # load() keeps the on-disk precision; mixing would silently ignore --dtype
+            raise SystemExit(
+                f"Numpy store at {NUMPY_STORE_DIR} is stored as {store.dtype}, not {NUMPY_STORE_DTYPE}: "
+                f"pass --dtype {store.dtype} or rebuild it (--recreate or a full run)"
+            )
+        return None, store
     # Qdrant client + vector store
     client = qdrant_client.QdrantClient(url=QDRANT_URL)
     # Validate connectivity early with a lightweight call
@@ -93,13 +83,225 @@ def main():
         client.get_collections()
     except Exception as e:
         raise SystemExit(f"Unable to connect to Qdrant at {QDRANT_URL}: {e}")
+    if rebuild and client.collection_exists(COLLECTION):
+        # A full build rewrites the manifest, so stale or duplicate points must not survive it
+        client.delete_collection(COLLECTION)
+        print(f"Dropped Qdrant collection {COLLECTION} for a full rebuild")
     vector_store = QdrantVectorStore(client=client, collection_name=COLLECTION)
-    storage_context = StorageContext.from_defaults(vector_store=vector_store)
+    return client, vector_store
+
+# --------------------
+# Incremental ingestion helpers
+# --------------------
+
+def load_manifest(path: Path) -> Dict[str, dict]:
+    """{file: {"hash": sha256, "doc_ids": [...], "chunks": n}} from the last run."""
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("collection") != COLLECTION:
+        print(f"Manifest {path} belongs to collection {data.get('collection')!r}; ignoring it")
+        return {}
+    if data.get("backend", "qdrant") != RAG_BACKEND:
+        print(f"Manifest {path} was written for the {data.get('backend')!r} backend; ignoring it")
+        return {}
+    return data.get("files", {})
+
+def save_manifest(path: Path, files: Dict[str, dict]) -> None:
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"collection": COLLECTION, "backend": RAG_BACKEND, "files": files}, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+def plan_changes(
+    hashes: Dict[str, str], manifest: Dict[str, dict]
+) -> Tuple[List[str], List[str], List[str], List[str]]:
+    """Split files into (added, updated, removed, unchanged) against the manifest."""
+    added = [f for f in hashes if f not in manifest]
+    updated = [f for f in hashes if f in manifest and manifest[f].get("hash") != hashes[f]]
+    unchanged = [f for f in hashes if f in manifest and manifest[f].get("hash") == hashes[f]]
+    removed = [f for f in manifest if f not in hashes]
+    return added, updated, removed, unchanged
+
+def _pipeline(files: Dict[str, Path], hashes: Dict[str, str], vector_store, bm25: BM25Index, opts: dict):
+    return run_pipeline(
+        [(k, files[k], hashes[k]) for k in files],
+        vector_store,
+        Settings.embed_model,
+        workers=opts["workers"],
+        embed_batch_size=opts["embed_batch_size"],
+        upsert_batch_size=opts["upsert_batch_size"],
+        max_in_flight=opts["max_in_flight"],
+        chunk_size=Settings.chunk_size,
+        chunk_overlap=Settings.chunk_overlap,
+        node_sink=bm25.add,
+    )
+
+def _store_location() -> str:
+    if RAG_BACKEND == "numpy":
+        return f"numpy store ({NUMPY_STORE_DTYPE}) at {NUMPY_STORE_DIR}"
+    return f"Qdrant collection: {COLLECTION} at {QDRANT_URL}"
+
+def _print_throughput(stats: dict) -> None:
+    print(
+        f"Throughput: {stats['chunks']} chunks from {stats['files']} files in {stats['wall_sec']}s "
+        f"({stats['chunks_per_sec']} chunks/s, {stats['mb_per_sec']} MB/s); "
+        f"embed {stats['embed_sec']}s ({stats['embed_chunks_per_sec']} chunks/s), "
+        f"upsert {stats['upsert_sec']}s"
+    )
+
+def scan_sources() -> Dict[str, Path]:
+    """Indexable files under RAG_DATA_DIR plus the .config archives under RAG_CONFIG_DIR."""
+    files = scan_files(DATA_DIR)
+    if CONFIG_DIR and Path(CONFIG_DIR).is_dir():
+        files.update(scan_config_archives(Path(CONFIG_DIR)))
+    return files
+
+def hash_files(files: Dict[str, Path], workers: int) -> Dict[str, str]:
+    # hashlib releases the GIL on large buffers, so threads hash archives in parallel
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        return dict(zip(files, pool.map(file_sha256, files.values())))
+
+def incremental_main(opts: dict):
+    timings: Dict[str, float] = {}
+
+    def phase(name: str, t0: float) -> float:
+        t1 = time.perf_counter()
+        timings[name] = round(t1 - t0, 3)
+        return t1
 
-    # Build / upsert into Qdrant
-    VectorStoreIndex.from_documents(docs, storage_context=storage_context)
+    t = time.perf_counter()
+    files = scan_sources()
+    hashes = hash_files(files, opts["workers"])
+    manifest = load_manifest(MANIFEST_PATH)
+    added, updated, removed, unchanged = plan_changes(hashes, manifest)
+    t = phase("scan_hash", t)
 
-    print(f"✅ Indexed into Qdrant collection: {COLLECTION} at {QDRANT_URL}")
+    print(
+        f"Files: {len(added)} added, {len(updated)} updated, "
+        f"{len(removed)} removed, {len(unchanged)} unchanged"
+    )
+    if not manifest and files:
+        print("No manifest found: treating every file as new (use --recreate to drop stale points)")
+
+    _, vector_store = connect_vector_store()
+    bm25 = BM25Index.load(BM25_PATH)
+    if manifest and not BM25_PATH.exists():
+        print(f"BM25 index {BM25_PATH} missing: only new/changed files will be in it (use --recreate to rebuild)")
+
+    # Drop points of removed and changed files
+    chunks_removed = 0
+    for f in removed + updated:
+        entry = manifest.get(f, {})
+        for doc_id in entry.get("doc_ids", []):
+            vector_store.delete(ref_doc_id=doc_id)
+            bm25.delete(doc_id)
+        chunks_removed += entry.get("chunks", 0)
+    t = phase("delete", t)
+
+    # Load, chunk, embed and upsert only new/changed files
+    to_index = {f: files[f] for f in added + updated}
+    per_file, stats = _pipeline(to_index, hashes, vector_store, bm25, opts)
+    if RAG_BACKEND == "numpy":
+        vector_store.persist()
+    bm25.save(BM25_PATH)
+    t = phase("load_chunk_embed_upsert", t)
+
+    # Record per-file doc ids / chunk counts for the next run
+    new_manifest = {f: manifest[f] for f in unchanged}
+    for f in to_index:
+        new_manifest[f] = {"hash": hashes[f], **per_file.get(f, {"doc_ids": [], "chunks": 0})}
+    save_manifest(MANIFEST_PATH, new_manifest)
+    phase("manifest", t)
+
+    chunks_updated = sum(new_manifest[f]["chunks"] for f in updated)
+    chunks_added = stats["chunks"] - chunks_updated
+    print(
+        f"Chunks: {chunks_added} added, {chunks_updated} updated (re-embedded), "
+        f"{chunks_removed} removed"
+    )
+    _print_throughput(stats)
+    print("Phase timings (s):", timings)
+    print(f"✅ Incrementally indexed into {_store_location()}")
+
+def main(opts: dict):
+    if not DATA_DIR.exists():
+        raise SystemExit(f"RAG_DATA_DIR not found: {DATA_DIR.resolve()}")
+
+    print(f"Loading docs from: {DATA_DIR.resolve()}" + (f" and .config archives in {Path(CONFIG_DIR).resolve()}" if CONFIG_DIR else ""))
+
+    files = scan_sources()
+    hashes = hash_files(files, opts["workers"])
+    print(f"Found {len(files)} files")
+
+    _, vector_store = connect_vector_store(rebuild=True)
+
+    # Build / upsert into the emptied store
+    bm25 = BM25Index()
+    per_file, stats = _pipeline(files, hashes, vector_store, bm25, opts)
+    if RAG_BACKEND == "numpy":
+        vector_store.persist()
+    bm25.save(BM25_PATH)
+    save_manifest(MANIFEST_PATH, {f: {"hash": hashes[f], **per_file[f]} for f in per_file})
+    _print_throughput(stats)
+
+    print(f"✅ Indexed into {_store_location()}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Build the RAG index in Qdrant.")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        default=os.getenv("RAG_INCREMENTAL", "0") == "1",
+        help="Only embed new/changed files and delete points of removed/changed ones",
+    )
+    parser.add_argument(
+        "--recreate",
+        action="store_true",
+        help="Drop the collection (and manifest) first, then index everything",
+    )
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS,
+                        help="Processes used to load and chunk files")
+    parser.add_argument("--embed-batch-size", type=int, default=EMBED_BATCH_SIZE,
+                        help="Chunks per embedding call")
+    parser.add_argument("--embed-threads", type=int, default=EMBED_THREADS,
+                        help="Intra-op threads for the embedding runtime (0 = default)")
+    parser.add_argument("--upsert-batch-size", type=int, default=UPSERT_BATCH_SIZE,
+                        help="Points per Qdrant upsert request")
+    parser.add_argument("--max-in-flight", type=int, default=UPSERT_MAX_IN_FLIGHT,
+                        help="Maximum concurrent Qdrant upsert requests")
+    parser.add_argument("--backend", choices=["qdrant", "numpy"], default=RAG_BACKEND,
+                        help="Vector store to write (numpy = embedded memory-mapped files)")
+    parser.add_argument("--dtype", choices=list(DTYPES), default=NUMPY_STORE_DTYPE,
+                        help="Stored precision for the numpy backend")
+    args = parser.parse_args()
+    RAG_BACKEND, NUMPY_STORE_DTYPE = args.backend, args.dtype
+
+    configure_embed_threads(args.embed_threads, Settings.embed_model)
+    # get_text_embedding_batch re-splits every call by the model's own embed_batch_size (default 10)
+    Settings.embed_model.embed_batch_size = args.embed_batch_size
+    opts = {
+        "workers": args.workers,
+        "embed_batch_size": args.embed_batch_size,
+        "upsert_batch_size": args.upsert_batch_size,
+        "max_in_flight": args.max_in_flight,
+    }
+
+    if not DATA_DIR.exists():
+        raise SystemExit(f"RAG_DATA_DIR not found: {DATA_DIR.resolve()}")
+    if args.recreate:
+        if RAG_BACKEND == "numpy":
+            shutil.rmtree(NUMPY_STORE_DIR, ignore_errors=True)
+        else:
+            client, _ = connect_vector_store()
+            if client.collection_exists(COLLECTION):
+                client.delete_collection(COLLECTION)
+        MANIFEST_PATH.unlink(missing_ok=True)
+        BM25_PATH.unlink(missing_ok=True)
+        print(f"Dropped {_store_location()}")
+
+    if args.incremental or args.recreate:
+        incremental_main(opts)
+    else:
+        main(opts)
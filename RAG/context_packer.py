@@ -0,0 +1,168 @@
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# Packs retrieved chunks into a token budget:
+#   - budget is counted with the tokenizer of the configured LLM
+#     (falls back to a ~4 chars/token estimate if it cannot be loaded)
+#   - lines a chunk shares at its edges with already packed text (chunk
+#     overlap, fallback sections repeating a retrieved chunk) are trimmed;
+#     chunks that are mostly duplicates are dropped
+#   - chunks are picked by maximal marginal relevance and are never cut:
+#     a chunk either fits whole or is skipped
+
+# An explicit RAG_TOKENIZER may be downloaded; the LLM_MODEL_NAME default is only
+# used if it is already in the local HF cache (no network retries when offline)
+_TOKENIZER_EXPLICIT = "RAG_TOKENIZER" in os.environ
+RAG_TOKENIZER = os.getenv(
+    "RAG_TOKENIZER",
+    os.getenv("LLM_MODEL_NAME", "mlx-community/Meta-Llama-3.1-8B-Instruct-4bit"),
+)
+_CHARS_PER_TOKEN = 4.0
+# A chunk with at least this share of its lines already packed is a duplicate
+_DUP_LINE_RATIO = 0.8
+# Edge runs shorter than this (chars) are kept; short lines like "Key fields:" repeat legitimately
+_MIN_TRIM_CHARS = 40
+
+_WORD = re.compile(r"\w+")
+_tokenizer: Any = None
+_tokenizer_loaded = False
+_tokenizer_lock = threading.Lock()
+
+
+def _get_tokenizer():
+    global _tokenizer, _tokenizer_loaded
+
+    if not _tokenizer_loaded:
+        with _tokenizer_lock:
+            if not _tokenizer_loaded:
+                if RAG_TOKENIZER:
+                    try:
+                        from transformers import AutoTokenizer
+                        _tokenizer = AutoTokenizer.from_pretrained(
+                            RAG_TOKENIZER, local_files_only=not _TOKENIZER_EXPLICIT
+                        )
+                        print(f"[AGENT DEBUG] Context tokenizer loaded: {RAG_TOKENIZER}")
+                    except Exception as e:
+                        print(f"[AGENT DEBUG] Tokenizer {RAG_TOKENIZER!r} unavailable, estimating tokens: {e}")
+                _tokenizer_loaded = True
+    return _tokenizer
+
+
+def count_tokens(text: str) -> int:
+    tok = _get_tokenizer()
+    if tok is None:
+        return int(len(text) / _CHARS_PER_TOKEN) + 1
+    return len(tok.encode(text, add_special_tokens=False))
+
+
+def tokenizer_name() -> str:
+    return RAG_TOKENIZER if _get_tokenizer() is not None else f"estimate({_CHARS_PER_TOKEN:g} chars/token)"
+
+
+class Candidate:
+    """One chunk to pack; `header` is rendered above `text` and counts toward the budget."""
+
+    __slots__ = ("key", "header", "text", "relevance", "pinned", "words")
+
+    def __init__(self, key: Any, header: str, text: str, relevance: float, pinned: bool = False):
+        self.key = key
+        self.header = header
+        self.text = text.strip()
+        self.relevance = relevance
+        self.pinned = pinned
+        self.words: Set[str] = set(w.lower() for w in _WORD.findall(self.text))
+
+
+def _norm_line(line: str) -> str:
+    return " ".join(line.split()).lower()
+
+
+def _trim_edges(text: str, seen: Set[str]) -> Tuple[Optional[str], int]:
+    """Drop leading/trailing lines already packed. Returns (text or None if duplicate, chars trimmed)."""
+    lines = text.splitlines()
+    keyed = [_norm_line(l) for l in lines]
+    content = [k for k in keyed if k]
+    if not content:
+        return None, len(text)
+    if sum(1 for k in content if k in seen) / len(content) >= _DUP_LINE_RATIO:
+        return None, len(text)
+
+    start, end = 0, len(lines)
+    while start < end and (not keyed[start] or keyed[start] in seen):
+        start += 1
+    while end > start and (not keyed[end - 1] or keyed[end - 1] in seen):
+        end -= 1
+    head = sum(len(l) + 1 for l in lines[:start])
+    tail = sum(len(l) + 1 for l in lines[end:])
+    if head < _MIN_TRIM_CHARS:
+        start, head = 0, 0
+    if tail < _MIN_TRIM_CHARS:
+        end, tail = len(lines), 0
+    return "\n".join(lines[start:end]).strip(), head + tail
+
+
+def _similarity(a: Candidate, b: Candidate) -> float:
+    if not a.words or not b.words:
+        return 0.0
+    return len(a.words & b.words) / len(a.words | b.words)
+
+
+def pack(
+    candidates: List[Candidate],
+    budget_tokens: int,
+    mmr_lambda: float = 0.7,
+) -> Tuple[List[Tuple[Candidate, str]], Dict[str, Any]]:
+    """
+    Select and dedup candidates within `budget_tokens`.
+
+    Pinned candidates go first in their given order; the rest are chosen by
+    MMR (relevance vs. similarity to what is already packed). Returns
+    [(candidate, packed text)] in selection order and packing stats.
+    """
+    stats = {"candidates": len(candidates), "selected": 0, "duplicates": 0,
+             "trimmed_chars": 0, "skipped_budget": 0, "tokens": 0, "budget": budget_tokens}
+    selected: List[Tuple[Candidate, str]] = []
+    seen: Set[str] = set()
+    used = 0
+
+    def try_add(c: Candidate) -> None:
+        nonlocal used
+        text, trimmed = _trim_edges(c.text, seen)
+        if text is None:
+            stats["duplicates"] += 1
+            return
+        cost = count_tokens(c.header + "\n" + text + "\n---\n")
+        if used + cost > budget_tokens:
+            stats["skipped_budget"] += 1
+            return
+        used += cost
+        stats["trimmed_chars"] += trimmed
+        selected.append((c, text))
+        seen.update(k for k in (_norm_line(l) for l in text.splitlines()) if k)
+
+    pool = [c for c in candidates if not c.pinned]
+    for c in candidates:
+        if c.pinned:
+            try_add(c)
+
+    if pool:
+        hi = max(c.relevance for c in pool)
+        lo = min(c.relevance for c in pool)
+        span = (hi - lo) or 1.0
+        rel = {id(c): (c.relevance - lo) / span for c in pool}
+        while pool:
+            packed = [c for c, _ in selected]
+
+            def mmr(c: Candidate) -> float:
+                redundancy = max((_similarity(c, s) for s in packed), default=0.0)
+                return mmr_lambda * rel[id(c)] - (1 - mmr_lambda) * redundancy
+
+            best = max(pool, key=mmr)
+            pool.remove(best)
+            try_add(best)
+
+    stats["selected"] = len(selected)
+    stats["tokens"] = used
+    return selected, stats
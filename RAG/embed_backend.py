@@ -0,0 +1,208 @@
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+
+# Embedding backend shared by the server (RAG/service.py) and ingestion (build_rag.py):
+#   torch - llama-index HuggingFaceEmbedding (sentence-transformers on PyTorch)
+#   onnx  - the same model exported to ONNX and run with ONNX Runtime, optionally
+#           int8 dynamically quantized. Needs onnxruntime + tokenizers only, so a
+#           server with a pre-exported model never imports torch.
+# Export once on a host with torch (the server also exports on first use):
+#   python RAG/embed_backend.py --export [--quantize]
+RAG_EMBED_BACKEND = os.getenv("RAG_EMBED_BACKEND", "torch").lower()
+RAG_ONNX_QUANTIZE = os.getenv("RAG_ONNX_QUANTIZE", "0") == "1"
+# Intra-op threads per ONNX session (0 = ONNX Runtime default: all physical cores)
+RAG_ONNX_THREADS = int(os.getenv("RAG_ONNX_THREADS", "0"))
+RAG_ONNX_DIR = os.getenv("RAG_ONNX_DIR", "")
+RAG_ONNX_MAX_LENGTH = int(os.getenv("RAG_ONNX_MAX_LENGTH", "512"))
+
+# Same query instruction HuggingFaceEmbedding prepends for English bge models
+_BGE_QUERY_INSTRUCTION = "Represent this question for searching relevant passages: "
+
+# One ONNX Runtime session per (model file, threads), shared by every embedding instance
+_sessions: Dict[Tuple[str, int], Any] = {}
+_sessions_lock = threading.Lock()
+
+
+def onnx_dir(model_name: str) -> Path:
+    """Where the exported model and tokenizer live (RAG_ONNX_DIR or RAG/onnx_<model>)."""
+    if RAG_ONNX_DIR:
+        return Path(RAG_ONNX_DIR)
+    return Path(__file__).resolve().parent / f"onnx_{re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name)}"
+
+
+def export_onnx(model_name: str, out_dir: Path, quantize: bool) -> Path:
+    """Export `model_name` to out_dir/model.onnx (+ model.int8.onnx) with its tokenizer.json.
+
+    Needs torch and transformers; skipped for files that already exist.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    fp32 = out_dir / "model.onnx"
+    if not fp32.exists() or not (out_dir / "tokenizer.json").exists():
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        print(f"[AGENT DEBUG] Exporting {model_name} to ONNX: {fp32}")
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModel.from_pretrained(model_name).eval()
+        sample = tokenizer(["warm up"], return_tensors="pt")
+        tmp = out_dir / "model.onnx.tmp"
+
+        class _Encoder(torch.nn.Module):
+            # Keyword call: positional order of forward() differs across transformers versions
+            def __init__(self, inner):
+                super().__init__()
+                self.inner = inner
+
+            def forward(self, input_ids, attention_mask, token_type_ids):
+                return self.inner(input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids)[0]
+
+        with torch.no_grad():
+            torch.onnx.export(
+                _Encoder(model),
+                (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+                str(tmp),
+                input_names=["input_ids", "attention_mask", "token_type_ids"],
+                output_names=["last_hidden_state"],
+                dynamic_axes={
+                    name: {0: "batch", 1: "sequence"}
+                    for name in ("input_ids", "attention_mask", "token_type_ids", "last_hidden_state")
+                },
+                opset_version=17,
+                dynamo=False,
+            )
+        os.replace(tmp, fp32)
+        tokenizer.save_pretrained(str(out_dir))
+
+    if not quantize:
+        return fp32
+    int8 = out_dir / "model.int8.onnx"
+    if not int8.exists():
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        print(f"[AGENT DEBUG] Quantizing {fp32.name} to int8: {int8}")
+        tmp = out_dir / "model.int8.onnx.tmp"
+        quantize_dynamic(str(fp32), str(tmp), weight_type=QuantType.QInt8)
+        os.replace(tmp, int8)
+    return int8
+
+
+def _get_session(path: str, threads: int):
+    key = (path, threads)
+    session = _sessions.get(key)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(key)
+            if session is None:
+                import onnxruntime as ort
+
+                opts = ort.SessionOptions()
+                opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+                opts.inter_op_num_threads = 1
+                if threads > 0:
+                    opts.intra_op_num_threads = threads
+                session = ort.InferenceSession(path, sess_options=opts, providers=["CPUExecutionProvider"])
+                _sessions[key] = session
+                print(f"[AGENT DEBUG] ONNX embedding session: {path} (intra-op threads: {threads or 'default'})")
+    return session
+
+
+class OnnxEmbedding(BaseEmbedding):
+    """bge-style embeddings (CLS pooling, L2-normalized) from an ONNX Runtime session."""
+
+    quantize: bool = Field(default=False, description="Use the int8 dynamically quantized model.")
+    threads: int = Field(default=0, description="Intra-op threads (0 = ONNX Runtime default).")
+    max_length: int = Field(default=512, description="Tokens per text; longer input is truncated.")
+    query_instruction: str = Field(default="", description="Prepended to queries (bge retrieval instruction).")
+
+    _model_path: Optional[str] = PrivateAttr(default=None)
+    _tokenizer: Any = PrivateAttr(default=None)
+    _init_lock: Any = PrivateAttr(default=None)
+
+    def __init__(self, model_name: str, **kwargs: Any):
+        kwargs.setdefault("query_instruction", _BGE_QUERY_INSTRUCTION if "bge" in model_name and "-zh" not in model_name else "")
+        super().__init__(model_name=model_name, **kwargs)
+        self._init_lock = threading.Lock()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "OnnxEmbedding"
+
+    def _load(self):
+        # Export/load on first use so constructing the model (e.g. at import) stays cheap
+        if self._tokenizer is None:
+            with self._init_lock:
+                if self._tokenizer is None:
+                    from tokenizers import Tokenizer
+
+                    model_dir = onnx_dir(self.model_name)
+                    self._model_path = str(export_onnx(self.model_name, model_dir, self.quantize))
+                    tokenizer = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+                    tokenizer.enable_truncation(max_length=self.max_length)
+                    tokenizer.enable_padding()
+                    self._tokenizer = tokenizer
+        return _get_session(self._model_path, self.threads), self._tokenizer
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        session, tokenizer = self._load()
+        encodings = tokenizer.encode_batch(texts)
+        feed = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        wanted = {i.name for i in session.get_inputs()}
+        hidden = session.run(None, {k: v for k, v in feed.items() if k in wanted})[0]
+        cls = hidden[:, 0]
+        cls = cls / np.maximum(np.linalg.norm(cls, axis=1, keepdims=True), 1e-12)
+        return cls.astype(np.float32).tolist()
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed([f"{self.query_instruction} {query}".strip()])[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts)
+
+
+def build_embed_model(model_name: str, backend: Optional[str] = None) -> BaseEmbedding:
+    """Embedding model for `backend` ("torch" | "onnx"; default RAG_EMBED_BACKEND)."""
+    backend = (backend or RAG_EMBED_BACKEND).lower()
+    if backend == "onnx":
+        return OnnxEmbedding(
+            model_name,
+            quantize=RAG_ONNX_QUANTIZE,
+            threads=RAG_ONNX_THREADS,
+            max_length=RAG_ONNX_MAX_LENGTH,
+        )
+    if backend != "torch":
+        raise ValueError(f"Unknown RAG_EMBED_BACKEND {backend!r} (expected 'torch' or 'onnx')")
+    # Imported here so the onnx backend never loads torch
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+    return HuggingFaceEmbedding(model_name=model_name)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export an embedding model to ONNX (optionally int8).")
+    parser.add_argument("--model", default=os.getenv("RAG_EMBED_MODEL", "BAAI/bge-small-en-v1.5"))
+    parser.add_argument("--export", action="store_true", help="Export (and quantize) now")
+    parser.add_argument("--quantize", action="store_true", default=RAG_ONNX_QUANTIZE)
+    args = parser.parse_args()
+    if args.export:
+        print(f"✅ {export_onnx(args.model, onnx_dir(args.model), args.quantize)}")
+    else:
+        parser.print_help()
@@ -0,0 +1,180 @@
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import MetadataMode
+from loaders import load_file_docs
+
+# Producer/consumer ingestion:
+#   1) load + chunk files in a process pool (CPU bound, GIL free)
+#   2) embed chunks in fixed-size batches in the main process
+#   3) upsert embedded chunks to the vector store in large batches from a
+#      thread pool, with a bounded number of requests in flight
+# Stages overlap: chunks are embedded as soon as their file is chunked and
+# batches are upserted while the next batch is being embedded.
+
+# Metadata used for bookkeeping only; never embedded or shown to the LLM
+_BOOKKEEPING_KEYS = ["file_hash"]
+
+
+def configure_embed_threads(n: int, embed_model: Any = None) -> None:
+    """Limit intra-op threads used by the embedding runtime (0 = leave default)."""
+    if n <= 0:
+        return
+    os.environ["OMP_NUM_THREADS"] = str(n)
+    # ONNX Runtime sessions are created on first use with the model's thread count
+    if hasattr(embed_model, "threads"):
+        embed_model.threads = n
+        return
+    try:
+        import torch
+        torch.set_num_threads(n)
+    except ImportError:
+        pass
+
+
+def chunk_file(key: str, path: str, file_hash: str, chunk_size: int, chunk_overlap: int):
+    """Worker: load one file and split it into nodes. Runs in a child process."""
+    docs = load_file_docs(Path(path))
+    for d in docs:
+        d.metadata["file_hash"] = file_hash
+        d.excluded_embed_metadata_keys = list(d.excluded_embed_metadata_keys) + _BOOKKEEPING_KEYS
+        d.excluded_llm_metadata_keys = list(d.excluded_llm_metadata_keys) + _BOOKKEEPING_KEYS
+    splitter = SentenceSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    nodes = splitter.get_nodes_from_documents(docs)
+    return key, [d.id_ for d in docs], nodes, os.path.getsize(path)
+
+
+class _Upserter:
+    """Batches embedded nodes and upserts them with bounded concurrency."""
+
+    def __init__(self, vector_store, batch_size: int, max_in_flight: int):
+        self.vector_store = vector_store
+        self.batch_size = batch_size
+        self.max_in_flight = max(1, max_in_flight)
+        self.pool = ThreadPoolExecutor(max_workers=self.max_in_flight)
+        self.in_flight = set()
+        self.buffer: List[Any] = []
+        self.busy_sec = 0.0
+        self._lock = threading.Lock()
+        self._created = False
+
+    def add(self, nodes: List[Any]) -> None:
+        self.buffer.extend(nodes)
+        while len(self.buffer) >= self.batch_size:
+            batch, self.buffer = self.buffer[:self.batch_size], self.buffer[self.batch_size:]
+            self._submit(batch)
+
+    def _upsert(self, batch: List[Any]) -> None:
+        t0 = time.perf_counter()
+        self.vector_store.add(batch)
+        with self._lock:
+            self.busy_sec += time.perf_counter() - t0
+
+    def _submit(self, batch: List[Any]) -> None:
+        if not self._created:
+            # First batch runs inline so the collection is created exactly once
+            self._upsert(batch)
+            self._created = True
+            return
+        while len(self.in_flight) >= self.max_in_flight:
+            done, self.in_flight = wait(self.in_flight, return_when=FIRST_COMPLETED)
+            for f in done:
+                f.result()
+        self.in_flight.add(self.pool.submit(self._upsert, batch))
+
+    def close(self) -> None:
+        try:
+            if self.buffer:
+                self._submit(self.buffer)
+                self.buffer = []
+            for f in as_completed(self.in_flight):
+                f.result()
+            self.in_flight = set()
+        finally:
+            self.pool.shutdown(wait=True)
+
+
+def run_pipeline(
+    files: List[Tuple[str, Path, str]],
+    vector_store,
+    embed_model,
+    workers: int,
+    embed_batch_size: int,
+    upsert_batch_size: int,
+    max_in_flight: int,
+    chunk_size: int,
+    chunk_overlap: int,
+    node_sink: Optional[Callable[[List[Any]], None]] = None,
+) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Any]]:
+    """
+    Chunk, embed and upsert `files` ([(key, path, sha256)]).
+    `node_sink`, if given, also receives each file's chunks (e.g. the BM25 index).
+
+    Returns ({key: {"doc_ids": [...], "chunks": n}}, stats).
+    """
+    # llama-index splits each call into embed_model.embed_batch_size texts per encoder call;
+    # a smaller value there would silently cap the batches built below
+    model_batch = getattr(embed_model, "embed_batch_size", embed_batch_size)
+    if model_batch < embed_batch_size:
+        raise ValueError(
+            f"embed_model.embed_batch_size={model_batch} is smaller than embed_batch_size={embed_batch_size}; "
+            "set it on the model so the encoder receives full batches"
+        )
+    per_file: Dict[str, Dict[str, Any]] = {}
+    stats = {"files": len(files), "chunks": 0, "bytes": 0, "embed_sec": 0.0}
+    upserter = _Upserter(vector_store, upsert_batch_size, max_in_flight)
+    pending: List[Any] = []
+    t_start = time.perf_counter()
+
+    def embed(batch: List[Any]) -> None:
+        t0 = time.perf_counter()
+        texts = [n.get_content(metadata_mode=MetadataMode.EMBED) for n in batch]
+        for n, vec in zip(batch, embed_model.get_text_embedding_batch(texts)):
+            n.embedding = vec
+        stats["embed_sec"] += time.perf_counter() - t0
+        upserter.add(batch)
+
+    def consume(result) -> None:
+        key, doc_ids, nodes, nbytes = result
+        per_file[key] = {"doc_ids": doc_ids, "chunks": len(nodes)}
+        stats["chunks"] += len(nodes)
+        stats["bytes"] += nbytes
+        if node_sink is not None:
+            node_sink(nodes)
+        pending.extend(nodes)
+        while len(pending) >= embed_batch_size:
+            batch = pending[:embed_batch_size]
+            del pending[:embed_batch_size]
+            embed(batch)
+
+    args = [(key, str(path), h, chunk_size, chunk_overlap) for key, path, h in files]
+    try:
+        if workers <= 1 or len(files) <= 1:
+            for a in args:
+                consume(chunk_file(*a))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(chunk_file, *a) for a in args]
+                for fut in as_completed(futures):
+                    consume(fut.result())
+        if pending:
+            embed(pending[:])
+            pending.clear()
+    finally:
+        upserter.close()
+
+    wall = time.perf_counter() - t_start
+    stats.update({
+        "wall_sec": round(wall, 3),
+        "embed_sec": round(stats["embed_sec"], 3),
+        "upsert_sec": round(upserter.busy_sec, 3),
+        "chunks_per_sec": round(stats["chunks"] / wall, 1) if wall > 0 else 0.0,
+        "embed_chunks_per_sec": round(stats["chunks"] / stats["embed_sec"], 1) if stats["embed_sec"] > 0 else 0.0,
+        "mb_per_sec": round(stats["bytes"] / 1e6 / wall, 3) if wall > 0 else 0.0,
+    })
+    return per_file, stats
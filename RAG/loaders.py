@@ -0,0 +1,172 @@
+import hashlib
+import json
+import posixpath
+import tarfile
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from llama_index.core.schema import Document
+from llama_index.core.readers import SimpleDirectoryReader
+from llama_index.readers.json import JSONReader
+
+# Document loaders shared by build_rag.py and the ingestion worker processes.
+# Kept free of embedding-model setup so worker processes start cheaply.
+
+SKIP_JSON_NAMES = {"package-lock.json", "tsconfig.json"}
+# Duro project exports: tar archives holding config/config.json, version.json, a SQLite WAL, ...
+CONFIG_ARCHIVE_EXT = ".config"
+# macOS metadata that ends up in archives packed on a Mac
+SKIP_MEMBER_NAMES = {".DS_Store"}
+
+def load_text_docs(data_dir: Path, files: Optional[List[Path]] = None):
+    # SimpleDirectoryReader supports .md and many common types.  [oai_citation:2‡LlamaIndex](https://developers.llamaindex.ai/python/framework/module_guides/loading/simpledirectoryreader/?utm_source=chatgpt.com)
+    if files is not None:
+        if not files:
+            return []
+        return SimpleDirectoryReader(
+            input_files=[str(p) for p in files],
+            filename_as_id=True,
+        ).load_data()
+    return SimpleDirectoryReader(
+        input_dir=str(data_dir),
+        recursive=True,
+        required_exts=[".txt"],
+        filename_as_id=True,
+    ).load_data()
+
+def load_json_docs(data_dir: Path, files: Optional[List[Path]] = None):
+    # LlamaIndex recommends a JSON-specific loader for JSON.  [oai_citation:3‡LlamaIndex](https://developers.llamaindex.ai/python/framework/module_guides/loading/simpledirectoryreader/?utm_source=chatgpt.com)
+    reader = JSONReader(levels_back=2, collapse_length=200)
+    docs: list[Document] = []
+
+    for p in (files if files is not None else data_dir.rglob("*.json")):
+        # Skip obvious noise/secrets if needed
+        if p.name.lower() in SKIP_JSON_NAMES:
+            continue
+
+        json_docs = reader.load_data(input_file=str(p))
+        for i, d in enumerate(json_docs):
+            # Stable ids so a changed/removed file's points can be deleted later
+            d.id_ = f"{p}#{i}"
+            # Helpful metadata for filtering later
+            d.metadata = {
+                **(d.metadata or {}),
+                "path": str(p),
+                "doc_type": "hmi_config",
+                "ext": ".json",
+            }
+        docs.extend(json_docs)
+
+    return docs
+
+def tag_text_docs(text_docs) -> None:
+    # Tag text docs too and ensure path metadata is present for attribution
+    for d in text_docs:
+        existing_meta = d.metadata or {}
+        # SimpleDirectoryReader typically provides file_path; keep it if present
+        path = existing_meta.get("file_path") or existing_meta.get("filename") or existing_meta.get("id") or None
+        d.metadata = {
+            **existing_meta,
+            "doc_type": "docs",
+            "ext": ".txt",
+            # normalized path key used by server for source formatting
+            **({"path": path} if path else {}),
+        }
+
+def _flatten_json(data: Any, levels_back: int, collapse_length: int, path: List[str]) -> Iterator[str]:
+    """One line per leaf, prefixed by up to `levels_back` parent keys; small subtrees stay one JSON line.
+
+    Same text load_json_docs gets from JSONReader(levels_back=2, collapse_length=200),
+    for JSON that is already in memory (the reader only takes file paths).
+    """
+    prefix = path[-levels_back:] if levels_back else path
+    if isinstance(data, (dict, list)):
+        dumped = json.dumps(data, ensure_ascii=False)
+        if len(dumped) <= collapse_length:
+            yield " ".join(prefix + [dumped])
+        elif isinstance(data, dict):
+            for key, value in data.items():
+                yield from _flatten_json(value, levels_back, collapse_length, path + [key])
+        else:
+            for value in data:
+                yield from _flatten_json(value, levels_back, collapse_length, path)
+    else:
+        yield " ".join(prefix + [str(data)])
+
+def _skip_member(member: tarfile.TarInfo) -> bool:
+    name = posixpath.basename(member.name)
+    return not member.isfile() or name.startswith("._") or name in SKIP_MEMBER_NAMES
+
+def load_config_archive_docs(path: Path):
+    """Index config/config.json of a Duro .config archive, tagged with its version.json.
+
+    Members are streamed ("r|*") and read in memory; nothing is extracted to disk.
+    """
+    config = version = None
+    with tarfile.open(path, mode="r|*") as tar:
+        for member in tar:
+            if _skip_member(member):
+                continue
+            name = "/" + posixpath.normpath(member.name)
+            if name.endswith("/config/config.json"):
+                config = json.load(tar.extractfile(member))
+            elif name.endswith("/config/version.json"):
+                version = json.load(tar.extractfile(member))
+    if config is None:
+        print(f"[AGENT DEBUG] {path}: no config/config.json member, skipped")
+        return []
+
+    version = version or {}
+    version_str = ".".join(str(version.get(k, 0)) for k in ("version_major", "version_minor", "version_release"))
+    lines = _flatten_json(config, 2, 200, [])
+    doc = Document(
+        text="\n".join(lines),
+        id_=f"{path}#config.json",
+        metadata={
+            "path": str(path),
+            "member": "config/config.json",
+            "doc_type": "hmi_config",
+            "ext": CONFIG_ARCHIVE_EXT,
+            "config_version": version_str,
+        },
+    )
+    return [doc]
+
+# --------------------
+# File discovery / hashing
+# --------------------
+
+def scan_files(data_dir: Path) -> Dict[str, Path]:
+    """All indexable files under data_dir, keyed by resolved path string."""
+    files: Dict[str, Path] = {}
+    for p in sorted(data_dir.rglob("*")):
+        if not p.is_file():
+            continue
+        if p.name.startswith("._"):
+            continue
+        if p.suffix in (".txt", CONFIG_ARCHIVE_EXT) or (p.suffix == ".json" and p.name.lower() not in SKIP_JSON_NAMES):
+            files[str(p.resolve())] = p
+    return files
+
+def scan_config_archives(config_dir: Path) -> Dict[str, Path]:
+    """Only the .config archives under config_dir (loose JSON there is not indexed)."""
+    return {key: p for key, p in scan_files(config_dir).items() if p.suffix == CONFIG_ARCHIVE_EXT}
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def load_file_docs(path: Path):
+    """Load the documents of a single indexable file (text, JSON or .config archive)."""
+    if path.suffix == ".txt":
+        docs = load_text_docs(path.parent, [path])
+        tag_text_docs(docs)
+        return docs
+    if path.suffix == ".json":
+        return load_json_docs(path.parent, [path])
+    if path.suffix == CONFIG_ARCHIVE_EXT:
+        return load_config_archive_docs(path)
+    return []
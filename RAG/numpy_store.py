@@ -0,0 +1,300 @@
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from llama_index.core.schema import NodeRelationship, NodeWithScore, QueryBundle, RelatedNodeInfo, TextNode
+
+# Embedded, Qdrant-free vector store for small corpora (a few thousand chunks).
+#
+# On-disk layout (one directory per collection):
+#   store.json   - format version, dtype, dim, row count
+#   vectors.npy  - (rows, dim) unit-normalized embeddings: float32, float16 or int8
+#   scales.npy   - (rows,) float32 per-row dequantization scale (int8 only)
+#   nodes.jsonl  - one line per row: id, ref_doc_id, text, metadata
+#
+# Readers memory-map vectors.npy (no copy, pages shared between workers) and
+# score with a blocked matrix-vector product; top-k is exact.
+
+FORMAT_VERSION = 1
+DTYPES = ("float32", "float16", "int8")
+# Metadata keys that can be used in query filters
+FILTER_KEYS = ("doc_type", "ext")
+# Rows scored per block so int8/float16 upcasts stay small
+_BLOCK_ROWS = 16384
+
+
+def _unit_rows(vecs: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vecs / norms
+
+
+def _quantize(vecs: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Unit float32 rows -> stored rows (+ per-row scales for int8)."""
+    if dtype == "float32":
+        return vecs.astype(np.float32), None
+    if dtype == "float16":
+        return vecs.astype(np.float16), None
+    scales = np.abs(vecs).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    q = np.clip(np.rint(vecs / scales[:, None]), -127, 127).astype(np.int8)
+    return q, scales.astype(np.float32)
+
+
+def _filter_items(filters: Any) -> List[Tuple[str, Any]]:
+    """Accept {key: value} or LlamaIndex MetadataFilters (exact-match only)."""
+    if not filters:
+        return []
+    if isinstance(filters, dict):
+        return list(filters.items())
+    items = []
+    for f in getattr(filters, "filters", []):
+        op = str(getattr(f, "operator", "=="))
+        if op not in ("==", "FilterOperator.EQ"):
+            raise ValueError(f"Unsupported filter operator for numpy store: {op}")
+        items.append((f.key, f.value))
+    return items
+
+
+class NumpyVectorStore:
+    """
+    In-process vector store: embedding matrix + node sidecar in one directory.
+
+    Writers (build_rag.py) use add()/delete()/persist(); readers (RAG service)
+    use query() over a memory-mapped matrix and reload_if_changed().
+    """
+
+    def __init__(self, path: str, dtype: str = "float32", mmap: bool = True):
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {DTYPES}, got {dtype!r}")
+        self.path = Path(path)
+        self.dtype = dtype
+        self.mmap = mmap
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self._nodes: List[Dict[str, Any]] = []
+        self._codes: Dict[str, np.ndarray] = {}
+        self._signature: Optional[Tuple[int, int]] = None
+        self.load()
+
+    # --------------------
+    # Loading
+    # --------------------
+
+    def _current_signature(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path / "store.json")
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def load(self) -> None:
+        """(Re)load the store from disk; an absent store loads as empty."""
+        signature = self._current_signature()
+        vectors = scales = None
+        nodes: List[Dict[str, Any]] = []
+        if signature is not None:
+            with open(self.path / "store.json", "r", encoding="utf-8") as f:
+                info = json.load(f)
+            if info.get("version") != FORMAT_VERSION:
+                raise ValueError(f"Unsupported numpy store version {info.get('version')} at {self.path}")
+            # Incremental writes keep the existing on-disk precision
+            self.dtype = info["dtype"]
+            mode = "r" if self.mmap else None
+            vectors = np.load(self.path / "vectors.npy", mmap_mode=mode)
+            if self.dtype == "int8":
+                scales = np.load(self.path / "scales.npy", mmap_mode=mode)
+            with open(self.path / "nodes.jsonl", "r", encoding="utf-8") as f:
+                nodes = [json.loads(line) for line in f if line.strip()]
+            if len(nodes) != vectors.shape[0]:
+                raise ValueError(f"Numpy store at {self.path} is inconsistent: "
+                                 f"{vectors.shape[0]} vectors, {len(nodes)} nodes")
+        with self._lock:
+            self._vectors, self._scales, self._nodes = vectors, scales, nodes
+            self._codes = self._build_codes(nodes)
+            self._signature = signature
+
+    @staticmethod
+    def _build_codes(nodes: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+        """Per filter key, an object array of row values for vectorized masks."""
+        return {
+            key: np.array([(n.get("metadata") or {}).get(key) for n in nodes], dtype=object)
+            for key in FILTER_KEYS
+        }
+
+    def reload_if_changed(self) -> bool:
+        """Reload when build_rag.py has rewritten the store. Returns True on reload."""
+        if self._current_signature() == self._signature:
+            return False
+        self.load()
+        return True
+
+    @property
+    def count(self) -> int:
+        return len(self._nodes)
+
+    # --------------------
+    # Writing (build_rag.py)
+    # --------------------
+
+    def add(self, nodes: List[Any]) -> List[str]:
+        """Append embedded nodes (node.embedding must be set)."""
+        if not nodes:
+            return []
+        vecs = _unit_rows(np.asarray([n.get_embedding() for n in nodes], dtype=np.float32))
+        q, scales = _quantize(vecs, self.dtype)
+        records = [
+            {
+                "id": n.node_id,
+                "ref_doc_id": n.ref_doc_id,
+                "text": n.get_content(),
+                "metadata": n.metadata or {},
+                "excluded_llm_metadata_keys": list(n.excluded_llm_metadata_keys),
+            }
+            for n in nodes
+        ]
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[0] == 0:
+                self._vectors, self._scales = q, scales
+            else:
+                if self._vectors.shape[1] != q.shape[1]:
+                    raise ValueError(f"Embedding dim {q.shape[1]} != store dim {self._vectors.shape[1]}")
+                self._vectors = np.concatenate([self._vectors, q])
+                if scales is not None:
+                    self._scales = np.concatenate([self._scales, scales])
+            self._nodes.extend(records)
+            self._codes = self._build_codes(self._nodes)
+        return [r["id"] for r in records]
+
+    def clear(self, dtype: Optional[str] = None) -> None:
+        """Drop every row (in memory until persist()), optionally switching the stored dtype."""
+        if dtype is not None and dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {DTYPES}, got {dtype!r}")
+        with self._lock:
+            self._vectors = self._scales = None
+            self._nodes = []
+            self._codes = self._build_codes(self._nodes)
+            if dtype is not None:
+                self.dtype = dtype
+
+    def delete(self, ref_doc_id: str) -> None:
+        """Drop every row that came from source document `ref_doc_id`."""
+        with self._lock:
+            keep = [i for i, n in enumerate(self._nodes) if n.get("ref_doc_id") != ref_doc_id]
+            if len(keep) == len(self._nodes):
+                return
+            idx = np.asarray(keep, dtype=np.int64)
+            self._vectors = self._vectors[idx]
+            if self._scales is not None:
+                self._scales = self._scales[idx]
+            self._nodes = [self._nodes[i] for i in keep]
+            self._codes = self._build_codes(self._nodes)
+
+    def persist(self) -> None:
+        """Atomically write the store; store.json goes last so readers see whole files."""
+        self.path.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            vectors = self._vectors if self._vectors is not None else np.zeros((0, 0), dtype=self.dtype)
+            files = {"vectors.npy": vectors}
+            if self.dtype == "int8":
+                files["scales.npy"] = self._scales if self._scales is not None else np.zeros(0, dtype=np.float32)
+            for name, arr in files.items():
+                tmp = self.path / (name + ".tmp")
+                with open(tmp, "wb") as f:
+                    np.save(f, np.ascontiguousarray(arr))
+                os.replace(tmp, self.path / name)
+
+            tmp = self.path / "nodes.jsonl.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                for n in self._nodes:
+                    f.write(json.dumps(n, ensure_ascii=False) + "\n")
+            os.replace(tmp, self.path / "nodes.jsonl")
+
+            info = {
+                "version": FORMAT_VERSION,
+                "dtype": self.dtype,
+                "dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+                "count": len(self._nodes),
+            }
+            tmp = self.path / "store.json.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(info, f, indent=2)
+            os.replace(tmp, self.path / "store.json")
+
+    # --------------------
+    # Querying (RAG service)
+    # --------------------
+
+    def _scores(self, query: np.ndarray) -> np.ndarray:
+        vectors, scales = self._vectors, self._scales
+        out = np.empty(vectors.shape[0], dtype=np.float32)
+        for start in range(0, vectors.shape[0], _BLOCK_ROWS):
+            block = vectors[start:start + _BLOCK_ROWS]
+            if block.dtype != np.float32:
+                block = block.astype(np.float32)
+            out[start:start + len(block)] = block @ query
+        if scales is not None:
+            out *= scales
+        return out
+
+    def query(self, embedding: List[float], top_k: int, filters: Any = None) -> List[NodeWithScore]:
+        """Exact cosine top-k, optionally restricted by exact-match metadata filters."""
+        with self._lock:
+            if self._vectors is None or not self._nodes:
+                return []
+            q = np.asarray(embedding, dtype=np.float32)
+            norm = float(np.linalg.norm(q))
+            if norm > 0:
+                q = q / norm
+            scores = self._scores(q)
+
+            items = _filter_items(filters)
+            if items:
+                mask = np.ones(len(scores), dtype=bool)
+                for key, value in items:
+                    if key not in self._codes:
+                        raise ValueError(f"Filtering on {key!r} is not supported; use one of {FILTER_KEYS}")
+                    mask &= self._codes[key] == value
+                scores[~mask] = -np.inf
+                k = min(top_k, int(mask.sum()))
+            else:
+                k = min(top_k, len(scores))
+            if k <= 0:
+                return []
+
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [NodeWithScore(node=self._to_node(int(i)), score=float(scores[i])) for i in top]
+
+    def _to_node(self, row: int) -> TextNode:
+        rec = self._nodes[row]
+        node = TextNode(
+            id_=rec["id"],
+            text=rec["text"],
+            metadata=rec.get("metadata") or {},
+            excluded_llm_metadata_keys=rec.get("excluded_llm_metadata_keys") or [],
+        )
+        if rec.get("ref_doc_id"):
+            node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(node_id=rec["ref_doc_id"])
+        return node
+
+    def as_retriever(self, similarity_top_k: int, filters: Any = None) -> "NumpyRetriever":
+        return NumpyRetriever(self, similarity_top_k, filters)
+
+
+class NumpyRetriever:
+    """Minimal stand-in for a LlamaIndex retriever over a NumpyVectorStore."""
+
+    def __init__(self, store: NumpyVectorStore, similarity_top_k: int, filters: Any = None):
+        self.store = store
+        self.similarity_top_k = similarity_top_k
+        self.filters = filters
+
+    def retrieve(self, bundle: QueryBundle) -> List[NodeWithScore]:
+        if bundle.embedding is None:
+            raise ValueError("NumpyRetriever needs a precomputed query embedding")
+        return self.store.query(bundle.embedding, self.similarity_top_k, self.filters)
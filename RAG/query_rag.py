@@ -3,10 +3,10 @@ import qdrant_client
 
 # ✅ Set LlamaIndex Settings first
 from llama_index.core import Settings
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from embed_backend import build_embed_model
 from llama_index.llms.mlx import MLXLLM
 
-Settings.embed_model = HuggingFaceEmbedding(model_name="BAAI/bge-small-en-v1.5")
+Settings.embed_model = build_embed_model(os.getenv("RAG_EMBED_MODEL", "BAAI/bge-small-en-v1.5"))
 Settings.llm = MLXLLM(model_name="mlx-community/Meta-Llama-3.1-8B-Instruct-4bit")
 
 # ✅ Now import the rest
@@ -0,0 +1,188 @@
+import os
+import re
+import threading
+from typing import Dict, List, Set, Tuple
+
+# Headings that start a section:
+#   "# HMI LABEL COMPONENT ..."                 (markdown-style titles)
+#   "-----\nCOMPONENT: label\n-----"            (ruled titles)
+#   "View Object Schema", "Label component (default values)", "Tag Object (Text)"
+_MD_HEADING = re.compile(r"^#{1,6}\s+(?P<title>.+?)\s*$", re.MULTILINE)
+_RULED_HEADING = re.compile(r"^-{10,}[ \t]*\n(?P<title>[^\n]+?)[ \t]*\n-{10,}[ \t]*$", re.MULTILINE)
+_NAMED_HEADING = re.compile(
+    r"^(?P<title>(?:[A-Za-z][^\n:{}\"\[\],.]{0,70}?)?\b(?:[Cc]omponents?|[Ss]chema|[Oo]bject)\b[^\n:{}\",.]{0,40}?):?[ \t]*$",
+    re.MULTILINE,
+)
+# Longer lines matching _NAMED_HEADING are prose, not headings
+_MAX_HEADING_WORDS = 8
+_CAMEL = re.compile(r"(?<=[a-z])(?=[A-Z])")
+_WORD = re.compile(r"[A-Za-z][A-Za-z0-9_]*")
+
+# canonical keyword -> phrases that mean the same thing in a prompt
+_SYNONYMS: Dict[str, List[str]] = {
+    "label": ["label", "lbl", "caption"],
+    "button": ["button", "btn", "pushbutton", "push button"],
+    "numericinput": ["numericinput", "numeric input", "number input", "numeric field", "numeric", "ninput", "numinput"],
+    "keyboard": ["keyboard", "keypad", "keybd", "numpad"],
+    "view": ["view", "screen", "page"],
+    "nested": ["nested", "subview", "sub view", "embedded", "embed", "nvw"],
+    "tag": ["tag", "variable", "database", "datatype"],
+    "general": ["general", "viewstree", "views tree", "navigation", "menu"],
+}
+_ALIASES: Dict[str, str] = {
+    phrase: canon for canon, phrases in _SYNONYMS.items() for phrase in phrases
+}
+
+# Words that appear in headings but carry no topic on their own
+_STOPWORDS = {
+    "a", "an", "and", "for", "in", "of", "the", "to", "with",
+    "component", "schema", "object", "field", "default", "value", "core",
+    "propertie", "minimal", "reference", "configuration", "duro", "controller",
+    "hmi", "text", "number", "json", "format", "example",
+}
+
+
+def _stem(word: str) -> str:
+    word = word.lower()
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        word = word[:-1]
+    return word
+
+
+def _keywords(text: str) -> Set[str]:
+    """Canonical keywords for a piece of text (heading title or prompt)."""
+    words: List[str] = []
+    for raw in _WORD.findall(text):
+        words.append(_stem(raw))
+        # camelCase identifiers also count by their parts (numericInput -> numeric, input)
+        parts = _CAMEL.split(raw)
+        if len(parts) > 1:
+            words.extend(_stem(p) for p in parts)
+
+    found: Set[str] = set()
+    for i, w in enumerate(words):
+        if i + 1 < len(words):
+            pair = _ALIASES.get(f"{w} {words[i + 1]}")
+            if pair:
+                found.add(pair)
+        canon = _ALIASES.get(w, w)
+        if canon not in _STOPWORDS:
+            found.add(canon)
+    return found
+
+
+class Section:
+    __slots__ = ("order", "path", "title", "text", "keywords")
+
+    def __init__(self, order: int, path: str, title: str, text: str):
+        self.order = order
+        self.path = path
+        self.title = title
+        self.text = text
+        self.keywords = _keywords(title)
+
+
+def _split_sections(path: str, text: str, order_start: int, max_chars: int) -> List[Section]:
+    ruled: List[Tuple[int, int, str]] = [
+        (m.start(), m.end(), m.group("title").strip()) for m in _RULED_HEADING.finditer(text)
+    ]
+    headings: List[Tuple[int, str]] = [(start, title) for start, _, title in ruled]
+    headings += [(m.start(), m.group("title").strip()) for m in _MD_HEADING.finditer(text)]
+    for m in _NAMED_HEADING.finditer(text):
+        # Skip titles already captured as part of a ruled heading
+        if any(start <= m.start() < end for start, end, _ in ruled):
+            continue
+        if len(m.group("title").split()) > _MAX_HEADING_WORDS:
+            continue
+        headings.append((m.start(), m.group("title").strip()))
+    headings.sort()
+
+    sections: List[Section] = []
+    for i, (start, title) in enumerate(headings):
+        end = headings[i + 1][0] if i + 1 < len(headings) else len(text)
+        body = text[start:end].strip()[:max_chars]
+        sections.append(Section(order_start + len(sections), path, title, body))
+    return sections
+
+
+class SectionIndex:
+    """
+    Heading-delimited sections of the HMI reference docs plus an inverted
+    index keyword -> sections. Built once; rebuilt only when a file's
+    mtime changes (or files are added/removed).
+    """
+
+    def __init__(self, paths: List[str], max_chars: int = 1000):
+        self.paths = paths
+        self.max_chars = max_chars
+        self.sections: List[Section] = []
+        self.index: Dict[str, List[Section]] = {}
+        self._mtimes: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        # Bumped on every rebuild so callers can cache derived text
+        self.version = 0
+
+    def _current_mtimes(self) -> Dict[str, float]:
+        mtimes: Dict[str, float] = {}
+        for p in self._files():
+            try:
+                mtimes[p] = os.stat(p).st_mtime
+            except OSError:
+                continue
+        return mtimes
+
+    def _files(self) -> List[str]:
+        files: List[str] = []
+        for p in self.paths:
+            if os.path.isdir(p):
+                files += sorted(
+                    os.path.join(p, name) for name in os.listdir(p) if name.endswith(".txt")
+                )
+            elif os.path.isfile(p):
+                files.append(p)
+        # Keep first occurrence so an explicitly listed file keeps its priority
+        return list(dict.fromkeys(files))
+
+    def refresh(self) -> bool:
+        """Rebuild if any source file changed. Returns True when rebuilt."""
+        mtimes = self._current_mtimes()
+        if mtimes == self._mtimes:
+            return False
+        with self._lock:
+            if mtimes == self._mtimes:
+                return False
+            sections: List[Section] = []
+            for path in mtimes:
+                try:
+                    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                        text = f.read()
+                except OSError:
+                    continue
+                sections += _split_sections(path, text, len(sections), self.max_chars)
+
+            index: Dict[str, List[Section]] = {}
+            for s in sections:
+                for kw in s.keywords:
+                    index.setdefault(kw, []).append(s)
+            self.sections, self.index, self._mtimes = sections, index, mtimes
+            self.version += 1
+            return True
+
+    def lookup(self, query: str, max_sections: int) -> List[Section]:
+        """Best section per prompt keyword, most relevant first."""
+        wanted = _keywords(query or "")
+        candidates: Dict[int, Tuple[int, Section]] = {}
+        for kw in wanted:
+            for s in self.index.get(kw, ()):
+                hits = candidates.get(s.order, (0, s))[0]
+                candidates[s.order] = (hits + 1, s)
+        if not candidates:
+            return []
+
+        # For each keyword pick the section that matches the most prompt keywords,
+        # then the most specific title (fewest keywords), then document order.
+        def rank(s: Section):
+            return (-candidates[s.order][0], len(s.keywords), s.order)
+
+        best = {min(self.index[kw], key=rank) for kw in wanted if kw in self.index}
+        return sorted(best, key=rank)[:max_sections]
@@ -1,24 +1,110 @@
-from typing import List, Optional
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import hashlib
 import os
+import threading
+import time
 import qdrant_client
 
 # LlamaIndex settings and imports
 from llama_index.core import Settings, VectorStoreIndex
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.vector_stores import ExactMatchFilter, MetadataFilters
 from llama_index.vector_stores.qdrant import QdrantVectorStore
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from RAG.bm25_index import BM25Index
+from RAG.embed_backend import RAG_EMBED_BACKEND, build_embed_model
+from RAG.context_packer import Candidate, pack, tokenizer_name
+from RAG.numpy_store import NumpyVectorStore
+from RAG.section_index import SectionIndex
+from utils.metrics import record_stage, span
 
 # --------------------
 # RAG (Qdrant + LlamaIndex) config
 # --------------------
 RAG_ENABLED = os.getenv("RAG_ENABLED", "1") == "1"
+# "qdrant" (server) or "numpy" (embedded store written by build_rag.py --backend numpy)
+RAG_BACKEND = os.getenv("RAG_BACKEND", "qdrant")
 RAG_QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
 RAG_COLLECTION = os.getenv("RAG_COLLECTION", "durusai_docs")
 RAG_TOP_K = int(os.getenv("RAG_TOP_K", "15"))
-RAG_MAX_CHARS = int(os.getenv("RAG_MAX_CHARS", "3500"))
+# Token budget for the whole context block (retrieved chunks + fallback sections)
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "1800"))
+# MMR trade-off: 1.0 = relevance only, 0.0 = diversity only
+RAG_MMR_LAMBDA = float(os.getenv("RAG_MMR_LAMBDA", "0.7"))
+RAG_NUMPY_DIR = os.getenv(
+    "RAG_NUMPY_DIR",
+    os.path.join(os.path.dirname(__file__), f"vector_store_{RAG_COLLECTION}"),
+)
+RAG_EMBED_MODEL = os.getenv("RAG_EMBED_MODEL", "BAAI/bge-small-en-v1.5")
+# "vector" (dense only) or "hybrid" (dense + BM25, fused by reciprocal rank)
+RAG_RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "vector")
+RAG_BM25_PATH = os.getenv(
+    "RAG_BM25_PATH",
+    os.path.join(os.path.dirname(__file__), f"bm25_{RAG_COLLECTION}.json"),
+)
+# Hybrid: candidates taken from each retriever, fused results kept, RRF constant
+RAG_HYBRID_CANDIDATES = int(os.getenv("RAG_HYBRID_CANDIDATES", "20"))
+RAG_HYBRID_TOP_K = int(os.getenv("RAG_HYBRID_TOP_K", "8"))
+RAG_RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+# Bounded LRU caches for query embeddings and retrieval results
+RAG_EMBED_CACHE_SIZE = int(os.getenv("RAG_EMBED_CACHE_SIZE", "512"))
+RAG_RESULT_CACHE_SIZE = int(os.getenv("RAG_RESULT_CACHE_SIZE", "512"))
+# How often (seconds) to check the vector store for changes
+RAG_CACHE_CHECK_SEC = float(os.getenv("RAG_CACHE_CHECK_SEC", "30"))
+# Per-file content hashes written by build_rag.py; part of the change signature, so
+# re-indexing that keeps the point count still invalidates the caches
+RAG_MANIFEST_PATH = os.getenv(
+    "RAG_MANIFEST_PATH",
+    os.path.join(os.path.dirname(__file__), f"rag_manifest_{RAG_COLLECTION}.json"),
+)
+# A failed init (Qdrant down, model download failed) is retried after a backoff
+# that doubles per consecutive failure, up to the max
+RAG_INIT_RETRY_SEC = float(os.getenv("RAG_INIT_RETRY_SEC", "5"))
+RAG_INIT_RETRY_MAX_SEC = float(os.getenv("RAG_INIT_RETRY_MAX_SEC", "300"))
+# Query used to warm the embedding model and retriever at startup
+RAG_WARMUP_QUERY = os.getenv("RAG_WARMUP_QUERY", "label button view tag")
 
 # Lazy-initialized RAG objects
-_rag_index: Optional[VectorStoreIndex] = None
+_rag_index: Optional[Any] = None  # VectorStoreIndex, or NumpyVectorStore
 _rag_init_error: Optional[str] = None
+_rag_init_failures = 0
+_rag_retry_at = 0.0  # monotonic time before which a failed init is not retried
+_rag_init_lock = threading.Lock()
+_embed_model: Optional[BaseEmbedding] = None
+_embed_lock = threading.Lock()
+_rag_client: Optional[qdrant_client.QdrantClient] = None
+# Long-lived retrievers over _rag_index, one per (top_k, filters); rebuilt on reconnect
+_retrievers: "OrderedDict[Tuple[int, str], Any]" = OrderedDict()
+_RETRIEVER_CACHE_SIZE = 16
+_bm25_index: Optional[BM25Index] = None
+_bm25_mtime: Optional[float] = None
+_bm25_lock = threading.Lock()
+
+# query -> embedding, and (embedding, top_k, filters) -> [(node_id, score)]
+_query_embed_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+_result_cache: "OrderedDict[Tuple[str, int, str], List[Tuple[str, Optional[float]]]]" = OrderedDict()
+_node_store: Dict[str, Any] = {}
+_cache_lock = threading.Lock()
+_collection_signature: Optional[Tuple[Any, ...]] = None
+_collection_checked_at = 0.0
+
+# Per-stage timings (ms) for the last request plus running totals
+RAG_STATS: Dict[str, Any] = {
+    "requests": 0,
+    "embed_cache_hits": 0,
+    "result_cache_hits": 0,
+    "invalidations": 0,
+    "last": {},
+    "packing": {},
+    "total_ms": {"embed": 0.0, "search": 0.0, "format": 0.0},
+    # Hybrid mode: per retriever, queries served, queries where it contributed
+    # to the fused top-k ("hits"), results returned and latency
+    "retrievers": {
+        name: {"queries": 0, "hits": 0, "results": 0, "last_ms": 0.0, "total_ms": 0.0}
+        for name in ("vector", "bm25")
+    },
+}
 
 # Path to HMI layout/reference doc (used for keyword fallback)
 # Default relative to project root, not this file's folder.
@@ -27,45 +113,141 @@ HMI_DOC_PATH = os.getenv(
     "HMI_DOC_PATH",
     os.path.join(_PROJECT_ROOT, "ai_reference", "hmi_config_layout_description.txt"),
 )
+# Extra doc folders scanned for *Component / *Schema sections (comma separated)
+FALLBACK_DOC_DIRS = [
+    p if os.path.isabs(p) else os.path.join(_PROJECT_ROOT, p)
+    for p in os.getenv("FALLBACK_DOC_DIRS", "ai_reference,docs_for_ai_training_0_1_0").split(",")
+    if p.strip()
+]
+FALLBACK_MAX_SECTIONS = int(os.getenv("FALLBACK_MAX_SECTIONS", "4"))
+FALLBACK_SECTION_MAX_CHARS = int(os.getenv("FALLBACK_SECTION_MAX_CHARS", "1000"))
+
+# Core component schemas sent in the static prompt prefix (prefix-reuse mode)
+STATIC_REFERENCE_QUERY = os.getenv(
+    "STATIC_REFERENCE_QUERY", "label button numericInput keyboard nested view tag general"
+)
+STATIC_REFERENCE_MAX_SECTIONS = int(os.getenv("STATIC_REFERENCE_MAX_SECTIONS", "8"))
 
+# HMI_DOC_PATH first so its sections win ties, then the doc folders
+_section_index = SectionIndex([HMI_DOC_PATH] + FALLBACK_DOC_DIRS, FALLBACK_SECTION_MAX_CHARS)
+_static_reference: Tuple[int, str] = (0, "")
 
-def _init_rag_index() -> Optional[VectorStoreIndex]:
-    """Initialize a VectorStoreIndex view over an existing Qdrant collection.
 
-    This does NOT build the index; it just connects to the already-built collection.
+def get_embed_model() -> BaseEmbedding:
+    """Return the process-wide bge-small embedding model (loaded once).
+
+    Shared by RAG retrieval and the semantic prompt cache. RAG_EMBED_BACKEND
+    selects PyTorch or ONNX Runtime (see RAG/embed_backend.py).
     """
-    global _rag_index, _rag_init_error
+    global _embed_model
+
+    if _embed_model is None:
+        with _embed_lock:
+            if _embed_model is None:
+                _embed_model = build_embed_model(RAG_EMBED_MODEL)
+    return _embed_model
 
+
+def _init_rag_index() -> Optional[Any]:
+    """Initialize a VectorStoreIndex view over an existing Qdrant collection,
+    or memory-map the embedded numpy store when RAG_BACKEND=numpy.
+
+    This does NOT build the index; it just connects to the already-built collection.
+    A failure is retried on a later call once the backoff has passed.
+    """
     if _rag_index is not None:
         return _rag_index
-    if _rag_init_error is not None:
-        return None
-
     if not RAG_ENABLED:
-        _rag_init_error = "RAG disabled via RAG_ENABLED=0"
         return None
+    if _rag_init_error is not None and time.monotonic() < _rag_retry_at:
+        return None
+
+    with _rag_init_lock:
+        if _rag_index is not None:
+            return _rag_index
+        if _rag_init_error is not None and time.monotonic() < _rag_retry_at:
+            return None
+        return _connect_rag_index()
+
+
+def _connect_rag_index() -> Optional[Any]:
+    global _rag_index, _rag_init_error, _rag_init_failures, _rag_retry_at, _rag_client
 
     try:
         # Ensure we use local embeddings (no OpenAI dependency)
-        Settings.embed_model = HuggingFaceEmbedding(model_name="BAAI/bge-small-en-v1.5")
+        Settings.embed_model = get_embed_model()
+
+        if RAG_BACKEND == "numpy":
+            store = NumpyVectorStore(RAG_NUMPY_DIR)
+            if store.count == 0:
+                raise RuntimeError(f"numpy vector store at {RAG_NUMPY_DIR} is empty or missing")
+            with _cache_lock:
+                _retrievers.clear()
+            _rag_index = store
+            _rag_init_error, _rag_init_failures = None, 0
+            return _rag_index
 
         client = qdrant_client.QdrantClient(url=RAG_QDRANT_URL)
         vector_store = QdrantVectorStore(client=client, collection_name=RAG_COLLECTION)
 
         # Re-hydrate an index view over the existing vector store
-        _rag_index = VectorStoreIndex.from_vector_store(vector_store)
+        index = VectorStoreIndex.from_vector_store(vector_store)
+        _rag_client = client
+        with _cache_lock:
+            _retrievers.clear()
+        _rag_index = index
+        _rag_init_error, _rag_init_failures = None, 0
         return _rag_index
     except Exception as e:
-        _rag_init_error = str(e)
+        _rag_init_failures += 1
+        backoff = min(RAG_INIT_RETRY_SEC * 2 ** (_rag_init_failures - 1), RAG_INIT_RETRY_MAX_SEC)
+        _rag_retry_at = time.monotonic() + backoff
+        _rag_init_error = str(e) or type(e).__name__
+        print(f"[AGENT DEBUG] RAG init failed ({_rag_init_failures}x), retrying in {backoff:g}s: {_rag_init_error}")
         return None
 
 
-def _format_rag_context(nodes) -> str:
-    """Turn retrieved nodes into a compact, source-attributed context block."""
-    parts: List[str] = []
-    total = 0
+def rag_init_state() -> Dict[str, Any]:
+    """Whether the retriever is connected, plus the last init error and retry schedule."""
+    if not RAG_ENABLED:
+        return {"state": "disabled"}
+    if _rag_index is not None:
+        return {"state": "ready"}
+    if _rag_init_error is None:
+        return {"state": "pending"}
+    return {
+        "state": "failed",
+        "error": _rag_init_error,
+        "failures": _rag_init_failures,
+        "retry_in_sec": round(max(0.0, _rag_retry_at - time.monotonic()), 1),
+    }
+
+
+def warm_up_rag() -> Dict[str, Any]:
+    """Load the embedding model, connect the retriever and run one dummy query.
+
+    Called at startup so the first request does not pay for torch/model loading.
+    Returns rag_init_state() afterwards.
+    """
+    if RAG_ENABLED and _init_rag_index() is not None:
+        t0 = time.perf_counter()
+        get_rag_context(RAG_WARMUP_QUERY)
+        print(f"[AGENT DEBUG] RAG warm-up query: {(time.perf_counter() - t0) * 1000:.0f} ms")
+    return rag_init_state()
+
 
-    for i, n in enumerate(nodes, 1):
+def _format_rag_context(nodes, sections=()) -> str:
+    """Pack retrieved nodes (and keyword fallback sections) into a compact,
+    source-attributed context block within RAG_CONTEXT_TOKENS.
+
+    Fallback sections are packed first so retrieved chunks repeating them are
+    trimmed or dropped; the rest are chosen by MMR and never cut mid-chunk.
+    """
+    candidates: List[Candidate] = [
+        Candidate(("fallback", s.order), f"[Fallback] {s.title} path={s.path}", s.text, 1.0, pinned=True)
+        for s in sections
+    ]
+    for rank, n in enumerate(nodes):
         try:
             score = getattr(n, "score", None)
             node = getattr(n, "node", None)
@@ -74,98 +256,331 @@ def _format_rag_context(nodes) -> str:
             text = node.get_content() if node is not None else ""
         except Exception:
             continue
+        if not text.strip():
+            continue
+        header = f"score={score:.3f} path={path}" if score is not None else f"path={path}"
+        # Without scores, rank order is the relevance
+        relevance = score if score is not None else -float(rank)
+        candidates.append(Candidate(("rag", rank), header, text, relevance))
+
+    packed, stats = pack(candidates, RAG_CONTEXT_TOKENS, RAG_MMR_LAMBDA)
+    with _cache_lock:
+        RAG_STATS["packing"] = stats
+
+    rag_parts = [
+        f"[Source {i}] {c.header}\n{text}"
+        for i, (c, text) in enumerate((p for p in packed if not p[0].pinned), 1)
+    ]
+    fallback_parts = [f"{c.header}\n{text}" for c, text in packed if c.pinned]
+    parts = rag_parts
+    if fallback_parts:
+        parts = rag_parts + ["[Source fallback]\n" + "\n---\n".join(fallback_parts)]
+    return "\n---\n".join(parts).strip()
 
-        header = f"[Source {i}] score={score:.3f} path={path}" if score is not None else f"[Source {i}] path={path}"
-        block = header + "\n" + text.strip() + "\n"
 
-        if total + len(block) > RAG_MAX_CHARS:
-            remaining = max(0, RAG_MAX_CHARS - total)
-            if remaining > 0:
-                parts.append(block[:remaining])
-            break
+def invalidate_rag_cache() -> None:
+    """Drop cached query embeddings and retrieval results."""
+    with _cache_lock:
+        _query_embed_cache.clear()
+        _result_cache.clear()
+        _node_store.clear()
+        RAG_STATS["invalidations"] += 1
 
-        parts.append(block)
-        total += len(block)
 
-    return "\n---\n".join(parts).strip()
+def _file_digest(path: str) -> Optional[str]:
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
 
 
-def get_rag_context(query: str) -> str:
-    """Retrieve relevant chunks for a query from Qdrant and return a compact context string."""
+def _check_collection_changed() -> None:
+    """Invalidate caches when the vector store's contents change.
+
+    Polled at most every RAG_CACHE_CHECK_SEC so the check stays off the hot path.
+    """
+    global _collection_signature, _collection_checked_at
+
+    now = time.time()
+    if now - _collection_checked_at < RAG_CACHE_CHECK_SEC:
+        return
+    _collection_checked_at = now
+    if isinstance(_rag_index, NumpyVectorStore):
+        try:
+            if _rag_index.reload_if_changed():
+                invalidate_rag_cache()
+        except Exception as e:
+            print("[AGENT DEBUG] numpy store reload failed:", e)
+        return
+    if _rag_client is None:
+        return
+    try:
+        info = _rag_client.get_collection(RAG_COLLECTION)
+        # Counts alone miss updates that keep the number of points; the manifest
+        # hash changes whenever build_rag.py re-indexes changed content
+        signature = (info.points_count, getattr(info, "indexed_vectors_count", None), _file_digest(RAG_MANIFEST_PATH))
+    except Exception:
+        return
+    if _collection_signature is not None and signature != _collection_signature:
+        invalidate_rag_cache()
+    _collection_signature = signature
+
+
+def _lru_get(cache: OrderedDict, key):
+    with _cache_lock:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+
+def _lru_put(cache: OrderedDict, key, value, max_size: int) -> None:
+    with _cache_lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > max_size:
+            cache.popitem(last=False)
+
+
+def embed_query(query: str) -> List[float]:
+    """Query embedding (LRU cached); main.py reuses it for the semantic cache and retrieval."""
+    cached = _lru_get(_query_embed_cache, query)
+    if cached is not None:
+        with _cache_lock:
+            RAG_STATS["embed_cache_hits"] += 1
+        return cached
+    vec = get_embed_model().get_query_embedding(query)
+    _lru_put(_query_embed_cache, query, vec, RAG_EMBED_CACHE_SIZE)
+    return vec
+
+
+def _metadata_filters(filters: Optional[Dict[str, str]]) -> Optional[MetadataFilters]:
+    if not filters:
+        return None
+    return MetadataFilters(filters=[ExactMatchFilter(key=k, value=v) for k, v in sorted(filters.items())])
+
+
+def _get_retriever(top_k: int, filters: Optional[Dict[str, str]] = None):
+    """Retriever for (top_k, filters), built once and reused across requests."""
+    key = (top_k, repr(sorted((filters or {}).items())))
+    retriever = _lru_get(_retrievers, key)
+    if retriever is None:
+        retriever = _rag_index.as_retriever(similarity_top_k=top_k, filters=_metadata_filters(filters))
+        _lru_put(_retrievers, key, retriever, _RETRIEVER_CACHE_SIZE)
+    return retriever
+
+
+def _retrieve_nodes(query: str, embedding: List[float], top_k: int, filters: Optional[Dict[str, str]] = None) -> List[NodeWithScore]:
+    digest = hashlib.sha1(repr(embedding).encode("utf-8")).hexdigest()
+    key = (digest, top_k, repr(sorted((filters or {}).items())))
+    cached = _lru_get(_result_cache, key)
+    if cached is not None:
+        with _cache_lock:
+            nodes = [NodeWithScore(node=_node_store[nid], score=score) for nid, score in cached if nid in _node_store]
+            hit = len(nodes) == len(cached)
+            if hit:
+                RAG_STATS["result_cache_hits"] += 1
+        if hit:
+            return nodes
+
+    nodes = _get_retriever(top_k, filters).retrieve(QueryBundle(query_str=query, embedding=embedding))
+    with _cache_lock:
+        for n in nodes:
+            _node_store[n.node.node_id] = n.node
+    _lru_put(_result_cache, key, [(n.node.node_id, n.score) for n in nodes], RAG_RESULT_CACHE_SIZE)
+    return nodes
+
+
+def _get_bm25_index() -> Optional[BM25Index]:
+    """Load the BM25 sidecar written by build_rag.py once; reload if it changes."""
+    global _bm25_index, _bm25_mtime
+
+    try:
+        mtime = os.stat(RAG_BM25_PATH).st_mtime
+    except OSError:
+        return _bm25_index
+    if _bm25_index is not None and mtime == _bm25_mtime:
+        return _bm25_index
+    with _bm25_lock:
+        if _bm25_index is None or mtime != _bm25_mtime:
+            try:
+                _bm25_index = BM25Index.load(RAG_BM25_PATH)
+                _bm25_mtime = mtime
+                print(f"[AGENT DEBUG] BM25 index loaded: {len(_bm25_index)} chunks")
+            except Exception as e:
+                print("[AGENT DEBUG] BM25 index load failed:", e)
+    return _bm25_index
+
+
+def _record_retriever(name: str, ms: float, results: int) -> None:
+    with _cache_lock:
+        st = RAG_STATS["retrievers"][name]
+        st["queries"] += 1
+        st["results"] += results
+        st["last_ms"] = round(ms, 2)
+        st["total_ms"] = round(st["total_ms"] + ms, 2)
+
+
+def _fuse_rrf(ranked_lists: Dict[str, List[NodeWithScore]], top_k: int) -> List[NodeWithScore]:
+    """Reciprocal rank fusion: score = sum over retrievers of 1 / (RAG_RRF_K + rank)."""
+    fused: Dict[str, float] = {}
+    nodes: Dict[str, Any] = {}
+    sources: Dict[str, set] = {}
+    for name, ranked in ranked_lists.items():
+        for rank, n in enumerate(ranked, 1):
+            nid = n.node.node_id
+            fused[nid] = fused.get(nid, 0.0) + 1.0 / (RAG_RRF_K + rank)
+            nodes.setdefault(nid, n.node)
+            sources.setdefault(nid, set()).add(name)
+
+    top = sorted(fused, key=fused.get, reverse=True)[:top_k]
+    with _cache_lock:
+        for name in ranked_lists:
+            if any(name in sources[nid] for nid in top):
+                RAG_STATS["retrievers"][name]["hits"] += 1
+    return [NodeWithScore(node=nodes[nid], score=fused[nid]) for nid in top]
+
+
+def _retrieve_hybrid(query: str, embedding: Optional[List[float]], bm25: Optional[BM25Index],
+                     filters: Optional[Dict[str, str]] = None) -> List[NodeWithScore]:
+    ranked: Dict[str, List[NodeWithScore]] = {}
+    if embedding is not None:
+        t0 = time.perf_counter()
+        ranked["vector"] = _retrieve_nodes(query, embedding, RAG_HYBRID_CANDIDATES, filters)
+        _record_retriever("vector", (time.perf_counter() - t0) * 1000, len(ranked["vector"]))
+    if bm25 is not None:
+        t0 = time.perf_counter()
+        ranked["bm25"] = bm25.search(query, RAG_HYBRID_CANDIDATES, filters)
+        _record_retriever("bm25", (time.perf_counter() - t0) * 1000, len(ranked["bm25"]))
+    return _fuse_rrf(ranked, RAG_HYBRID_TOP_K)
+
+
+def get_rag_stats() -> Dict[str, Any]:
+    """Cache hit counters and per-stage timings for RAG retrieval."""
+    with _cache_lock:
+        sizes = {
+            "embed_cache_size": len(_query_embed_cache),
+            "result_cache_size": len(_result_cache),
+        }
+        stats = {**RAG_STATS, "total_ms": dict(RAG_STATS["total_ms"]),
+                 "retrievers": {name: dict(st) for name, st in RAG_STATS["retrievers"].items()}}
+    retrievers = {}
+    for name, st in stats["retrievers"].items():
+        q = st["queries"]
+        retrievers[name] = {
+            **st,
+            "hit_rate": round(st["hits"] / q, 4) if q else 0.0,
+            "avg_ms": round(st["total_ms"] / q, 2) if q else 0.0,
+        }
+    store = {"backend": RAG_BACKEND, "embed_backend": RAG_EMBED_BACKEND, "retrieval_mode": RAG_RETRIEVAL_MODE, "tokenizer": tokenizer_name()}
+    if _bm25_index is not None:
+        store["bm25_chunks"] = len(_bm25_index)
+    if isinstance(_rag_index, NumpyVectorStore):
+        store.update({"count": _rag_index.count, "dtype": _rag_index.dtype, "path": RAG_NUMPY_DIR})
+    return {**stats, **sizes, "retrievers": retrievers, "store": store, "init": rag_init_state()}
+
+
+def get_rag_context(
+    query: str,
+    filters: Optional[Dict[str, str]] = None,
+    include_fallback: bool = False,
+    embedding: Optional[List[float]] = None,
+) -> str:
+    """Retrieve relevant chunks for a query and return a compact context string.
+
+    `filters` restricts retrieval by exact metadata match, e.g. {"doc_type": "docs"}
+    or {"ext": ".json"}. With `include_fallback`, keyword fallback sections are
+    packed into the same token budget (see _get_keyword_fallback_context).
+    `embedding` is the query's embed_query() vector when the caller already has it.
+    """
+    if include_fallback:
+        with span("rag_fallback"):
+            sections = _fallback_sections(query)
+    else:
+        sections = []
     index = _init_rag_index()
-    if index is None:
-        return ""
+    hybrid = RAG_ENABLED and RAG_RETRIEVAL_MODE == "hybrid"
+    bm25 = _get_bm25_index() if hybrid else None
+    # In hybrid mode BM25 alone still serves when the vector store is unavailable
+    if index is None and not bm25:
+        return _format_rag_context([], sections) if sections else ""
 
     try:
-        retriever = index.as_retriever(similarity_top_k=RAG_TOP_K)
-        nodes = retriever.retrieve(query)
-        return _format_rag_context(nodes)
+        _check_collection_changed()
+        t0 = time.perf_counter()
+        if index is None:
+            embedding = None
+        elif embedding is None:
+            embedding = embed_query(query)
+        t1 = time.perf_counter()
+        if hybrid:
+            nodes = _retrieve_hybrid(query, embedding, bm25, filters)
+        else:
+            nodes = _retrieve_nodes(query, embedding, RAG_TOP_K, filters)
+        t2 = time.perf_counter()
+        context = _format_rag_context(nodes, sections)
+        t3 = time.perf_counter()
     except Exception:
-        # Don't fail the request if RAG fails; just return empty context.
-        return ""
+        # Don't fail the request if RAG fails; fall back to the local sections only.
+        return _format_rag_context([], sections) if sections else ""
+
+    timings = {
+        "embed": (t1 - t0) * 1000,
+        "search": (t2 - t1) * 1000,
+        "format": (t3 - t2) * 1000,
+    }
+    last = {k: round(v, 2) for k, v in timings.items()}
+    with _cache_lock:
+        RAG_STATS["requests"] += 1
+        RAG_STATS["last"] = last
+        for k, v in timings.items():
+            RAG_STATS["total_ms"][k] = round(RAG_STATS["total_ms"][k] + v, 2)
+    for k, v in timings.items():
+        record_stage(f"rag_{k}", v / 1000)
+    print("[AGENT DEBUG] RAG timings (ms):", last)
+    return context
+
+
+def refresh_section_index() -> bool:
+    """(Re)build the keyword fallback section index if any source file changed."""
+    return _section_index.refresh()
+
+
+def _fallback_sections(query: str) -> list:
+    try:
+        refresh_section_index()
+        return _section_index.lookup(query, FALLBACK_MAX_SECTIONS)
+    except Exception:
+        return []
+
+
+def get_static_reference() -> str:
+    """Core component schemas in a fixed order, byte-identical until the docs change."""
+    global _static_reference
+
+    refresh_section_index()
+    version = _section_index.version
+    if _static_reference[0] != version:
+        sections = sorted(
+            _section_index.lookup(STATIC_REFERENCE_QUERY, STATIC_REFERENCE_MAX_SECTIONS),
+            key=lambda s: s.order,
+        )
+        text = "\n---\n".join(f"[Reference] {s.title} path={os.path.basename(s.path)}\n{s.text}" for s in sections)
+        _static_reference = (version, text)
+    return _static_reference[1]
 
 
 def _get_keyword_fallback_context(query: str) -> str:
-    """If the prompt contains key HMI terms (label/button/view), inject
-    the corresponding sections from the local HMI layout doc as a fallback.
+    """If the prompt mentions known HMI topics (label, button, numericInput,
+    keyboard, nested view, tags, ...), inject the matching sections from the
+    local reference docs as a fallback.
 
     This ensures core component schemas are present even if vector retrieval
-    misses or scores borderline.
+    misses or scores borderline. Sections come from a prebuilt index, so a
+    lookup costs O(prompt tokens) plus one stat() per source file.
     """
-    try:
-        q = (query or "").lower()
-        want_label = "label" in q
-        want_button = "button" in q
-        want_view = "view" in q
-
-        if not (want_label or want_button or want_view):
-            return ""
-
-        if not os.path.exists(HMI_DOC_PATH):
-            return ""
-
-        with open(HMI_DOC_PATH, "r", encoding="utf-8", errors="ignore") as f:
-            text = f.read()
-
-        # Heuristic section extraction: find headings and slice until next heading
-        import re
-        # Collect all potential headings to determine boundaries
-        heading_pattern = re.compile(r"^\s*(?:[A-Z][A-Za-z\s]+(?:Component|Schema))\b.*$", re.MULTILINE)
-        headings = list(heading_pattern.finditer(text))
-
-        def extract_section(title_keywords: List[str]) -> Optional[str]:
-            if not title_keywords:
-                return None
-            # Find start by matching any keyword set in a heading line
-            for i, m in enumerate(headings):
-                line = m.group(0).lower()
-                if all(k in line for k in title_keywords):
-                    start = m.start()
-                    # Next heading boundary or end of file
-                    end = headings[i + 1].start() if (i + 1) < len(headings) else len(text)
-                    section = text[start:end].strip()
-                    # Bound section length to avoid overly long context
-                    return section[:1000]
-            return None
-
-        parts: List[str] = []
-        if want_view:
-            s = extract_section(["view", "schema"]) or extract_section(["view"])
-            if s:
-                parts.append("[Fallback] View Schema\n" + s)
-        if want_label:
-            s = extract_section(["label", "component"]) or extract_section(["label"])
-            if s:
-                parts.append("[Fallback] Label Component\n" + s)
-        if want_button:
-            s = extract_section(["button", "component"]) or extract_section(["button"])
-            if s:
-                parts.append("[Fallback] Button Component\n" + s)
-
-        if not parts:
-            return ""
-
-        header = f"[Source fallback] path={HMI_DOC_PATH}"
-        return header + "\n" + ("\n---\n".join(parts))
-    except Exception:
+    sections = _fallback_sections(query)
+    if not sections:
         return ""
+    return _format_rag_context([], sections)
@@ -0,0 +1,155 @@
+"""
+Check that the ONNX embedding backend retrieves the same chunks as the torch one.
+
+Chunks the RAG corpus exactly like build_rag.py and embeds chunks and queries
+with the torch backend and ONNX Runtime (fp32 and, with --quantize, int8).
+Then it compares the top-k chunks per query. Reports rank overlap@k, top-1
+agreement, query vector cosine, embedding speed and process RSS. Exits 1 if
+an ONNX variant's mean overlap is below --min-overlap.
+
+Usage (from RAG/):
+    python verify_embeddings.py
+    python verify_embeddings.py --quantize --top-k 10 --min-overlap 0.9 --output verify.json
+"""
+import argparse
+import glob
+import json
+import os
+import resource
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+from llama_index.core.schema import MetadataMode
+
+from embed_backend import build_embed_model
+from ingest_pipeline import chunk_file
+from loaders import file_sha256, scan_files
+
+DATA_DIR = Path(os.environ.get("RAG_DATA_DIR", "../ai_reference"))
+EMBED_MODEL = os.getenv("RAG_EMBED_MODEL", "BAAI/bge-small-en-v1.5")
+# User prompts of the training conversations serve as realistic queries
+QUERY_SOURCES = ["../training/train.jsonl", "../durusai_training_lora/*.jsonl"]
+
+
+def load_corpus(data_dir: Path, chunk_size: int, chunk_overlap: int) -> List[str]:
+    texts: List[str] = []
+    for key, path in scan_files(data_dir).items():
+        _, _, nodes, _ = chunk_file(key, str(path), file_sha256(path), chunk_size, chunk_overlap)
+        texts += [n.get_content(metadata_mode=MetadataMode.EMBED) for n in nodes]
+    return texts
+
+
+def load_queries(patterns: List[str], limit: int) -> List[str]:
+    queries: List[str] = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        messages = json.loads(line).get("messages") or []
+                    except (ValueError, AttributeError):
+                        continue
+                    user = next((m.get("content") for m in messages if m.get("role") == "user"), None)
+                    if isinstance(user, str):
+                        user = user[5:].strip() if user.startswith("Task:") else user.strip()
+                        if user and user not in queries:
+                            queries.append(user)
+    return queries[:limit]
+
+
+def rss_mb() -> float:
+    # Peak resident set size of this process (Linux: KiB, macOS: bytes)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if os.uname().sysname == "Darwin" else 1024), 1)
+
+
+def embed_all(name: str, model, corpus: List[str], queries: List[str], batch_size: int) -> Dict[str, Any]:
+    model.embed_batch_size = batch_size  # otherwise llama-index re-splits into batches of 10
+    model.get_query_embedding("warm up")  # load/export outside the timings
+    t0 = time.perf_counter()
+    docs = []
+    for i in range(0, len(corpus), batch_size):
+        docs += model.get_text_embedding_batch(corpus[i:i + batch_size])
+    t1 = time.perf_counter()
+    qs = [model.get_query_embedding(q) for q in queries]
+    t2 = time.perf_counter()
+    return {
+        "name": name,
+        "docs": np.asarray(docs, dtype=np.float32),
+        "queries": np.asarray(qs, dtype=np.float32),
+        "ingest_chunks_per_sec": round(len(corpus) / (t1 - t0), 1) if t1 > t0 else None,
+        "query_ms": round((t2 - t1) * 1000 / max(1, len(queries)), 2),
+        "peak_rss_mb": rss_mb(),
+    }
+
+
+def top_k(run: Dict[str, Any], k: int) -> np.ndarray:
+    scores = run["queries"] @ run["docs"].T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def compare(reference: Dict[str, Any], candidate: Dict[str, Any], k: int) -> Dict[str, Any]:
+    ref, cand = top_k(reference, k), top_k(candidate, k)
+    overlaps = [len(set(a) & set(b)) / k for a, b in zip(ref, cand)]
+    cos = np.sum(reference["queries"] * candidate["queries"], axis=1)
+    return {
+        "overlap_at_k": round(float(np.mean(overlaps)), 4),
+        "min_overlap_at_k": round(float(np.min(overlaps)), 4),
+        "top1_agreement": round(float(np.mean(ref[:, 0] == cand[:, 0])), 4),
+        "query_cosine_mean": round(float(np.mean(cos)), 5),
+        "query_cosine_min": round(float(np.min(cos)), 5),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare ONNX Runtime embeddings with the torch backend.")
+    parser.add_argument("--model", default=EMBED_MODEL)
+    parser.add_argument("--data-dir", type=Path, default=DATA_DIR)
+    parser.add_argument("--queries", action="append", help="JSONL conversations to take user prompts from (repeatable)")
+    parser.add_argument("--max-queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--quantize", action="store_true", help="Also check the int8 quantized model")
+    parser.add_argument("--threads", type=int, default=0, help="ONNX intra-op threads (0 = default)")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--min-overlap", type=float, default=0.9, help="Fail below this mean overlap@k")
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.data_dir, 800, 120)
+    queries = load_queries(args.queries or QUERY_SOURCES, args.max_queries)
+    if not corpus or not queries:
+        raise SystemExit(f"Need chunks and queries (got {len(corpus)} chunks, {len(queries)} queries)")
+    k = min(args.top_k, len(corpus))
+    print(f"{len(corpus)} chunks from {args.data_dir}, {len(queries)} queries, top-{k}")
+
+    # ONNX first, so its peak RSS is measured before torch is loaded
+    runs = []
+    for name, quantize in [("onnx", False)] + ([("onnx_int8", True)] if args.quantize else []):
+        model = build_embed_model(args.model, "onnx")
+        model.quantize = quantize
+        model.threads = args.threads
+        runs.append(embed_all(name, model, corpus, queries, args.batch_size))
+    reference = embed_all("torch", build_embed_model(args.model, "torch"), corpus, queries, args.batch_size)
+
+    report: Dict[str, Any] = {"model": args.model, "chunks": len(corpus), "queries": len(queries), "top_k": k, "backends": {}}
+    failed = False
+    for run in [reference] + runs:
+        info = {key: run[key] for key in ("ingest_chunks_per_sec", "query_ms", "peak_rss_mb")}
+        if run is not reference:
+            info.update(compare(reference, run, k))
+            failed |= info["overlap_at_k"] < args.min_overlap
+        report["backends"][run["name"]] = info
+        print(f"{run['name']:<10} " + "  ".join(f"{key}={value}" for key, value in info.items()))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if failed:
+        raise SystemExit(f"❌ ONNX retrieval overlap@{k} below {args.min_overlap}")
+    print(f"✅ ONNX retrieval matches torch (overlap@{k} >= {args.min_overlap})")
+
+
+if __name__ == "__main__":
+    main()
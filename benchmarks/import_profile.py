@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Import-time and startup profile of the server.
+- Runs `python -X importtime -c "import main"` in a fresh interpreter and lists the
+  slowest imports (cumulative and self time).
+- With --ready, also starts uvicorn and measures process start -> /health/live and
+  -> /health/ready, plus the server's own import/ready timings from /health/ready.
+
+Usage:
+    python benchmarks/import_profile.py
+    python benchmarks/import_profile.py --top 30 --ready --output benchmarks/results/startup.json
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Dict, List, Optional
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# "import time:       self [us] |  cumulative | imported package"
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def profile_imports(module: str) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BASE_DIR, capture_output=True, text=True,
+    )
+    wall = time.perf_counter() - t0
+    if proc.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{proc.stderr[-2000:]}")
+
+    entries: List[Dict[str, Any]] = []
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            entries.append({
+                "module": m.group(4),
+                "self_ms": int(m.group(1)) / 1000,
+                "cumulative_ms": int(m.group(2)) / 1000,
+                "depth": len(m.group(3)) // 2,
+            })
+    top_level = [e for e in entries if e["depth"] == 0]
+    return {
+        "module": module,
+        "wall_sec": round(wall, 3),
+        "imports_ms": round(sum(e["cumulative_ms"] for e in top_level), 1),
+        "modules": len(entries),
+        "entries": entries,
+    }
+
+
+def _get(url: str) -> Optional[int]:
+    try:
+        with urllib.request.urlopen(url, timeout=2) as r:
+            return r.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return None
+
+
+def profile_startup(port: int, timeout: float) -> Dict[str, Any]:
+    base = f"http://127.0.0.1:{port}"
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BASE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    live = ready = None
+    try:
+        while time.perf_counter() - t0 < timeout:
+            if live is None and _get(base + "/health/live") == 200:
+                live = time.perf_counter() - t0
+            if live is not None and _get(base + "/health/ready") == 200:
+                ready = time.perf_counter() - t0
+                break
+            time.sleep(0.1)
+        server: Dict[str, Any] = {}
+        try:
+            with urllib.request.urlopen(base + "/health/ready", timeout=2) as r:
+                server = json.load(r)
+        except urllib.error.HTTPError as e:
+            server = json.load(e)
+        except OSError:
+            pass
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+    return {
+        "process_to_live_sec": round(live, 3) if live is not None else None,
+        "process_to_ready_sec": round(ready, 3) if ready is not None else None,
+        "server": server,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile server import time and startup-to-ready time.")
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--top", type=int, default=20, help="Slowest imports to list")
+    parser.add_argument("--ready", action="store_true", help="Also start uvicorn and time /health/live and /health/ready")
+    parser.add_argument("--port", type=int, default=9102)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--output", help="Write the results as JSON")
+    args = parser.parse_args()
+
+    result = profile_imports(args.module)
+    print(f"import {args.module}: {result['imports_ms']:.0f} ms in imports, {result['modules']} modules, "
+          f"{result['wall_sec']:.2f}s interpreter wall time")
+    print(f"\n{'cumulative ms':>14} {'self ms':>9}  module")
+    for e in sorted(result["entries"], key=lambda e: e["cumulative_ms"], reverse=True)[:args.top]:
+        print(f"{e['cumulative_ms']:>14.1f} {e['self_ms']:>9.1f}  {'  ' * e['depth']}{e['module']}")
+
+    if args.ready:
+        result["startup"] = profile_startup(args.port, args.timeout)
+        s = result["startup"]
+        print(f"\nprocess -> live: {s['process_to_live_sec']}s, process -> ready: {s['process_to_ready_sec']}s")
+        for name, step in (s["server"].get("steps") or {}).items():
+            print(f"  warm-up {name:<15} {step}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        result["entries"] = sorted(result["entries"], key=lambda e: e["cumulative_ms"], reverse=True)[:args.top]
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Load/latency benchmark for /agent/build_view against the replaying stub LLM.
+- Starts benchmarks/stub_llm.py and a uvicorn server pointed at it (or uses --server/--stub-url).
+- Sends prompts from training/train.jsonl and archive/v0.0.1.0/test_examples.md (or --prompts)
+  at each concurrency level.
+- Reports throughput and p50/p95/p99 of the client latency and of every server stage
+  (from the Server-Timing header), and writes the results as JSON for comparing commits.
+
+Usage:
+    python benchmarks/run_benchmark.py
+    python benchmarks/run_benchmark.py --concurrency 1,4,16 --requests 100 --tokens-per-sec 40
+    python benchmarks/run_benchmark.py --compare benchmarks/results/<previous>.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_PROMPTS = [
+    os.path.join(BASE_DIR, "training", "train.jsonl"),
+    os.path.join(BASE_DIR, "archive", "v0.0.1.0", "test_examples.md"),
+]
+DEFAULT_RESULTS_DIR = os.path.join(BASE_DIR, "benchmarks", "results")
+_JSON_BLOCK = re.compile(r"```json\s*\n(.*?)\n```", re.S)
+_PROMPT_FIELD = re.compile(r'"prompt"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+# ---- prompts ----
+
+def _request_from(rec: Any) -> Optional[Dict[str, Any]]:
+    """AgentRequest body from a recorded request or a training conversation."""
+    if not isinstance(rec, dict):
+        return None
+    if isinstance(rec.get("prompt"), str):
+        body = {"device_id": rec.get("device_id") or "bench", "prompt": rec["prompt"]}
+        if isinstance(rec.get("context"), dict):
+            body["context"] = rec["context"]
+        return body
+    if isinstance(rec.get("messages"), list):
+        user = next((m.get("content") for m in rec["messages"] if m.get("role") == "user"), None)
+        if isinstance(user, str) and user.strip():
+            prompt = user[5:].strip() if user.startswith("Task:") else user
+            return {"device_id": "bench", "prompt": prompt}
+    return None
+
+
+def load_prompts(paths: List[str]) -> List[Dict[str, Any]]:
+    """Request bodies from .jsonl files (one request/conversation per line) and .md examples."""
+    bodies: List[Dict[str, Any]] = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        if path.endswith(".md"):
+            for block in _JSON_BLOCK.findall(text):
+                try:
+                    body = _request_from(json.loads(block))
+                except ValueError:
+                    m = _PROMPT_FIELD.search(block)
+                    body = {"device_id": "bench", "prompt": json.loads(f'"{m.group(1)}"')} if m else None
+                if body:
+                    bodies.append(body)
+            continue
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            try:
+                body = _request_from(json.loads(line))
+            except ValueError:
+                continue
+            if body:
+                bodies.append(body)
+    return bodies
+
+
+# ---- stats ----
+
+def percentile(values: List[float], p: float) -> float:
+    """Linear-interpolated percentile (p in 0..100)."""
+    if not values:
+        return 0.0
+    s = sorted(values)
+    k = (len(s) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(s) - 1)
+    return s[lo] + (s[hi] - s[lo]) * (k - lo)
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 2) if values else 0.0,
+        "p50": round(percentile(values, 50), 2),
+        "p95": round(percentile(values, 95), 2),
+        "p99": round(percentile(values, 99), 2),
+    }
+
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    """'stage;dur=12.3, other;dur=4' -> {"stage": 12.3, "other": 4.0} (ms)."""
+    out: Dict[str, float] = {}
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        m = re.search(r"dur=([0-9.]+)", params)
+        if name and m:
+            out[name] = float(m.group(1))
+    return out
+
+
+# ---- load generation ----
+
+async def _one(session: aiohttp.ClientSession, url: str, body: Dict[str, Any], stream: bool) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    try:
+        async with session.post(url, json=body) as resp:
+            payload = await resp.read()
+            status = resp.status
+            timing = parse_server_timing(resp.headers.get("Server-Timing", ""))
+            # The stream route reports generation errors in-band with HTTP 200
+            if stream and status == 200 and b'"event":"error"' in payload:
+                status = 599
+    except aiohttp.ClientError as e:
+        return {"status": 0, "latency_ms": (time.perf_counter() - t0) * 1000, "stages": {}, "error": str(e)}
+    return {"status": status, "latency_ms": (time.perf_counter() - t0) * 1000, "stages": timing}
+
+
+async def run_level(server: str, bodies: List[Dict[str, Any]], concurrency: int, total: int, stream: bool, timeout: float) -> Dict[str, Any]:
+    url = server.rstrip("/") + ("/agent/build_view/stream" if stream else "/agent/build_view")
+    queue: "asyncio.Queue[int]" = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(i)
+    results: List[Dict[str, Any]] = []
+
+    async def worker(session: aiohttp.ClientSession):
+        while True:
+            try:
+                i = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            results.append(await _one(session, url, bodies[i % len(bodies)], stream))
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        wall = time.perf_counter() - t0
+
+    ok = [r for r in results if r["status"] == 200]
+    statuses: Dict[str, int] = {}
+    for r in results:
+        statuses[str(r["status"])] = statuses.get(str(r["status"]), 0) + 1
+    stage_values: Dict[str, List[float]] = {}
+    for r in ok:
+        for stage, ms in r["stages"].items():
+            stage_values.setdefault(stage, []).append(ms)
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "ok": len(ok),
+        "errors": total - len(ok),
+        "status_counts": statuses,
+        "wall_sec": round(wall, 3),
+        "throughput_rps": round(len(ok) / wall, 3) if wall else 0.0,
+        "latency_ms": summarize([r["latency_ms"] for r in ok]),
+        "stages_ms": {stage: summarize(v) for stage, v in sorted(stage_values.items())},
+    }
+
+
+# ---- processes ----
+
+async def _wait_ready(url: str, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(url, timeout=aiohttp.ClientTimeout(total=2)) as r:
+                    if r.status == 200:
+                        return
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{url} did not become ready within {timeout:.0f}s")
+            await asyncio.sleep(0.25)
+
+
+def _start(cmd: List[str], env: Dict[str, str], log_path: str) -> subprocess.Popen:
+    log = open(log_path, "w", encoding="utf-8")
+    return subprocess.Popen(cmd, cwd=BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def _git_commit() -> Dict[str, Any]:
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=BASE_DIR, capture_output=True, text=True).stdout.strip()
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def print_report(result: Dict[str, Any], baseline: Optional[Dict[str, Any]]) -> None:
+    base_levels = {lvl["concurrency"]: lvl for lvl in (baseline or {}).get("levels", [])}
+    for lvl in result["levels"]:
+        lat = lvl["latency_ms"]
+        print(f"\nconcurrency={lvl['concurrency']}  ok={lvl['ok']}/{lvl['requests']}  "
+              f"throughput={lvl['throughput_rps']} req/s  latency p50={lat['p50']} p95={lat['p95']} p99={lat['p99']} ms")
+        base = base_levels.get(lvl["concurrency"])
+        if base:
+            def delta(new, old):
+                return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+            print(f"  vs baseline: throughput {delta(lvl['throughput_rps'], base['throughput_rps'])}, "
+                  f"p50 {delta(lat['p50'], base['latency_ms']['p50'])}, p95 {delta(lat['p95'], base['latency_ms']['p95'])}")
+        for stage, s in lvl["stages_ms"].items():
+            line = f"  {stage:<16} p50={s['p50']:>9} p95={s['p95']:>9} p99={s['p99']:>9} ms  (n={s['count']})"
+            old = (base or {}).get("stages_ms", {}).get(stage)
+            if old and old["p50"]:
+                line += f"  p50 {(s['p50'] - old['p50']) / old['p50'] * 100:+.1f}%"
+            print(line)
+
+
+async def main_async(args) -> Dict[str, Any]:
+    procs: List[subprocess.Popen] = []
+    os.makedirs(args.results_dir, exist_ok=True)
+    try:
+        stub_url = args.stub_url
+        if not stub_url:
+            stub_url = f"http://127.0.0.1:{args.stub_port}"
+            procs.append(_start([
+                sys.executable, os.path.join(BASE_DIR, "benchmarks", "stub_llm.py"), "--port", str(args.stub_port),
+                "--prefill-ms", str(args.prefill_ms), "--tokens-per-sec", str(args.tokens_per_sec),
+                "--malformed-rate", str(args.malformed_rate), "--seed", str(args.seed),
+            ], dict(os.environ), os.path.join(args.results_dir, "stub_llm.log")))
+            await _wait_ready(stub_url + "/v1/models", 30)
+
+        server = args.server
+        if not server:
+            server = f"http://127.0.0.1:{args.server_port}"
+            env = dict(os.environ)
+            env["LLM_API_URL"] = stub_url + "/v1/chat/completions"
+            if not args.cache:
+                # Repeated prompts would otherwise be served from the response caches
+                env.setdefault("RESPONSE_CACHE_ENABLED", "0")
+                env.setdefault("SEMANTIC_CACHE_ENABLED", "0")
+            procs.append(_start([
+                sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(args.server_port),
+                "--log-level", "warning",
+            ], env, os.path.join(args.results_dir, "server.log")))
+            await _wait_ready(server + "/debug/llm-config", args.startup_timeout)
+
+        bodies = load_prompts(args.prompts or DEFAULT_PROMPTS)
+        if not bodies:
+            raise SystemExit("No prompts found")
+        print(f"{len(bodies)} prompts, server {server}, stub {stub_url}")
+
+        if args.warmup:
+            await run_level(server, bodies, 1, min(args.warmup, len(bodies)), args.stream, args.timeout)
+        levels = []
+        for c in [int(x) for x in args.concurrency.split(",") if x.strip()]:
+            levels.append(await run_level(server, bodies, c, args.requests, args.stream, args.timeout))
+            print(f"concurrency {c}: {levels[-1]['throughput_rps']} req/s, p95 {levels[-1]['latency_ms']['p95']} ms")
+    finally:
+        for p in reversed(procs):
+            p.terminate()
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+    return {
+        **_git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {
+            "endpoint": "/agent/build_view/stream" if args.stream else "/agent/build_view",
+            "prompts": len(bodies),
+            "requests_per_level": args.requests,
+            "prefill_ms": args.prefill_ms,
+            "tokens_per_sec": args.tokens_per_sec,
+            "malformed_rate": args.malformed_rate,
+            "cache": args.cache,
+            "external_server": bool(args.server),
+            "external_stub": bool(args.stub_url),
+        },
+        "levels": levels,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /agent/build_view against the replaying stub LLM.")
+    parser.add_argument("--concurrency", default="1,4,8", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=50, help="Requests per concurrency level")
+    parser.add_argument("--prompts", action="append", help="Prompt file (.jsonl or .md, repeatable)")
+    parser.add_argument("--stream", action="store_true", help="Use /agent/build_view/stream")
+    parser.add_argument("--cache", action="store_true", help="Keep the response/semantic caches enabled")
+    parser.add_argument("--warmup", type=int, default=2, help="Unmeasured requests before the first level")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Per-request timeout (s)")
+    parser.add_argument("--server", help="Benchmark an already running server instead of starting one")
+    parser.add_argument("--server-port", type=int, default=9101)
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    parser.add_argument("--stub-url", help="Use an already running LLM (or stub) instead of starting one")
+    parser.add_argument("--stub-port", type=int, default=9100)
+    parser.add_argument("--prefill-ms", type=float, default=200.0)
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--results-dir", default=DEFAULT_RESULTS_DIR)
+    parser.add_argument("--output", help="Results file (default: <results-dir>/<time>-<commit>.json)")
+    parser.add_argument("--compare", help="Earlier results file to print deltas against")
+    args = parser.parse_args()
+
+    result = asyncio.run(main_async(args))
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+
+    output = args.output or os.path.join(
+        args.results_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{(result['commit'] or 'nogit')[:8]}.json"
+    )
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+OpenAI-compatible stub LLM server for benchmarking the Durus server without an MLX box.
+- Serves POST /v1/chat/completions (plain and `stream: true` SSE) and GET /v1/models,
+  like the server behind LLM_API_URL.
+- Replays recorded assistant completions from assistantResponses/*.json and
+  durusai_training_lora/*.jsonl. A prompt that matches a recorded user prompt gets
+  its recorded answer; anything else gets one picked by prompt hash.
+- Simulates prefill latency, decode speed (tokens/s) and a rate of malformed output.
+
+Usage:
+    python benchmarks/stub_llm.py --port 9100
+    python benchmarks/stub_llm.py --port 9100 --prefill-ms 300 --tokens-per-sec 40 --malformed-rate 0.05
+"""
+import argparse
+import asyncio
+import glob
+import hashlib
+import json
+import os
+import random
+from typing import Any, Dict, List, Tuple
+
+from aiohttp import web
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SOURCES = [
+    os.path.join(BASE_DIR, "assistantResponses", "*.json"),
+    os.path.join(BASE_DIR, "durusai_training_lora", "*.jsonl"),
+]
+# Rough chars per token, for usage counts and chunking
+CHARS_PER_TOKEN = 4
+
+
+def _normalize(text: str) -> str:
+    return " ".join(str(text).lower().split())
+
+
+def _user_prompt(content: str) -> str:
+    """Normalized prompt for matching; recorded prompts may start with "Task:"."""
+    text = str(content)
+    if text.startswith("Task:"):
+        text = text[5:]
+    return _normalize(text)
+
+
+def _records(path: str) -> List[Any]:
+    """JSON documents in a file: one object, an array, or one object per line."""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    try:
+        data = json.loads(text)
+        return data if isinstance(data, list) else [data]
+    except ValueError:
+        pass
+    out = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            out.append(json.loads(line))
+        except ValueError:
+            continue
+    return out
+
+
+def load_completions(patterns: List[str]) -> Tuple[List[str], Dict[str, str]]:
+    """(all recorded completions, normalized user prompt -> completion)."""
+    completions: List[str] = []
+    by_prompt: Dict[str, str] = {}
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            for rec in _records(path):
+                if not isinstance(rec, dict):
+                    continue
+                if isinstance(rec.get("messages"), list):
+                    user = next((m.get("content") for m in rec["messages"] if m.get("role") == "user"), None)
+                    answer = next((m.get("content") for m in reversed(rec["messages"]) if m.get("role") == "assistant"), None)
+                    if not answer:
+                        continue
+                    if not isinstance(answer, str):
+                        answer = json.dumps(answer, separators=(",", ":"))
+                    completions.append(answer)
+                    if user:
+                        by_prompt[_user_prompt(user)] = answer
+                elif "proposed_changes" in rec:
+                    completions.append(json.dumps(rec, separators=(",", ":")))
+    return completions, by_prompt
+
+
+def _malform(text: str, rng: random.Random) -> str:
+    """Typical bad outputs: prose around the JSON, a truncated object, or a trailing comma."""
+    kind = rng.choice(("prose", "truncated", "trailing_comma"))
+    if kind == "prose":
+        return "Sure! Here is the JSON:\n```json\n" + text + "\n```"
+    if kind == "truncated":
+        return text[: max(1, int(len(text) * rng.uniform(0.5, 0.95)))]
+    return text[:-1] + ",}" if text.endswith("}") else text
+
+
+class StubLLM:
+    def __init__(self, completions: List[str], by_prompt: Dict[str, str], prefill_ms: float,
+                 tokens_per_sec: float, malformed_rate: float, seed: int):
+        if not completions:
+            raise ValueError("No recorded completions found")
+        self.completions = completions
+        self.by_prompt = by_prompt
+        self.prefill_ms = prefill_ms
+        self.tokens_per_sec = tokens_per_sec
+        self.malformed_rate = malformed_rate
+        self.rng = random.Random(seed)
+        self.stats = {"requests": 0, "streamed": 0, "matched": 0, "malformed": 0}
+
+    def _pick(self, messages: List[Dict[str, Any]]) -> str:
+        user = next((m.get("content") for m in reversed(messages) if m.get("role") == "user"), "") or ""
+        # build_view sends {"user_request": ..., "device_context": ...} as the user turn
+        try:
+            prompt = json.loads(user).get("user_request", user)
+        except (ValueError, AttributeError):
+            prompt = user
+        hit = self.by_prompt.get(_user_prompt(prompt))
+        if hit is not None:
+            self.stats["matched"] += 1
+            return hit
+        digest = int(hashlib.sha256(str(user).encode("utf-8")).hexdigest(), 16)
+        return self.completions[digest % len(self.completions)]
+
+    def _completion(self, body: Dict[str, Any]) -> Tuple[str, int, int]:
+        messages = body.get("messages") or []
+        text = self._pick(messages)
+        if self.rng.random() < self.malformed_rate:
+            text = _malform(text, self.rng)
+            self.stats["malformed"] += 1
+        max_tokens = int(body.get("max_tokens") or 0)
+        if max_tokens and len(text) > max_tokens * CHARS_PER_TOKEN:
+            text = text[: max_tokens * CHARS_PER_TOKEN]
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // CHARS_PER_TOKEN
+        return text, prompt_tokens, max(1, len(text) // CHARS_PER_TOKEN)
+
+    def _decode_delay(self, tokens: int) -> float:
+        return tokens / self.tokens_per_sec if self.tokens_per_sec > 0 else 0.0
+
+    def _usage(self, prompt_tokens: int, completion_tokens: int) -> Dict[str, Any]:
+        return {
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+            "timings": {"prompt_n": prompt_tokens, "cache_n": 0, "prompt_ms": self.prefill_ms,
+                        "predicted_n": completion_tokens, "predicted_ms": self._decode_delay(completion_tokens) * 1000},
+        }
+
+    async def chat(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        self.stats["requests"] += 1
+        text, prompt_tokens, completion_tokens = self._completion(body)
+        await asyncio.sleep(self.prefill_ms / 1000)
+
+        if not body.get("stream"):
+            await asyncio.sleep(self._decode_delay(completion_tokens))
+            return web.json_response({
+                "id": "stub", "object": "chat.completion", "model": body.get("model", "stub"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                **self._usage(prompt_tokens, completion_tokens),
+            })
+
+        self.stats["streamed"] += 1
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await resp.prepare(request)
+        per_chunk = self._decode_delay(1)
+        for i in range(0, len(text), CHARS_PER_TOKEN):
+            chunk = {"choices": [{"index": 0, "delta": {"content": text[i:i + CHARS_PER_TOKEN]}}]}
+            await resp.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            if per_chunk:
+                await asyncio.sleep(per_chunk)
+        final = {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], **self._usage(prompt_tokens, completion_tokens)}
+        await resp.write(f"data: {json.dumps(final)}\n\n".encode("utf-8"))
+        await resp.write(b"data: [DONE]\n\n")
+        return resp
+
+    async def models(self, request: web.Request) -> web.Response:
+        return web.json_response({"object": "list", "data": [{"id": "stub", "object": "model"}]})
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats)
+
+
+def build_app(stub: StubLLM) -> web.Application:
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_post("/v1/chat/completions", stub.chat)
+    app.router.add_get("/v1/models", stub.models)
+    app.router.add_get("/stats", stub.get_stats)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replaying OpenAI-compatible stub LLM for benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--source", action="append", help="Glob of recorded completions (repeatable)")
+    parser.add_argument("--prefill-ms", type=float, default=200.0, help="Latency before the first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0, help="Decode speed (0 = instant)")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Fraction of responses made invalid JSON")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    completions, by_prompt = load_completions(args.source or DEFAULT_SOURCES)
+    stub = StubLLM(completions, by_prompt, args.prefill_ms, args.tokens_per_sec, args.malformed_rate, args.seed)
+    print(f"Stub LLM: {len(completions)} recorded completions ({len(by_prompt)} by prompt) on {args.host}:{args.port}")
+    web.run_app(build_app(stub), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
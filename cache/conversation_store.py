@@ -0,0 +1,199 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+# --------------------
+# Conversation store config
+# --------------------
+# Bounded by total bytes (JSON size of summary + messages) with LRU eviction;
+# conversations idle longer than the TTL are dropped.
+CONVERSATION_MAX_BYTES = int(os.getenv("CONVERSATION_MAX_BYTES", str(16 * 1024 * 1024)))
+CONVERSATION_IDLE_TTL_SEC = float(os.getenv("CONVERSATION_IDLE_TTL_SEC", "3600"))
+# Optional SQLite file shared by all uvicorn workers (empty = per-process memory)
+CONVERSATION_DB_PATH = os.getenv("CONVERSATION_DB_PATH", "")
+
+
+def _size(conv: Dict[str, Any]) -> int:
+    return len(json.dumps(conv, separators=(",", ":")))
+
+
+class ConversationStore:
+    """
+    conversation_id -> {"summary": str, "messages": [{"role", "content", "seq"}]}.
+
+    `seq` numbers messages per conversation, so compact() removes exactly the
+    summarized ones even if hard-cap truncation dropped others in between.
+
+    In memory this is an LRU bounded by total bytes. With a db_path the SQLite
+    table is the single source of truth, so every worker sees the same history.
+    """
+
+    def __init__(self, max_bytes: int, idle_ttl_sec: float, max_messages: int, db_path: str = ""):
+        self.max_bytes = max_bytes
+        self.idle_ttl_sec = idle_ttl_sec
+        # Hard cap on stored messages if summarization keeps failing
+        self.max_messages = max(2, max_messages) * 2
+        self._mem: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self.stats = {"reads": 0, "writes": 0, "evictions": 0, "expired": 0, "summarized": 0, "truncated": 0}
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=10)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS conversations ("
+                " id TEXT PRIMARY KEY, updated REAL NOT NULL, size INTEGER NOT NULL, data TEXT NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS conversations_updated ON conversations (updated)")
+
+    def _expired(self, updated: float) -> bool:
+        return self.idle_ttl_sec > 0 and (time.time() - updated) > self.idle_ttl_sec
+
+    # ---- storage primitives (caller holds the lock) ----
+
+    def _load(self, cid: str) -> Optional[Dict[str, Any]]:
+        if self._db is not None:
+            row = self._db.execute("SELECT updated, data FROM conversations WHERE id = ?", (cid,)).fetchone()
+            if row is None:
+                return None
+            if self._expired(row[0]):
+                self._db.execute("DELETE FROM conversations WHERE id = ?", (cid,))
+                self.stats["expired"] += 1
+                return None
+            return json.loads(row[1])
+
+        conv = self._mem.get(cid)
+        if conv is None:
+            return None
+        if self._expired(conv["updated"]):
+            self._drop_mem(cid)
+            self.stats["expired"] += 1
+            return None
+        self._mem.move_to_end(cid)
+        return conv
+
+    def _save(self, cid: str, conv: Dict[str, Any]) -> None:
+        conv["updated"] = time.time()
+        if len(conv["messages"]) > self.max_messages:
+            del conv["messages"][: len(conv["messages"]) - self.max_messages]
+            self.stats["truncated"] += 1
+        size = _size(conv)
+        self.stats["writes"] += 1
+
+        if self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO conversations (id, updated, size, data) VALUES (?, ?, ?, ?)",
+                (cid, conv["updated"], size, json.dumps(conv)),
+            )
+            self._evict_db()
+            return
+
+        self._drop_mem(cid)
+        conv["_size"] = size
+        self._mem[cid] = conv
+        self._bytes += size
+        while self._bytes > self.max_bytes and len(self._mem) > 1:
+            oldest = next(iter(self._mem))
+            self._drop_mem(oldest)
+            self.stats["evictions"] += 1
+
+    def _drop_mem(self, cid: str) -> None:
+        conv = self._mem.pop(cid, None)
+        if conv is not None:
+            self._bytes -= conv.get("_size", 0)
+
+    def _evict_db(self) -> None:
+        if self.idle_ttl_sec > 0:
+            cur = self._db.execute("DELETE FROM conversations WHERE updated < ?", (time.time() - self.idle_ttl_sec,))
+            self.stats["expired"] += max(cur.rowcount, 0)
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM conversations").fetchone()[0]
+        while total > self.max_bytes:
+            row = self._db.execute("SELECT id, size FROM conversations ORDER BY updated LIMIT 1").fetchone()
+            if row is None:
+                break
+            self._db.execute("DELETE FROM conversations WHERE id = ?", (row[0],))
+            total -= row[1]
+            self.stats["evictions"] += 1
+
+    def _begin(self) -> None:
+        # Serialize read-modify-write across worker processes
+        if self._db is not None:
+            self._db.execute("BEGIN IMMEDIATE")
+
+    def _commit(self) -> None:
+        if self._db is not None:
+            self._db.execute("COMMIT")
+
+    # ---- public API ----
+
+    def get(self, cid: str) -> Dict[str, Any]:
+        """Summary and messages of a conversation (empty if unknown or expired)."""
+        with self._lock:
+            self.stats["reads"] += 1
+            conv = self._load(cid)
+            if conv is None:
+                return {"summary": "", "messages": []}
+            return {"summary": conv.get("summary", ""), "messages": list(conv["messages"])}
+
+    def append(self, cid: str, messages: List[Dict[str, str]]) -> int:
+        """Append turns; returns the conversation's message count."""
+        with self._lock:
+            self._begin()
+            try:
+                conv = self._load(cid) or {"summary": "", "messages": []}
+                if "next_seq" not in conv:
+                    # Stored before messages were numbered
+                    for i, m in enumerate(conv["messages"]):
+                        m.setdefault("seq", i)
+                seq = conv.get("next_seq", len(conv["messages"]))
+                for m in messages:
+                    conv["messages"].append({**m, "seq": seq})
+                    seq += 1
+                conv["next_seq"] = seq
+                self._save(cid, conv)
+                count = len(conv["messages"])
+            finally:
+                self._commit()
+            return count
+
+    def compact(self, cid: str, summary: str, through_seq: int) -> None:
+        """Replace the messages up to and including seq `through_seq` with a rolling summary."""
+        with self._lock:
+            self._begin()
+            try:
+                conv = self._load(cid)
+                if conv is not None:
+                    conv["summary"] = summary
+                    conv["messages"] = [m for m in conv["messages"] if m.get("seq", -1) > through_seq]
+                    self._save(cid, conv)
+                    self.stats["summarized"] += 1
+            finally:
+                self._commit()
+
+    def delete(self, cid: str) -> bool:
+        with self._lock:
+            if self._db is not None:
+                return self._db.execute("DELETE FROM conversations WHERE id = ?", (cid,)).rowcount > 0
+            found = cid in self._mem
+            self._drop_mem(cid)
+            return found
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            if self._db is not None:
+                count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM conversations").fetchone()
+            else:
+                count, total = len(self._mem), self._bytes
+            return {
+                **self.stats,
+                "conversations": count,
+                "bytes": total,
+                "max_bytes": self.max_bytes,
+                "idle_ttl_sec": self.idle_ttl_sec,
+                "backend": "sqlite" if self._db is not None else "memory",
+            }
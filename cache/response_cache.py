@@ -0,0 +1,211 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# --------------------
+# Exact-match build_view response cache config
+# --------------------
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256"))
+RESPONSE_CACHE_TTL_SEC = float(os.getenv("RESPONSE_CACHE_TTL_SEC", "86400"))
+# Optional on-disk tier that survives restarts (empty = memory only)
+RESPONSE_CACHE_DB_PATH = os.getenv("RESPONSE_CACHE_DB_PATH", "")
+# Row limit of the on-disk tier; least recently used rows are dropped beyond it
+RESPONSE_CACHE_DB_MAX_ROWS = int(os.getenv("RESPONSE_CACHE_DB_MAX_ROWS", "10000"))
+
+_WS = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Case/whitespace-insensitive form of a user prompt."""
+    return _WS.sub(" ", (prompt or "").strip().lower())
+
+
+def make_cache_key(
+    prompt: str,
+    context: Optional[Dict[str, Any]],
+    model: str,
+    max_tokens: int,
+    system_prompt: str,
+    rag_context: str,
+    variant: str = "",
+) -> str:
+    """Stable hash over everything that influences the generated response."""
+    parts = {
+        "prompt": normalize_prompt(prompt),
+        "context": context or {},
+        "model": model,
+        "max_tokens": max_tokens,
+        "system_prompt": hashlib.sha256(system_prompt.encode("utf-8")).hexdigest(),
+        "rag_context": rag_context,
+        "variant": variant,
+    }
+    blob = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """In-memory LRU with TTL, optionally backed by a SQLite table (LRU bounded by max_rows).
+
+    With a db_path, get()/set()/invalidate() do blocking SQLite I/O; async callers
+    should run them in a threadpool (see `persistent`).
+    """
+
+    def __init__(self, max_entries: int, ttl_sec: float, db_path: str = "", max_rows: int = 10000):
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self.max_rows = max_rows
+        self._mem: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self.stats = {
+            "hits_memory": 0,
+            "hits_disk": 0,
+            "misses": 0,
+            "bypassed": 0,
+            "stores": 0,
+            "evictions": 0,
+            "disk_evictions": 0,
+            "expired": 0,
+        }
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                " key TEXT PRIMARY KEY, created REAL NOT NULL, value TEXT NOT NULL, accessed REAL)"
+            )
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(response_cache)")}
+            if "accessed" not in columns:
+                # Tables created before the row limit existed
+                self._db.execute("ALTER TABLE response_cache ADD COLUMN accessed REAL")
+                self._db.execute("UPDATE response_cache SET accessed = created")
+            self._db.execute("CREATE INDEX IF NOT EXISTS response_cache_accessed ON response_cache (accessed)")
+            self._db.commit()
+
+    @property
+    def persistent(self) -> bool:
+        """True when lookups/stores touch the SQLite tier (blocking I/O)."""
+        return self._db is not None
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl_sec > 0 and (time.time() - created) > self.ttl_sec
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry is not None:
+                created, value = entry
+                if not self._expired(created):
+                    self._mem.move_to_end(key)
+                    self.stats["hits_memory"] += 1
+                    return value
+                del self._mem[key]
+                self.stats["expired"] += 1
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT created, value FROM response_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    created, value = row[0], json.loads(row[1])
+                    if not self._expired(created):
+                        self._db.execute("UPDATE response_cache SET accessed = ? WHERE key = ?", (time.time(), key))
+                        self._db.commit()
+                        self._put_mem(key, created, value)
+                        self.stats["hits_disk"] += 1
+                        return value
+                    self._db.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+                    self._db.commit()
+                    self.stats["expired"] += 1
+
+            self.stats["misses"] += 1
+            return None
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        created = time.time()
+        with self._lock:
+            self._put_mem(key, created, value)
+            self.stats["stores"] += 1
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO response_cache (key, created, value, accessed) VALUES (?, ?, ?, ?)",
+                    (key, created, json.dumps(value), created),
+                )
+                self._evict_db()
+                self._db.commit()
+
+    def _evict_db(self) -> None:
+        """Drop expired rows, then the least recently used ones beyond max_rows (caller holds the lock)."""
+        if self.ttl_sec > 0:
+            cur = self._db.execute("DELETE FROM response_cache WHERE created < ?", (time.time() - self.ttl_sec,))
+            self.stats["expired"] += max(cur.rowcount, 0)
+        if self.max_rows <= 0:
+            return
+        excess = self._db.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0] - self.max_rows
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM response_cache WHERE key IN"
+                " (SELECT key FROM response_cache ORDER BY accessed LIMIT ?)",
+                (excess,),
+            )
+            self.stats["disk_evictions"] += excess
+
+    def _put_mem(self, key: str, created: float, value: Dict[str, Any]) -> None:
+        self._mem[key] = (created, value)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def record_bypass(self) -> None:
+        with self._lock:
+            self.stats["bypassed"] += 1
+
+    def invalidate(self, key: Optional[str] = None) -> int:
+        """Drop one key, or everything when key is None. Returns entries removed."""
+        with self._lock:
+            if key is None:
+                removed = len(self._mem)
+                self._mem.clear()
+                if self._db is not None:
+                    removed = max(removed, self._db.execute("DELETE FROM response_cache").rowcount)
+                    self._db.commit()
+                return removed
+            removed = 1 if self._mem.pop(key, None) is not None else 0
+            if self._db is not None:
+                removed = max(removed, self._db.execute(
+                    "DELETE FROM response_cache WHERE key = ?", (key,)
+                ).rowcount)
+                self._db.commit()
+            return removed
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.stats["hits_memory"] + self.stats["hits_disk"]
+            lookups = hits + self.stats["misses"]
+            disk_entries = None
+            if self._db is not None:
+                disk_entries = self._db.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+            return {
+                **self.stats,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._mem),
+                "disk_entries": disk_entries,
+                "max_entries": self.max_entries,
+                "max_rows": self.max_rows if self._db is not None else None,
+                "ttl_sec": self.ttl_sec,
+            }
+
+
+RESPONSE_CACHE = ResponseCache(
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_TTL_SEC,
+    RESPONSE_CACHE_DB_PATH,
+    RESPONSE_CACHE_DB_MAX_ROWS,
+)
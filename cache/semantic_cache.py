@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+# --------------------
+# Semantic (paraphrase) prompt cache config
+# --------------------
+# Off by default: near-duplicate prompts ("Start" vs "Stop" button) can score
+# high, so the threshold should be tuned on real traffic before enabling.
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "0") == "1"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "512"))
+SEMANTIC_CACHE_TTL_SEC = float(os.getenv("SEMANTIC_CACHE_TTL_SEC", "86400"))
+
+
+def make_context_key(
+    context: Optional[Dict[str, Any]],
+    model: str,
+    max_tokens: int,
+    system_prompt: str,
+    variant: str = "",
+) -> str:
+    """Hash of everything except the prompt text; entries only match within it."""
+    parts = {
+        "context": context or {},
+        "model": model,
+        "max_tokens": max_tokens,
+        "system_prompt": hashlib.sha256(system_prompt.encode("utf-8")).hexdigest(),
+        "variant": variant,
+    }
+    blob = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class SemanticCache:
+    """
+    Bounded in-memory vector store of (prompt embedding, context key) -> response.
+    Lookups are one matrix-vector product over unit vectors (cosine similarity);
+    when full, the least recently used entry is overwritten.
+    """
+
+    def __init__(self, max_entries: int, threshold: float, ttl_sec: float):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl_sec = ttl_sec
+        self._vecs: Optional[np.ndarray] = None
+        self._slots: List[Optional[Dict[str, Any]]] = [None] * max_entries
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "bypassed": 0, "stores": 0, "evictions": 0}
+
+    @staticmethod
+    def _unit(vec: Sequence[float]) -> np.ndarray:
+        v = np.asarray(vec, dtype=np.float32)
+        norm = float(np.linalg.norm(v))
+        return v / norm if norm > 0 else v
+
+    def lookup(self, vec: Sequence[float], context_key: str) -> Optional[Tuple[Dict[str, Any], float, str]]:
+        """Return (value, similarity, cached prompt) of the best match above threshold."""
+        with self._lock:
+            if self._vecs is None:
+                self.stats["misses"] += 1
+                return None
+            now = time.time()
+            valid = np.array([
+                s is not None and s["ctx"] == context_key
+                and not (self.ttl_sec > 0 and now - s["created"] > self.ttl_sec)
+                for s in self._slots
+            ])
+            if not valid.any():
+                self.stats["misses"] += 1
+                return None
+            sims = self._vecs @ self._unit(vec)
+            sims[~valid] = -1.0
+            best = int(np.argmax(sims))
+            score = float(sims[best])
+            if score < self.threshold:
+                self.stats["misses"] += 1
+                return None
+            slot = self._slots[best]
+            slot["last_used"] = now
+            self.stats["hits"] += 1
+            return slot["value"], score, slot["prompt"]
+
+    def add(self, vec: Sequence[float], context_key: str, prompt: str, value: Dict[str, Any]) -> None:
+        unit = self._unit(vec)
+        with self._lock:
+            if self._vecs is None:
+                self._vecs = np.zeros((self.max_entries, unit.shape[0]), dtype=np.float32)
+            idx = next((i for i, s in enumerate(self._slots) if s is None), None)
+            if idx is None:
+                idx = min(range(self.max_entries), key=lambda i: self._slots[i]["last_used"])
+                self.stats["evictions"] += 1
+            now = time.time()
+            self._vecs[idx] = unit
+            self._slots[idx] = {
+                "ctx": context_key,
+                "prompt": prompt,
+                "value": value,
+                "created": now,
+                "last_used": now,
+            }
+            self.stats["stores"] += 1
+
+    def record_bypass(self) -> None:
+        with self._lock:
+            self.stats["bypassed"] += 1
+
+    def clear(self) -> int:
+        with self._lock:
+            removed = sum(1 for s in self._slots if s is not None)
+            self._slots = [None] * self.max_entries
+            if self._vecs is not None:
+                self._vecs[:] = 0
+            return removed
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+                "entries": sum(1 for s in self._slots if s is not None),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+            }
+
+
+SEMANTIC_CACHE = SemanticCache(
+    SEMANTIC_CACHE_MAX_ENTRIES,
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_TTL_SEC,
+)
@@ -1,19 +1,46 @@
 from typing import List, Dict, Optional
-import requests
 import os
 import json
 import time
-from typing import Any, Dict, List
-from fastapi import FastAPI, HTTPException
-from json_repair import repair_json
+# Import-time profiling: everything below up to LLM_API_URL (python -X importtime for detail)
+_IMPORT_STARTED = time.perf_counter()
+import asyncio
+import hashlib
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Tuple
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from models.AgentModels import AgentRequest, AgentResponse
-from utils.sanitize_llm_json import sanitize_llm_json
+from models.ChatModels import ChatRequest, ChatResponse
+from utils.parse_agent_response import PARSE_STATS, parse_agent_response, get_parse_stats
+from utils.metrics import observe, record_stage, render_prometheus, server_timing, span, start_request
+from utils.incremental_json import IncrementalJSONParser
 from network._llm_models_url import _llm_models_url
 from view_creation.build_system_view_creation_prompt import build_system_view_creation_prompt
+from view_creation.build_system_view_patch_prompt import build_system_view_patch_prompt
+from view_creation.output_mode import get_output_stats, record_output, resolve_output_mode
+from view_creation.build_agent_response_schema import build_agent_response_schema, build_agent_response_grammar
+from view_creation.component_defaults import COMPONENT_DEFAULTS_ENABLED, expand_component, expand_view
 from utils.build_user_prompt import build_user_prompt
-from network.call_llm import call_llm
-from RAG.service import get_rag_context, _get_keyword_fallback_context
+from utils.build_history_messages import build_history_messages
+from utils.slice_controller_config import slice_controller_config
+from view_creation.build_view_prompt_prefix import build_view_prompt_prefix
+from network.prefix_cache import LLM_PREFIX_REUSE, cache_hints, get_prefix_stats
+from network.llm_router import LLM_BACKENDS, LLMRouter, parse_backends
+from network.admission import LLM_ADMISSION, LLM_SINGLE_FLIGHT
+from network.hedging import attempt_overrides, get_hedge_stats, hedged
+from network.llm_session import close_llm_session, LLM_POOL_SIZE, LLM_POOL_PER_HOST
+from cache.response_cache import RESPONSE_CACHE, RESPONSE_CACHE_ENABLED, make_cache_key
+from cache.semantic_cache import SEMANTIC_CACHE, SEMANTIC_CACHE_ENABLED, make_context_key
+from cache.conversation_store import ConversationStore, CONVERSATION_DB_PATH, CONVERSATION_IDLE_TTL_SEC, CONVERSATION_MAX_BYTES
+from RAG.context_packer import count_tokens
+from RAG.service import embed_query, get_rag_context, get_rag_stats, get_static_reference, invalidate_rag_cache, rag_init_state, refresh_section_index, warm_up_rag
 
+IMPORT_SEC = time.perf_counter() - _IMPORT_STARTED
 LLM_API_URL = os.getenv("LLM_API_URL", "http://127.0.0.1:8080/v1/chat/completions")
 LLM_MODEL_NAME = os.getenv(
     "LLM_MODEL_NAME",
@@ -29,9 +56,113 @@ CHAT_HISTORY_MAX_MESSAGES = int(os.getenv("CHAT_HISTORY_MAX_MESSAGES", "30"))
 CHAT_DOCS_MAX_CHARS = 300
 LLM_BUILD_MAX_TOKENS = int(os.getenv("LLM_BUILD_MAX_TOKENS", "4096"))
 LLM_BUILD_READ_TIMEOUT = float(os.getenv("LLM_BUILD_READ_TIMEOUT", "120"))
-CONVERSATIONS: Dict[str, List[Dict[str, str]]] = {}
+# Older turns are folded into a rolling summary once a conversation exceeds CHAT_HISTORY_MAX_MESSAGES
+CHAT_SUMMARY_MAX_TOKENS = int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "300"))
+CONVERSATIONS = ConversationStore(
+    CONVERSATION_MAX_BYTES,
+    CONVERSATION_IDLE_TTL_SEC,
+    CHAT_HISTORY_MAX_MESSAGES,
+    CONVERSATION_DB_PATH,
+)
+CHAT_SYSTEM_PROMPT = (
+    "You are the Durus assistant for the Duro controller and its HMI/tag editor. "
+    "Answer briefly and concretely. If the user asks for view or tag changes, "
+    "describe them; the build_view endpoint applies them."
+)
+SUMMARY_SYSTEM_PROMPT = (
+    "Summarize this conversation between a user and the Durus HMI assistant for later turns. "
+    "Keep every decision, view/component/tag name and id, and open request; drop pleasantries. "
+    "Merge it with the current summary. Plain text, at most 150 words."
+)
+# Constrained decoding: "off" | "json_schema" (OpenAI response_format) | "grammar" (llama.cpp GBNF)
+LLM_CONSTRAINED_MODE = os.getenv("LLM_CONSTRAINED_MODE", "off").lower()
+# One or more LLM servers (LLM_BACKENDS); defaults to LLM_API_URL / LLM_MODEL_NAME
+LLM_ROUTER = LLMRouter(parse_backends(LLM_BACKENDS, LLM_API_URL, LLM_MODEL_NAME))
+
+# Startup warm-up runs in the background; /health/ready reports 503 until it is done
+WARMUP_STATE: Dict[str, Any] = {"done": False, "import_sec": round(IMPORT_SEC, 3), "ready_sec": None, "steps": {}}
+_STARTED = time.perf_counter()
+
+
+async def _warm_up_step(name: str, fn) -> None:
+    t0 = time.perf_counter()
+    try:
+        result = await fn()
+        failed = isinstance(result, dict) and result.get("state") == "failed"
+        WARMUP_STATE["steps"][name] = {"ok": not failed, "ms": round((time.perf_counter() - t0) * 1000, 1)}
+        if isinstance(result, dict):
+            WARMUP_STATE["steps"][name].update(result)
+    except Exception as e:
+        WARMUP_STATE["steps"][name] = {"ok": False, "error": str(e) or type(e).__name__}
+        print(f"[AGENT DEBUG] Warm-up step {name} failed: {e}")
+
+
+async def _warm_up_llm() -> None:
+    # Opens keep-alive connections; with prefix reuse also prefills the static prefix
+    await asyncio.gather(*(LLM_ROUTER.probe(b) for b in LLM_ROUTER.backends))
+    if LLM_PREFIX_REUSE:
+        static_reference = await run_in_threadpool(get_static_reference)
+        messages = [
+            {"role": "system", "content": build_view_prompt_prefix(static_reference, resolve_output_mode() == "patch")},
+            {"role": "user", "content": "ping"},
+        ]
+        await LLM_ROUTER.acall(1, LLM_CONNECT_TIMEOUT, LLM_BUILD_READ_TIMEOUT, messages, cache_hints())
+
+
+async def _warm_up() -> None:
+    """Load everything the first build_view would otherwise pay for."""
+    # Keyword fallback section index and the context-packing tokenizer
+    await _warm_up_step("section_index", lambda: run_in_threadpool(refresh_section_index))
+    await _warm_up_step("tokenizer", lambda: run_in_threadpool(count_tokens, ""))
+    # Embedding model (torch), vector store connection and retriever, via one dummy query
+    await _warm_up_step("rag", lambda: run_in_threadpool(warm_up_rag))
+    if SEMANTIC_CACHE_ENABLED:
+        await _warm_up_step("semantic_embed", lambda: run_in_threadpool(embed_query, "warm up"))
+    await _warm_up_step("llm", _warm_up_llm)
+    WARMUP_STATE["done"] = True
+    WARMUP_STATE["ready_sec"] = round(time.perf_counter() - _STARTED, 3)
+    print(f"[AGENT DEBUG] Warm-up done: imports {IMPORT_SEC:.2f}s, startup to ready {WARMUP_STATE['ready_sec']:.2f}s")
+
+    # RAG stays usable later: keep retrying a failed init in the background (with backoff)
+    while rag_init_state()["state"] == "failed":
+        await asyncio.sleep(max(1.0, rag_init_state()["retry_in_sec"]))
+        await run_in_threadpool(warm_up_rag)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warm_up = asyncio.create_task(_warm_up())
+    # Probe LLM backends in the background; failing ones are ejected for a cool-down
+    LLM_ROUTER.start_health_checks()
+    yield
+    warm_up.cancel()
+    await LLM_ROUTER.stop_health_checks()
+    # Release pooled keep-alive connections to the LLM server
+    await close_llm_session()
 
-app = FastAPI(title="Durus AI Agent Server")
+app = FastAPI(title="Durus AI Agent Server", lifespan=lifespan)
+
+# Per-request stage timings -> Server-Timing header and the request latency histogram.
+# Streaming responses only report the stages that ran before the first byte.
+@app.middleware("http")
+async def server_timing_middleware(request: Request, call_next):
+    spans = start_request()
+    t0 = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - t0
+    response.headers["Server-Timing"] = server_timing(spans, elapsed)
+    route = request.scope.get("route")
+    observe("durus_http_request_seconds", elapsed, {"route": getattr(route, "path", "other"), "method": request.method})
+    return response
+
+# Prometheus scrape endpoint: latency histograms, LLM token counters, JSON recovery counters
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    parse_outcomes = {(("outcome", k),): v for k, v in PARSE_STATS.items() if k != "total"}
+    return PlainTextResponse(
+        render_prometheus({"durus_parse_outcomes_total": ("LLM output parse/recovery paths taken.", parse_outcomes)}),
+        media_type="text/plain; version=0.0.4",
+    )
 
 # get LLM Config
 @app.get("/debug/llm-config")
@@ -42,85 +173,145 @@ def debug_llm_config():
         "LLM_CONNECT_TIMEOUT": LLM_CONNECT_TIMEOUT,
         "LLM_READ_TIMEOUT": LLM_READ_TIMEOUT,
         "LLM_MODELS_URL": _llm_models_url(LLM_API_URL),
+        "LLM_POOL_SIZE": LLM_POOL_SIZE,
+        "LLM_POOL_PER_HOST": LLM_POOL_PER_HOST,
+        "LLM_CONSTRAINED_MODE": LLM_CONSTRAINED_MODE,
+        "LLM_PREFIX_REUSE": LLM_PREFIX_REUSE,
+        "backends": LLM_ROUTER.get_stats(),
+        "failovers": LLM_ROUTER.stats["failovers"],
+        "hedging": get_hedge_stats(),
+    }
+
+# Conversation store size/evictions/summaries
+@app.get("/debug/conversations")
+def debug_conversations():
+    return {"max_messages": CHAT_HISTORY_MAX_MESSAGES, **CONVERSATIONS.get_stats()}
+
+# Forget one conversation (history and summary)
+@app.delete("/conversations/{conversation_id}")
+def conversation_delete(conversation_id: str):
+    return {"removed": CONVERSATIONS.delete(conversation_id)}
+
+# Response cache hit/miss counters
+@app.get("/cache/stats")
+def cache_stats():
+    return {
+        "enabled": RESPONSE_CACHE_ENABLED,
+        "responses": RESPONSE_CACHE.get_stats(),
+        "semantic_enabled": SEMANTIC_CACHE_ENABLED,
+        "semantic": SEMANTIC_CACHE.get_stats(),
     }
 
+# Invalidate one cached response (by key) or the whole response cache
+@app.delete("/cache/responses")
+def cache_invalidate(key: Optional[str] = None):
+    return {"removed": RESPONSE_CACHE.invalidate(key)}
+
+# Drop every entry in the semantic prompt cache
+@app.delete("/cache/semantic")
+def cache_invalidate_semantic():
+    return {"removed": SEMANTIC_CACHE.clear()}
+
+# RAG cache counters and per-stage (embed/search/format) timings
+@app.get("/debug/rag-stats")
+def debug_rag_stats():
+    return get_rag_stats()
+
+# Drop cached query embeddings / retrieval results (e.g. after re-indexing)
+@app.delete("/cache/rag")
+def cache_invalidate_rag():
+    invalidate_rag_cache()
+    return {"ok": True}
+
+# Prompt tokens reused from the backend's prefix/KV cache
+@app.get("/debug/prefix-cache")
+def debug_prefix_cache():
+    return get_prefix_stats()
+
+# LLM admission: active generations, queue depth per lane, wait times, rejections, coalescing
+@app.get("/debug/admission")
+def debug_admission():
+    return {**LLM_ADMISSION.get_stats(), "single_flight": LLM_SINGLE_FLIGHT.get_stats()}
+
+# JSON recovery path hit rates (how often sanitize/repair/normalization fire)
+@app.get("/debug/parse-stats")
+def debug_parse_stats():
+    return {"constrained_mode": LLM_CONSTRAINED_MODE, **get_parse_stats(), "output": get_output_stats()}
+
+# Liveness: the process is up and serving (no dependency checks)
+@app.get("/health/live")
+def health_live():
+    return {"ok": True, "uptime_sec": round(time.perf_counter() - _STARTED, 1)}
+
+# Readiness: warm-up finished and at least one LLM backend is healthy.
+# A failed RAG init does not block readiness (requests fall back to keyword sections).
+@app.get("/health/ready")
+def health_ready():
+    llm_ok = any(b["healthy"] for b in LLM_ROUTER.get_stats())
+    rag = rag_init_state()
+    ready = WARMUP_STATE["done"] and llm_ok
+    body = {"ready": ready, "llm": llm_ok, "rag": rag, "degraded": rag["state"] == "failed", **WARMUP_STATE}
+    return JSONResponse(body, status_code=200 if ready else 503)
+
 # check LLM health
 @app.get("/health/llm")
-def health_llm():
-    """Probes the LLM server to verify reachability and basic functionality."""
-    # 1) Try /v1/models if available
-    models_url = _llm_models_url(LLM_API_URL)
-    try:
-        t0 = time.time()
-        r = requests.get(models_url, timeout=(LLM_CONNECT_TIMEOUT, 5))
-        elapsed = time.time() - t0
-        info = {
-            "ok": r.status_code == 200,
-            "probe": "GET /v1/models",
-            "status": r.status_code,
-            "elapsed_sec": round(elapsed, 3),
-            "url": models_url,
-        }
-        if r.status_code == 200:
-            return info
-    except Exception as e:
-        models_error = str(e)
-    else:
-        models_error = None
-
-    # 2) Fallback: tiny chat completion
-    payload = {
-        "model": LLM_MODEL_NAME,
-        "messages": [
-            {"role": "system", "content": "ping"},
-            {"role": "user", "content": "ping"},
-        ],
-        "temperature": 0.0,
-        "max_tokens": 1,
+async def health_llm():
+    """Probes every LLM backend the router uses (GET /v1/models) and reports their health."""
+    # Same probe as the router's health loop, so failures eject and successes readmit
+    await asyncio.gather(*(LLM_ROUTER.probe(b) for b in LLM_ROUTER.backends))
+    backends = LLM_ROUTER.get_stats()
+    return {
+        "ok": any(b["healthy"] for b in backends),
+        "probe": "GET /v1/models",
+        "healthy": sum(1 for b in backends if b["healthy"]),
+        "backends": backends,
     }
-    try:
-        t0 = time.time()
-        r = requests.post(
-            LLM_API_URL,
-            json=payload,
-            timeout=(LLM_CONNECT_TIMEOUT, 10),
-        )
-        elapsed = time.time() - t0
-        ok = r.status_code == 200
-        return {
-            "ok": ok,
-            "probe": "POST /v1/chat/completions",
-            "status": r.status_code,
-            "elapsed_sec": round(elapsed, 3),
-            "url": LLM_API_URL,
-            "models_probe_error": models_error,
-        }
-    except Exception as e:
+
+def _constrained_decoding_extra(patch_mode: bool = False) -> Optional[Dict[str, Any]]:
+    """Payload fields that restrict the backend to AgentResponse-shaped (or patch-shaped) JSON."""
+    if LLM_CONSTRAINED_MODE == "json_schema":
         return {
-            "ok": False,
-            "probe": "POST /v1/chat/completions",
-            "status": None,
-            "elapsed_sec": None,
-            "url": LLM_API_URL,
-            "error": str(e),
-            "models_probe_error": models_error,
+            "response_format": {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": "AgentPatch" if patch_mode else "AgentResponse",
+                    "strict": True,
+                    "schema": build_agent_response_schema(patch_mode),
+                },
+            },
         }
-    
-# Build view endpoint. ask ai agent to build hmi view.
-@app.post("/agent/build_view", response_model=AgentResponse)
-def build_view(body: AgentRequest):
-    # Build the system prompt for view creation
-    system_prompt = build_system_view_creation_prompt()
-    
-    # RAG: retrieve relevant documentation for the user's prompt
-    rag_context = get_rag_context(body.prompt)
+    if LLM_CONSTRAINED_MODE == "grammar":
+        return {"grammar": build_agent_response_grammar(patch_mode)}
+    return None
 
-    # Fallback: inject key sections from local HMI doc if prompt mentions critical components
-    fallback_context = _get_keyword_fallback_context(body.prompt)
-    combined_context = rag_context
-    if fallback_context:
-        combined_context = (rag_context + "\n---\n" + fallback_context) if rag_context else fallback_context
-    user_prompt = build_user_prompt(body.prompt, combined_context)
+
+async def _build_view_messages(
+    body: AgentRequest,
+    history: List[Dict[str, str]],
+    prompt_vec: Optional[List[float]] = None,
+) -> Tuple[List[Dict[str, str]], str]:
+    """Assemble the system/RAG/history/user message list for a build_view request.
+
+    `prompt_vec` is the prompt's query embedding from the semantic cache lookup, if any.
+    Returns the messages and the retrieved context that went into them.
+    """
+    if LLM_PREFIX_REUSE:
+        return await _build_view_messages_prefixed(body, history, prompt_vec)
+
+    # Build the system prompt for view creation (full objects or compact patch ops)
+    if resolve_output_mode(body.output_mode) == "patch":
+        system_prompt = build_system_view_patch_prompt()
+    else:
+        system_prompt = build_system_view_creation_prompt()
+    
+    # RAG: retrieve relevant documentation for the user's prompt, plus key sections
+    # from the local HMI docs if it mentions critical components, packed into one
+    # token budget. Embedding + search are blocking, keep them off the event loop.
+    combined_context = await run_in_threadpool(get_rag_context, body.prompt, include_fallback=True, embedding=prompt_vec)
+    # Only the parts of the controller config the prompt touches, plus a names/ids summary.
+    # Retrieved docs go in the system message below, not repeated here.
+    device_context = await run_in_threadpool(slice_controller_config, body.context, body.prompt)
+    user_prompt = build_user_prompt(body.prompt, device_context or {})
 
     # Build message list: system + history + new user
     messages: List[Dict[str, str]] = [
@@ -137,79 +328,401 @@ def build_view(body: AgentRequest):
                 f"RAG_CONTEXT_START\n{combined_context}\nRAG_CONTEXT_END"
             ),
         })
+    messages.extend(history)
     messages.append({"role": "user", "content": user_prompt})
-    
-    # Call the model
-    raw = call_llm(LLM_API_URL, LLM_MODEL_NAME, LLM_BUILD_MAX_TOKENS, LLM_CONNECT_TIMEOUT, LLM_BUILD_READ_TIMEOUT, messages)
+    return messages, combined_context
+
+
+async def _build_view_messages_prefixed(
+    body: AgentRequest,
+    history: List[Dict[str, str]],
+    prompt_vec: Optional[List[float]] = None,
+) -> Tuple[List[Dict[str, str]], str]:
+    """Prefix-reuse layout: one static system message, everything variable in the user turn.
+
+    The core component schemas live in the static prefix, so the keyword
+    fallback is not repeated in the per-request context. Conversation history
+    goes right after the prefix, so earlier turns extend the reusable prefix.
+    """
+    static_reference = await run_in_threadpool(get_static_reference)
+    prefix = build_view_prompt_prefix(static_reference, resolve_output_mode(body.output_mode) == "patch")
+    rag_context = await run_in_threadpool(get_rag_context, body.prompt, embedding=prompt_vec)
+    device_context = dict(await run_in_threadpool(slice_controller_config, body.context, body.prompt) or {})
+    if rag_context:
+        device_context["relevant_docs"] = rag_context
+    messages: List[Dict[str, str]] = [
+        {"role": "system", "content": prefix},
+        *history,
+        {"role": "user", "content": build_user_prompt(body.prompt, device_context)},
+    ]
+    return messages, rag_context
+
+
+def _build_view_extra(body: AgentRequest) -> Optional[Dict[str, Any]]:
+    """Backend-specific payload fields: constrained decoding and prompt-cache hints."""
+    extra = dict(_constrained_decoding_extra(resolve_output_mode(body.output_mode) == "patch") or {})
+    if LLM_PREFIX_REUSE:
+        extra.update(cache_hints(body.conversation_id or body.device_id))
+    return extra or None
+
+
+def _response_cache_key(
+    body: AgentRequest,
+    messages: List[Dict[str, str]],
+    rag_context: str,
+    history: List[Dict[str, str]],
+) -> str:
+    variant = _cache_variant(body)
+    if history:
+        # Same prompt after a different conversation is a different request
+        variant += ":" + hashlib.sha256(json.dumps(history, sort_keys=True).encode("utf-8")).hexdigest()
+    return make_cache_key(
+        body.prompt,
+        body.context,
+        _routed_models(),
+        LLM_BUILD_MAX_TOKENS,
+        messages[0]["content"],
+        rag_context,
+        variant=variant,
+    )
+
+
+def _routed_models() -> str:
+    """Every model LLM_ROUTER may send build_view to; any of them can produce a cached answer."""
+    return ",".join(sorted({b.model for b in LLM_ROUTER.backends}))
+
+
+def _cache_variant(body: AgentRequest) -> str:
+    """Request settings besides prompt/context/model that change the answer's shape."""
+    return f"{LLM_CONSTRAINED_MODE}:{resolve_output_mode(body.output_mode)}"
+
+
+async def _cached_response(body: AgentRequest, cache_key: str) -> Optional[Dict[str, Any]]:
+    """Look up a cached AgentResponse unless caching is off for this request."""
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    if not body.use_cache:
+        RESPONSE_CACHE.record_bypass()
+        return None
+    # The SQLite tier does blocking I/O; keep it off the event loop
+    if RESPONSE_CACHE.persistent:
+        return await run_in_threadpool(RESPONSE_CACHE.get, cache_key)
+    return RESPONSE_CACHE.get(cache_key)
+
+
+async def _semantic_lookup(
+    body: AgentRequest,
+    history: List[Dict[str, str]],
+) -> Tuple[Optional[Dict[str, Any]], Optional[List[float]], str]:
+    """Embed the prompt and look for a cached paraphrase.
+
+    Returns (cached response or None, prompt embedding, context key); the
+    embedding is None when the semantic cache is off or unavailable.
+    Follow-up turns ("make it bigger") depend on history and are never matched.
+    """
+    if not SEMANTIC_CACHE_ENABLED or history:
+        return None, None, ""
+    if not body.use_semantic_cache:
+        SEMANTIC_CACHE.record_bypass()
+        return None, None, ""
+
+    patch_mode = resolve_output_mode(body.output_mode) == "patch"
+    context_key = make_context_key(
+        body.context,
+        _routed_models(),
+        LLM_BUILD_MAX_TOKENS,
+        build_system_view_patch_prompt() if patch_mode else build_system_view_creation_prompt(),
+        variant=_cache_variant(body),
+    )
     try:
-        json_str = sanitize_llm_json(raw)
-    except ValueError as e:
-        print("\n[AGENT DEBUG] RAW REPR (no JSON found):\n", repr(raw), "\n")
-        raise HTTPException(status_code=500, detail=f"LLM output missing JSON object: {e}")
-    
+        # Same query vector the retriever uses; passed on to _build_view_messages
+        vec = await run_in_threadpool(embed_query, body.prompt)
+    except Exception as e:
+        print("\n[AGENT DEBUG] Semantic cache embedding failed:", e, "\n")
+        return None, None, ""
+
+    hit = SEMANTIC_CACHE.lookup(vec, context_key)
+    if hit is None:
+        return None, vec, context_key
+    value, score, cached_prompt = hit
+    print(f"[AGENT DEBUG] Semantic cache hit (sim={score:.3f}) for {cached_prompt!r}")
+    return value, vec, context_key
+
+
+async def _store_response(
+    cache_key: str,
+    resp_obj: AgentResponse,
+    body: AgentRequest,
+    prompt_vec: Optional[List[float]] = None,
+    context_key: str = "",
+) -> None:
+    value = jsonable_encoder(resp_obj)
+    if RESPONSE_CACHE_ENABLED:
+        if RESPONSE_CACHE.persistent:
+            await run_in_threadpool(RESPONSE_CACHE.set, cache_key, value)
+        else:
+            RESPONSE_CACHE.set(cache_key, value)
+    if prompt_vec is not None:
+        SEMANTIC_CACHE.add(prompt_vec, context_key, body.prompt, value)
+
+
+# Background tasks (history summarization) kept referenced until done
+_BACKGROUND_TASKS: set = set()
+_SUMMARIZING: set = set()
+
+
+async def _conversation_history(conversation_id: Optional[str]) -> List[Dict[str, str]]:
+    if not conversation_id:
+        return []
+    conversation = await run_in_threadpool(CONVERSATIONS.get, conversation_id)
+    return build_history_messages(conversation)
+
+
+def _build_view_turn(resp: Dict[str, Any]) -> str:
+    """Assistant turn stored for build_view: the message plus what it proposed, without the JSON."""
+    pc = resp.get("proposed_changes") or {}
+    hmi = pc.get("hmi") if isinstance(pc.get("hmi"), dict) else {}
+    views = [f"{v.get('name')} ({v.get('id')})" for v in hmi.get("views") or [] if isinstance(v, dict)]
+    # tags_to_add is [{tagName: tag}, ...]
+    tag_names = [name for t in pc.get("tags_to_add") or [] if isinstance(t, dict) for name in t]
+    parts = [resp.get("message") or ""]
+    if views:
+        parts.append("Proposed views: " + ", ".join(views))
+    if tag_names:
+        parts.append("Proposed tags: " + ", ".join(map(str, tag_names)))
+    return "\n".join(p for p in parts if p)
+
+
+async def _remember_turn(conversation_id: Optional[str], user_content: str, assistant_content: str) -> None:
+    """Append a user/assistant exchange; summarize older turns in the background when over the limit."""
+    if not conversation_id:
+        return
+    # SQLite writes may wait on another worker's lock; keep them off the event loop
+    count = await run_in_threadpool(CONVERSATIONS.append, conversation_id, [
+        {"role": "user", "content": user_content},
+        {"role": "assistant", "content": assistant_content},
+    ])
+    if count > CHAT_HISTORY_MAX_MESSAGES and conversation_id not in _SUMMARIZING:
+        _SUMMARIZING.add(conversation_id)
+        task = asyncio.create_task(_summarize_conversation(conversation_id))
+        _BACKGROUND_TASKS.add(task)
+        task.add_done_callback(_BACKGROUND_TASKS.discard)
+
+
+async def _summarize_conversation(conversation_id: str) -> None:
+    """Fold all but the most recent half of the history into the rolling summary."""
     try:
-        parsed = json.loads(json_str)
-    except json.JSONDecodeError as e:
-        # 3) If that fails, try to repair it with json_repair
+        conversation = await run_in_threadpool(CONVERSATIONS.get, conversation_id)
+        keep = CHAT_HISTORY_MAX_MESSAGES // 2
+        older = conversation["messages"][:-keep] if keep else conversation["messages"]
+        if not older:
+            return
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in older)
+        messages = [
+            {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+            {"role": "user", "content": f"Current summary:\n{conversation['summary'] or '(none)'}\n\nNew turns:\n{transcript}"},
+        ]
+        # Low priority: never delays user-facing generations
+        async with LLM_ADMISSION.slot("low"):
+            summary = await LLM_ROUTER.acall(CHAT_SUMMARY_MAX_TOKENS, LLM_CONNECT_TIMEOUT, LLM_CHAT_READ_TIMEOUT, messages)
+        await run_in_threadpool(CONVERSATIONS.compact, conversation_id, summary.strip(), older[-1].get("seq", -1))
+        print(f"[AGENT DEBUG] Conversation {conversation_id}: {len(older)} messages summarized")
+    except HTTPException as e:
+        print(f"[AGENT DEBUG] Conversation {conversation_id} summary failed: {e.detail}")
+    finally:
+        _SUMMARIZING.discard(conversation_id)
+
+
+# Chat endpoint. Free-form questions, sharing the conversation store with build_view.
+@app.post("/agent/chat", response_model=ChatResponse)
+async def chat(body: ChatRequest):
+    conversation_id = body.conversation_id or uuid.uuid4().hex
+    history = await _conversation_history(conversation_id)
+    system_prompt = CHAT_SYSTEM_PROMPT
+    docs = await run_in_threadpool(get_rag_context, body.prompt)
+    if docs:
+        system_prompt += f"\n\nRelevant documentation (excerpt):\n{docs[:CHAT_DOCS_MAX_CHARS]}"
+    messages = [{"role": "system", "content": system_prompt}, *history, {"role": "user", "content": body.prompt}]
+
+    async with LLM_ADMISSION.slot("normal"):
+        reply = await LLM_ROUTER.acall(LLM_CHAT_MAX_TOKENS, LLM_CONNECT_TIMEOUT, LLM_CHAT_READ_TIMEOUT, messages)
+    reply = reply.strip()
+    await _remember_turn(conversation_id, body.prompt, reply)
+    return ChatResponse(reply=reply, conversation_id=conversation_id)
+
+
+# Build view endpoint. ask ai agent to build hmi view.
+@app.post("/agent/build_view", response_model=AgentResponse)
+async def build_view(body: AgentRequest):
+    resp = await _build_view(body)
+    await _remember_turn(body.conversation_id, body.prompt, _build_view_turn(jsonable_encoder(resp)))
+    return resp
+
+
+async def _build_view(body: AgentRequest) -> AgentResponse:
+    with span("history"):
+        history = await _conversation_history(body.conversation_id)
+    with span("semantic_cache"):
+        semantic_hit, prompt_vec, context_key = await _semantic_lookup(body, history)
+    if semantic_hit is not None:
+        return AgentResponse(**semantic_hit)
+
+    with span("prompt"):
+        messages, rag_context = await _build_view_messages(body, history, prompt_vec)
+    cache_key = _response_cache_key(body, messages, rag_context, history)
+    cached = await _cached_response(body, cache_key)
+    if cached is not None:
+        return AgentResponse(**cached)
+
+    # One generation + validation; hedging may run several (LLM_HEDGE_MODE)
+    async def attempt(index: int) -> AgentResponse:
+        extra = _build_view_extra(body)
+        overrides = attempt_overrides(index)
+        if overrides:
+            extra = {**(extra or {}), **overrides}
+        t_wait = time.perf_counter()
+        async with LLM_ADMISSION.slot(body.priority):
+            t0 = time.perf_counter()
+            record_stage("queue", t0 - t_wait)
+            raw = await LLM_ROUTER.acall(LLM_BUILD_MAX_TOKENS, LLM_CONNECT_TIMEOUT, LLM_BUILD_READ_TIMEOUT, messages, extra)
+            await run_in_threadpool(record_output, resolve_output_mode(body.output_mode), raw, time.perf_counter() - t0)
+        with span("parse"):
+            return parse_agent_response(raw, body.context)
+
+    # Call the model; identical concurrent requests share one generation
+    async def generate():
+        resp_obj = await hedged(attempt)
+        await _store_response(cache_key, resp_obj, body, prompt_vec, context_key)
+        return resp_obj
+
+    return await LLM_SINGLE_FLIGHT.do(cache_key, generate)
+
+
+# Paths inside the generated JSON that are streamed out as soon as they complete
+_COMPONENT_KEYS = ("components_to_add", "component_to_add")
+
+
+def _stream_event_for(path) -> Optional[str]:
+    """Map a completed JSON path to a stream event name (None = not streamed)."""
+    if path == ("message",):
+        return "message"
+    if len(path) == 2 and path[0] == "steps" and isinstance(path[1], int):
+        return "step"
+    if len(path) == 4 and path[:3] == ("proposed_changes", "hmi", "views"):
+        return "view"
+    # tags/components may be lists or dicts, and may be misplaced at top level
+    if path[:1] == ("proposed_changes",):
+        path = path[1:]
+    if len(path) == 2 and path[0] == "tags_to_add":
+        return "tag"
+    if len(path) == 2 and path[0] in _COMPONENT_KEYS:
+        return "component"
+    return None
+
+
+def _stream_data(event: Optional[str], value: Any) -> Any:
+    """Streamed value as it will appear in the final result (compact views/components expanded)."""
+    if COMPONENT_DEFAULTS_ENABLED:
+        if event == "view":
+            return expand_view(value)
+        if event == "component":
+            return expand_component(value)
+    return value
+
+
+def _ndjson(event: Dict[str, Any]) -> bytes:
+    return (json.dumps(event, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def _replay_stream(cached: Dict[str, Any]) -> StreamingResponse:
+    """Stream a cached response through the same event sequence as a live one."""
+    async def cached_events():
+        parser = IncrementalJSONParser(lambda path: _stream_event_for(path) is not None)
+        for path, value in parser.feed(json.dumps(cached)):
+            yield _ndjson({"event": _stream_event_for(path), "path": list(path), "data": value})
+        yield _ndjson({"event": "result", "data": cached})
+
+    return StreamingResponse(cached_events(), media_type="application/x-ndjson")
+
+
+# Streaming build view endpoint. Emits NDJSON events while the model generates:
+# {"event": "message"|"step"|"view"|"tag"|"component", "path": [...], "data": ...}
+# followed by {"event": "result", "data": AgentResponse} or {"event": "error", ...}.
+@app.post("/agent/build_view/stream")
+async def build_view_stream(body: AgentRequest):
+    with span("history"):
+        history = await _conversation_history(body.conversation_id)
+    with span("semantic_cache"):
+        semantic_hit, prompt_vec, context_key = await _semantic_lookup(body, history)
+    if semantic_hit is not None:
+        await _remember_turn(body.conversation_id, body.prompt, _build_view_turn(semantic_hit))
+        return _replay_stream(semantic_hit)
+
+    with span("prompt"):
+        messages, rag_context = await _build_view_messages(body, history, prompt_vec)
+    cache_key = _response_cache_key(body, messages, rag_context, history)
+    cached = await _cached_response(body, cache_key)
+    if cached is not None:
+        await _remember_turn(body.conversation_id, body.prompt, _build_view_turn(cached))
+        return _replay_stream(cached)
+
+    # The admission slot is held until the stream ends. It is given back exactly once:
+    # by events() when the stream finishes, or by the response's background task when
+    # the generator never ran to completion (client disconnect, response dropped).
+    with span("queue"):
+        await LLM_ADMISSION.acquire(body.priority)
+    t_admit = time.perf_counter()
+    stream = LLM_ROUTER.astream(LLM_BUILD_MAX_TOKENS, LLM_CONNECT_TIMEOUT, LLM_BUILD_READ_TIMEOUT, messages, _build_view_extra(body))
+    released = False
+
+    async def release_slot():
+        nonlocal released
+        if released:
+            return
+        released = True
+        LLM_ADMISSION.release(time.perf_counter() - t_admit)
         try:
-            repaired_str = repair_json(json_str)
-            parsed = json.loads(repaired_str)
-        except Exception as e2:
-            raise HTTPException(
-                status_code=500,
-                detail=f"LLM did not return valid JSON even after repair: {e2}",
-            )
-
-    # 3) If model ever wraps in a list, unwrap element 0
-    if isinstance(parsed, list):
-        if parsed and isinstance(parsed[0], dict):
-            parsed = parsed[0]
-        else:
-            raise HTTPException(
-                status_code=500,
-                detail="LLM returned a list but no dict inside.",
-            )
-
-    if not isinstance(parsed, dict):
-        raise HTTPException(
-            status_code=500,
-            detail="LLM JSON top-level is not an object.",
-        )
-
-    # 4) Ensure required keys exist, with safe defaults
-    if "message" not in parsed:
-        parsed["message"] = "No explanation provided by model."
-
-    if "steps" not in parsed or not isinstance(parsed["steps"], list):
-        parsed["steps"] = []
-
-    if "proposed_changes" not in parsed or not isinstance(parsed["proposed_changes"], dict):
-        parsed["proposed_changes"] = {"hmi": {}}
-
-    # Normalize misplaced top-level keys into proposed_changes for compatibility
-    pc = parsed.get("proposed_changes")
-    if isinstance(pc, dict):
-        # Accept either singular or plural variants from LLM
-        if "tags_to_add" in parsed and "tags_to_add" not in pc:
-            pc["tags_to_add"] = parsed.pop("tags_to_add")
-        if "component_to_add" in parsed and "component_to_add" not in pc:
-            pc["component_to_add"] = parsed.pop("component_to_add")
-        if "components_to_add" in parsed and "component_to_add" not in pc and "components_to_add" not in pc:
-            # prefer normalized singular key inside proposed_changes
-            pc["component_to_add"] = parsed.pop("components_to_add")
-        # Ensure keys exist with safe defaults
-        if "tags_to_add" not in pc:
-            pc["tags_to_add"] = {}
-        if "component_to_add" not in pc and "components_to_add" not in pc:
-            pc["component_to_add"] = {}
-
-    # 5) Build typed response
+            await stream.aclose()
+        except RuntimeError:
+            pass  # still running in the abandoned generator; it is closed with it
+
+    # Wait for the first token so connection errors still map to an HTTP status
     try:
-        resp_obj = AgentResponse(**parsed)
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"LLM JSON missing required fields: {e}",
-        )
+        first = await stream.__anext__()
+    except StopAsyncIteration:
+        first = ""
+    except BaseException:
+        await release_slot()
+        raise
+
+    async def events():
+        parser = IncrementalJSONParser(lambda path: _stream_event_for(path) is not None)
+        chunks: List[str] = []
+
+        def emit(delta: str):
+            chunks.append(delta)
+            for path, value in parser.feed(delta):
+                event = _stream_event_for(path)
+                yield _ndjson({"event": event, "path": list(path), "data": _stream_data(event, value)})
+
+        try:
+            for line in emit(first):
+                yield line
+            async for delta in stream:
+                for line in emit(delta):
+                    yield line
+            # Validate the assembled object exactly like the non-streaming route
+            raw = "".join(chunks)
+            await run_in_threadpool(record_output, resolve_output_mode(body.output_mode), raw, time.perf_counter() - t_admit)
+            with span("parse"):
+                resp_obj = parse_agent_response(raw, body.context)
+            await _store_response(cache_key, resp_obj, body, prompt_vec, context_key)
+            result = jsonable_encoder(resp_obj)
+            await _remember_turn(body.conversation_id, body.prompt, _build_view_turn(result))
+            yield _ndjson({"event": "result", "data": result})
+        except HTTPException as e:
+            yield _ndjson({"event": "error", "status": e.status_code, "detail": e.detail})
+        finally:
+            await release_slot()
 
-    return resp_obj
\ No newline at end of file
+    return StreamingResponse(events(), media_type="application/x-ndjson", background=BackgroundTask(release_slot))
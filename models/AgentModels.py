@@ -10,6 +10,10 @@ class AgentRequest(BaseModel):
     prompt: str
     context: Optional[Dict[str, Any]] = None  # current views/tags, etc.
     conversation_id: Optional[str] = None
+    use_cache: bool = True  # False = skip response cache lookup (result is still stored)
+    use_semantic_cache: bool = True  # False = skip the paraphrase (embedding) cache
+    priority: str = "normal"  # LLM queue lane when the backend is busy: "high" | "normal" | "low"
+    output_mode: Optional[str] = None  # "full" | "patch"; None = server default (LLM_OUTPUT_MODE)
 
 class AgentResponse(BaseModel):
     message: str
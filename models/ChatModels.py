@@ -7,3 +7,4 @@ class ChatRequest(BaseModel):
 
 class ChatResponse(BaseModel):
     reply: str
+    conversation_id: Optional[str] = None  # generated when the request had none
@@ -0,0 +1,75 @@
+from typing import Any, Dict, List, Literal, Optional, Union
+from pydantic import BaseModel
+
+# Shapes of the HMI objects the agent proposes. These mirror
+# ai_reference/hmi_config_layout_description.txt and are used to derive the
+# JSON Schema / grammar for constrained decoding; AgentResponse itself keeps
+# proposed_changes as a free-form dict so clients are unaffected.
+
+class HmiComponent(BaseModel):
+    id: str
+    viewId: str
+    type: str
+    typeAbbr: str
+    comptName: str
+    visibility: bool
+    w: float
+    h: float
+    y: float
+    x: float
+    zIndex: int
+    rotationAngle: float
+    sizeMode: str
+    config: Dict[str, Any]
+    animation: Dict[str, str]
+    events: Dict[str, str]
+
+class HmiViewConfig(BaseModel):
+    width: float
+    height: float
+    style: Dict[str, Any]
+    sizeMode: str
+
+class HmiView(BaseModel):
+    id: str
+    name: str
+    type: str
+    config: HmiViewConfig
+    components: List[HmiComponent]
+
+class HmiViewsTreeItem(BaseModel):
+    name: str
+    type: str
+    id: str
+
+class HmiGeneral(BaseModel):
+    viewsTree: List[HmiViewsTreeItem]
+
+class HmiChanges(BaseModel):
+    views: List[HmiView]
+    general: HmiGeneral
+
+class HmiTagConfig(BaseModel):
+    # Folder tags only carry hidden/editable
+    persistent: Optional[bool] = None
+    historic: Optional[bool] = None
+    hidden: Optional[bool] = None
+    editable: Optional[bool] = None
+
+class HmiTag(BaseModel):
+    arraydim: int
+    datatype: str
+    value: Optional[Union[float, str]] = None
+    config: Optional[HmiTagConfig] = None
+    children: Optional[Dict[str, "HmiTag"]] = None  # Folder tags: {childName: tag}
+
+class ProposedChanges(BaseModel):
+    hmi: HmiChanges
+    tags_to_add: List[Dict[str, HmiTag]]
+    components_to_add: List[HmiComponent]
+
+class HmiPatchOp(BaseModel):
+    """One edit in patch output mode (see utils/apply_agent_patch.py)."""
+    op: Literal["add", "replace", "merge", "remove"]
+    path: str
+    value: Any  # null for "remove"; required so the grammar always emits it
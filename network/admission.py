@@ -0,0 +1,184 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+from fastapi import HTTPException
+
+# --------------------
+# Admission control in front of the LLM backend
+# --------------------
+# At most LLM_MAX_CONCURRENCY generations run at once; further requests wait
+# in per-priority lanes (high before normal before low, FIFO within a lane).
+# A full lane or a wait longer than LLM_QUEUE_TIMEOUT_SEC is answered with
+# 429 + Retry-After instead of letting every request time out at the backend.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "2"))
+LLM_QUEUE_TIMEOUT_SEC = float(os.getenv("LLM_QUEUE_TIMEOUT_SEC", "60"))
+# Max waiting requests per lane, "lane:limit,..."; low priority is shed first
+LLM_QUEUE_LIMITS = os.getenv("LLM_QUEUE_LIMITS", "high:16,normal:16,low:4")
+LANES = ("high", "normal", "low")
+
+
+def _parse_limits(spec: str) -> Dict[str, int]:
+    limits = {lane: 16 for lane in LANES}
+    for part in spec.split(","):
+        lane, _, value = part.strip().partition(":")
+        if lane in limits and value.strip().isdigit():
+            limits[lane] = int(value)
+    return limits
+
+
+class AdmissionController:
+    """Concurrency limit + bounded priority wait queue (single event loop)."""
+
+    def __init__(self, max_concurrency: int, queue_limits: Dict[str, int], queue_timeout: float):
+        self.max_concurrency = max(1, max_concurrency)
+        self.queue_limits = queue_limits
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._lanes: Dict[str, Deque[asyncio.Future]] = {lane: deque() for lane in LANES}
+        # EWMA of how long a slot is held, used for Retry-After
+        self._service_ewma = 10.0
+        self.stats = {
+            "admitted": 0,
+            "queued": 0,
+            "rejected_full": 0,
+            "rejected_timeout": 0,
+            "wait_ms_total": 0.0,
+            "wait_ms_max": 0.0,
+            "wait_ms_last": 0.0,
+        }
+
+    def _queued(self) -> int:
+        return sum(len(q) for q in self._lanes.values())
+
+    def retry_after(self) -> int:
+        """Seconds until a new request would likely get a slot."""
+        backlog = self._queued() + 1
+        return max(1, math.ceil(self._service_ewma * backlog / self.max_concurrency))
+
+    def _reject(self, reason: str, detail: str) -> HTTPException:
+        self.stats[reason] += 1
+        return HTTPException(
+            status_code=429,
+            detail=detail,
+            headers={"Retry-After": str(self.retry_after())},
+        )
+
+    async def acquire(self, lane: str = "normal") -> None:
+        lane = lane if lane in self._lanes else "normal"
+        t0 = time.perf_counter()
+        if self.active < self.max_concurrency and self._queued() == 0:
+            self.active += 1
+            self._record_wait(t0)
+            return
+
+        queue = self._lanes[lane]
+        if len(queue) >= self.queue_limits.get(lane, 0):
+            raise self._reject("rejected_full", f"LLM queue full ({lane} lane); retry later")
+
+        fut: asyncio.Future = asyncio.get_running_loop().create_future()
+        queue.append(fut)
+        self.stats["queued"] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            if fut.done() and not fut.cancelled():
+                # Slot was handed over just as the timer fired; keep it
+                self._record_wait(t0)
+                return
+            fut.cancel()
+            self._discard(queue, fut)
+            raise self._reject("rejected_timeout", f"Waited {self.queue_timeout:.0f}s for an LLM slot; retry later")
+        except asyncio.CancelledError:
+            # Client went away: give back a slot we may already have been handed
+            if fut.done() and not fut.cancelled():
+                self.release(record=False)
+            else:
+                fut.cancel()
+                self._discard(queue, fut)
+            raise
+        self._record_wait(t0)
+
+    @staticmethod
+    def _discard(queue: Deque[asyncio.Future], fut: asyncio.Future) -> None:
+        try:
+            queue.remove(fut)
+        except ValueError:
+            pass
+
+    def _record_wait(self, t0: float) -> None:
+        ms = (time.perf_counter() - t0) * 1000
+        self.stats["admitted"] += 1
+        self.stats["wait_ms_total"] += ms
+        self.stats["wait_ms_last"] = round(ms, 2)
+        self.stats["wait_ms_max"] = round(max(self.stats["wait_ms_max"], ms), 2)
+
+    def release(self, held_sec: Optional[float] = None, record: bool = True) -> None:
+        if record and held_sec is not None:
+            self._service_ewma = 0.8 * self._service_ewma + 0.2 * held_sec
+        # Hand the slot straight to the next waiter, highest priority first
+        for lane in LANES:
+            queue = self._lanes[lane]
+            while queue:
+                fut = queue.popleft()
+                if not fut.done():
+                    fut.set_result(None)
+                    return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self, lane: str = "normal"):
+        await self.acquire(lane)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - t0)
+
+    def get_stats(self) -> Dict[str, Any]:
+        admitted = self.stats["admitted"] or 1
+        return {
+            **self.stats,
+            "wait_ms_total": round(self.stats["wait_ms_total"], 2),
+            "wait_ms_avg": round(self.stats["wait_ms_total"] / admitted, 2),
+            "active": self.active,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": {lane: len(q) for lane, q in self._lanes.items()},
+            "queue_limits": self.queue_limits,
+            "service_sec_ewma": round(self._service_ewma, 3),
+            "retry_after_sec": self.retry_after(),
+        }
+
+
+class SingleFlight:
+    """Identical concurrent requests share one in-flight generation."""
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.stats = {"leaders": 0, "coalesced": 0}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            self.stats["leaders"] += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _t, k=key: self._inflight.pop(k, None))
+        else:
+            self.stats["coalesced"] += 1
+        # shield: one caller disconnecting must not cancel the shared generation
+        return await asyncio.shield(task)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "in_flight": len(self._inflight)}
+
+
+LLM_ADMISSION = AdmissionController(
+    LLM_MAX_CONCURRENCY,
+    _parse_limits(LLM_QUEUE_LIMITS),
+    LLM_QUEUE_TIMEOUT_SEC,
+)
+LLM_SINGLE_FLIGHT = SingleFlight()
@@ -1,40 +1,165 @@
-from http.client import HTTPException
-from typing import Dict, List
-import requests
+import asyncio
+import json
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+import aiohttp
+from fastapi import HTTPException
+from network.llm_session import get_llm_session, llm_timeout
+from network.prefix_cache import record_usage
+from utils.metrics import inc, record_llm_usage, record_stage
 
-# Call the LLM with given messages and return the response content
-def call_llm(url, model, max_tokens, connect_timeout, read_timeout, messages: List[Dict[str, str]]) -> str:
+
+# Connect timeouts (aiohttp >= 3.10) are failover-safe too, unlike read timeouts
+_CONNECT_ERRORS = (aiohttp.ClientConnectorError, getattr(aiohttp, "ConnectionTimeoutError", aiohttp.ClientConnectorError))
+
+
+class LLMConnectError(HTTPException):
+    """The LLM server could not be reached (nothing was sent); safe to retry elsewhere."""
+
+    def __init__(self, detail: str):
+        super().__init__(status_code=500, detail=detail)
+
+
+def _build_payload(model, max_tokens, messages: List[Dict[str, str]], extra: Optional[Dict[str, Any]] = None) -> Dict:
     payload = {
         "model": model,
         "messages": messages,
         "temperature": 0.3, # low temperature for more deterministic output, higher for more creative
         "max_tokens": max_tokens, # limit response length. max tokens are approx 4 chars each. default 2048===>8192 chars
     }
+    # Backend-specific fields (response_format, grammar, ...)
+    if extra:
+        payload.update(extra)
+    return payload
+
+
+def _extract_content(data) -> str:
+    try:
+        return data["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError) as e:
+        raise HTTPException(status_code=500, detail=f"Bad LLM response: {e}")
+
+
+def _record_call(data: Any, t0: float) -> None:
+    elapsed = time.perf_counter() - t0
+    record_usage(data)
+    record_stage("llm", elapsed)
+    record_llm_usage("call", data, elapsed)
+    _count_call("call", "ok")
+
+
+def _count_call(mode: str, outcome: str) -> None:
+    inc("durus_llm_calls_total", labels={"mode": mode, "outcome": outcome})
+
+
+# Call the LLM with given messages and return the response content.
+# Uses the shared keep-alive session; does not hold a worker thread while waiting on the generation.
+async def acall_llm(url, model, max_tokens, connect_timeout, read_timeout, messages: List[Dict[str, str]], extra: Optional[Dict[str, Any]] = None) -> str:
+    payload = _build_payload(model, max_tokens, messages, extra)
+    session = get_llm_session()
+    t0 = time.perf_counter()
 
     try:
         print("\n[AGENT DEBUG] Calling LLM:", url)
-        # Avoid logging full payload content to keep logs tidy
         print("[AGENT DEBUG] Model:", payload.get("model"), "Messages:", len(payload.get("messages", [])))
-        resp = requests.post(
+        async with session.post(
             url,
             json=payload,
-            timeout=(connect_timeout, read_timeout),
-        )
-        resp.raise_for_status()                             
-    except requests.Timeout as e:
+            timeout=llm_timeout(connect_timeout, read_timeout),
+        ) as resp:
+            if resp.status != 200:
+                text = await resp.text()
+                _count_call("call", "error")
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"LLM error: {resp.status} {text[:200]}",
+                )
+            try:
+                data = await resp.json(content_type=None)
+            except ValueError as e:
+                # 200 with an HTML/plain-text body, e.g. a proxy error page
+                _count_call("call", "error")
+                raise HTTPException(status_code=502, detail=f"LLM returned non-JSON response: {e}")
+    except _CONNECT_ERRORS as e:
+        _count_call("call", "connect_error")
+        print("\n[AGENT DEBUG] LLM connect failed:", e, "\n")
+        raise LLMConnectError(f"Error calling LLM: {e}")
+    except asyncio.TimeoutError as e:
+        _count_call("call", "timeout")
         raise HTTPException(status_code=504, detail=f"LLM read timeout: {e}")
-    except requests.RequestException as e:
+    except aiohttp.ClientError as e:
+        _count_call("call", "error")
         print("\n[AGENT DEBUG] LLM call failed:", e, "\n")
         raise HTTPException(status_code=500, detail=f"Error calling LLM: {e}")
 
-    if resp.status_code != 200:
-        raise HTTPException(
-            status_code=500,
-            detail=f"LLM error: {resp.status_code} {resp.text[:200]}",
-        )
+    _record_call(data, t0)
+    return _extract_content(data)
+
+
+# Streaming variant: requests `stream: true` and yields content deltas as the
+# OpenAI-compatible server emits them (SSE "data: {...}" lines).
+async def astream_llm(url, model, max_tokens, connect_timeout, read_timeout, messages: List[Dict[str, str]], extra: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+    payload = _build_payload(model, max_tokens, messages, extra)
+    payload["stream"] = True
+    session = get_llm_session()
+    t0 = time.perf_counter()
+    ttft: Optional[float] = None
+    chunks = 0
+    final: Dict[str, Any] = {}
 
-    data = resp.json()
     try:
-        return data["choices"][0]["message"]["content"]
-    except (KeyError, IndexError, TypeError) as e:
-        raise HTTPException(status_code=500, detail=f"Bad LLM response: {e}")
+        print("\n[AGENT DEBUG] Streaming LLM:", url)
+        print("[AGENT DEBUG] Model:", payload.get("model"), "Messages:", len(payload.get("messages", [])))
+        async with session.post(
+            url,
+            json=payload,
+            timeout=llm_timeout(connect_timeout, read_timeout),
+        ) as resp:
+            if resp.status != 200:
+                text = await resp.text()
+                _count_call("stream", "error")
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"LLM error: {resp.status} {text[:200]}",
+                )
+            async for line in resp.content:
+                line = line.strip()
+                if not line.startswith(b"data:"):
+                    continue
+                data = line[5:].strip()
+                if data == b"[DONE]":
+                    break
+                try:
+                    chunk = json.loads(data)
+                except ValueError:
+                    continue
+                # Usage/timings arrive on the last chunk(s), possibly without choices
+                if isinstance(chunk, dict) and ("usage" in chunk or "timings" in chunk):
+                    record_usage(chunk)
+                    final.update({k: chunk[k] for k in ("usage", "timings") if chunk.get(k)})
+                try:
+                    delta = chunk["choices"][0].get("delta") or {}
+                except (KeyError, IndexError, TypeError, AttributeError):
+                    continue
+                content = delta.get("content")
+                if content:
+                    if ttft is None:
+                        ttft = time.perf_counter() - t0
+                    chunks += 1
+                    yield content
+    except _CONNECT_ERRORS as e:
+        _count_call("stream", "connect_error")
+        print("\n[AGENT DEBUG] LLM connect failed:", e, "\n")
+        raise LLMConnectError(f"Error calling LLM: {e}")
+    except asyncio.TimeoutError as e:
+        _count_call("stream", "timeout")
+        raise HTTPException(status_code=504, detail=f"LLM read timeout: {e}")
+    except aiohttp.ClientError as e:
+        _count_call("stream", "error")
+        print("\n[AGENT DEBUG] LLM stream failed:", e, "\n")
+        raise HTTPException(status_code=500, detail=f"Error calling LLM: {e}")
+
+    elapsed = time.perf_counter() - t0
+    record_stage("llm", elapsed)
+    record_llm_usage("stream", final, elapsed, ttft, chunks)
+    _count_call("stream", "ok")
@@ -0,0 +1,122 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+# --------------------
+# Hedged / parallel-candidate generation
+# --------------------
+#   off   - one attempt (default)
+#   hedge - start one attempt; if it has not finished by the p<LLM_HEDGE_PERCENTILE>
+#           latency of recent generations, or it fails (LLM error, invalid JSON),
+#           start another. The first attempt that validates wins; the rest are cancelled.
+#   race  - start LLM_RACE_CANDIDATES attempts at once; the first valid one wins.
+# Extra attempts use LLM_HEDGE_TEMPERATURE and, since the router prefers the backend
+# with the fewest outstanding requests, usually land on another backend.
+LLM_HEDGE_MODE = os.getenv("LLM_HEDGE_MODE", "off").lower()
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+# Deadline used until LLM_HEDGE_MIN_SAMPLES generations have been timed
+LLM_HEDGE_DEFAULT_DELAY_SEC = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY_SEC", "30"))
+LLM_HEDGE_MIN_DELAY_SEC = float(os.getenv("LLM_HEDGE_MIN_DELAY_SEC", "2"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_MAX_ATTEMPTS = int(os.getenv("LLM_HEDGE_MAX_ATTEMPTS", "2"))
+LLM_HEDGE_TEMPERATURE = float(os.getenv("LLM_HEDGE_TEMPERATURE", "0.6"))
+LLM_RACE_CANDIDATES = int(os.getenv("LLM_RACE_CANDIDATES", "2"))
+
+_latencies: Deque[float] = deque(maxlen=200)
+
+HEDGE_STATS: Dict[str, Any] = {
+    "requests": 0,
+    "attempts": 0,
+    "hedged_slow": 0,      # extra attempt started because the deadline passed
+    "hedged_failed": 0,    # extra attempt started because an attempt failed
+    "won_by_first": 0,
+    "won_by_extra": 0,
+    "cancelled": 0,        # losing attempts cancelled
+    "failed": 0,           # every attempt failed
+}
+
+
+def hedge_delay() -> float:
+    """Seconds to wait on the first attempt before hedging."""
+    if len(_latencies) < LLM_HEDGE_MIN_SAMPLES:
+        return LLM_HEDGE_DEFAULT_DELAY_SEC
+    ordered = sorted(_latencies)
+    idx = min(len(ordered) - 1, int(len(ordered) * LLM_HEDGE_PERCENTILE / 100))
+    return max(LLM_HEDGE_MIN_DELAY_SEC, ordered[idx])
+
+
+def attempt_overrides(index: int) -> Optional[Dict[str, Any]]:
+    """Payload overrides for attempt `index` (0 = the normal request)."""
+    return None if index == 0 else {"temperature": LLM_HEDGE_TEMPERATURE}
+
+
+async def hedged(attempt: Callable[[int], Awaitable[Any]], mode: str = LLM_HEDGE_MODE) -> Any:
+    """
+    Run `attempt(i)` (generate + validate, raising on failure) under the
+    hedging `mode` and return the first successful result.
+    """
+    if mode not in ("hedge", "race"):
+        return await attempt(0)
+
+    HEDGE_STATS["requests"] += 1
+    initial = max(1, LLM_RACE_CANDIDATES) if mode == "race" else 1
+    max_attempts = max(LLM_HEDGE_MAX_ATTEMPTS, initial)
+    pending: Set[asyncio.Future] = set()
+    index_of: Dict[asyncio.Future, int] = {}
+    errors: List[BaseException] = []
+
+    async def timed(i: int) -> Any:
+        t0 = time.perf_counter()
+        result = await attempt(i)
+        _latencies.append(time.perf_counter() - t0)
+        return result
+
+    def launch() -> None:
+        i = len(index_of)
+        task = asyncio.ensure_future(timed(i))
+        index_of[task] = i
+        pending.add(task)
+        HEDGE_STATS["attempts"] += 1
+
+    for _ in range(initial):
+        launch()
+    try:
+        while pending:
+            can_hedge = mode == "hedge" and len(index_of) < max_attempts
+            done, _ = await asyncio.wait(
+                pending,
+                timeout=hedge_delay() if can_hedge else None,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not done:
+                HEDGE_STATS["hedged_slow"] += 1
+                print(f"[AGENT DEBUG] Hedging: attempt still running after {hedge_delay():.1f}s, starting another")
+                launch()
+                continue
+            for task in done:
+                pending.discard(task)
+                if task.exception() is None:
+                    HEDGE_STATS["won_by_first" if index_of[task] == 0 else "won_by_extra"] += 1
+                    return task.result()
+                errors.append(task.exception())
+                print(f"[AGENT DEBUG] Hedging: attempt {index_of[task]} failed: {task.exception()}")
+                if len(index_of) < max_attempts:
+                    HEDGE_STATS["hedged_failed"] += 1
+                    launch()
+        HEDGE_STATS["failed"] += 1
+        raise errors[-1]
+    finally:
+        for task in pending:
+            task.cancel()
+            HEDGE_STATS["cancelled"] += 1
+
+
+def get_hedge_stats() -> Dict[str, Any]:
+    return {
+        **HEDGE_STATS,
+        "mode": LLM_HEDGE_MODE,
+        "delay_sec": round(hedge_delay(), 3),
+        "samples": len(_latencies),
+    }
@@ -0,0 +1,201 @@
+import asyncio
+import os
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+from fastapi import HTTPException
+from network._llm_models_url import _llm_models_url
+from network.call_llm import LLMConnectError, acall_llm, astream_llm
+from network.llm_session import get_llm_session, llm_timeout
+
+# --------------------
+# Multi-backend LLM routing
+# --------------------
+# LLM_BACKENDS lists several OpenAI-compatible servers as "url|model|weight"
+# entries separated by commas (model and weight optional), e.g.
+#   http://mlx-1:8080/v1/chat/completions|mlx-community/Llama-3.1-8B|2,http://gpu-1:8080/v1/chat/completions
+# Unset = the single LLM_API_URL / LLM_MODEL_NAME backend.
+LLM_BACKENDS = os.getenv("LLM_BACKENDS", "")
+LLM_HEALTH_INTERVAL_SEC = float(os.getenv("LLM_HEALTH_INTERVAL_SEC", "10"))
+# A backend failing a probe or a connect is skipped for this long
+LLM_EJECT_COOLDOWN_SEC = float(os.getenv("LLM_EJECT_COOLDOWN_SEC", "30"))
+_EWMA_ALPHA = 0.2
+
+
+class Backend:
+    def __init__(self, url: str, model: str, weight: float = 1.0):
+        self.url = url
+        self.model = model
+        self.weight = max(weight, 0.01)
+        self.models_url = _llm_models_url(url)
+        self.outstanding = 0
+        self.ewma_ms: Optional[float] = None
+        self.ejected_until = 0.0
+        self.last_probe: Dict[str, Any] = {}
+        self.stats = {"requests": 0, "errors": 0, "connect_errors": 0, "ejections": 0}
+
+    def available(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+    def eject(self, reason: str) -> None:
+        if self.available(time.monotonic()):
+            self.stats["ejections"] += 1
+            print(f"[AGENT DEBUG] LLM backend {self.url} ejected for {LLM_EJECT_COOLDOWN_SEC:.0f}s: {reason}")
+        self.ejected_until = time.monotonic() + LLM_EJECT_COOLDOWN_SEC
+
+    def observe(self, elapsed_ms: float) -> None:
+        if self.ewma_ms is None:
+            self.ewma_ms = elapsed_ms
+        else:
+            self.ewma_ms = (1 - _EWMA_ALPHA) * self.ewma_ms + _EWMA_ALPHA * elapsed_ms
+
+    def load_key(self):
+        # Least outstanding (per unit weight) first; EWMA latency breaks ties
+        return (self.outstanding / self.weight, (self.ewma_ms or 0.0) / self.weight)
+
+    def info(self) -> Dict[str, Any]:
+        remaining = self.ejected_until - time.monotonic()
+        return {
+            "url": self.url,
+            "model": self.model,
+            "weight": self.weight,
+            "healthy": remaining <= 0,
+            "ejected_for_sec": round(remaining, 1) if remaining > 0 else 0,
+            "outstanding": self.outstanding,
+            "ewma_ms": round(self.ewma_ms, 1) if self.ewma_ms is not None else None,
+            **self.stats,
+            "last_probe": self.last_probe,
+        }
+
+
+def parse_backends(spec: str, default_url: str, default_model: str) -> List[Backend]:
+    backends: List[Backend] = []
+    for entry in spec.split(","):
+        parts = [p.strip() for p in entry.split("|")]
+        if not parts[0]:
+            continue
+        model = parts[1] if len(parts) > 1 and parts[1] else default_model
+        weight = float(parts[2]) if len(parts) > 2 and parts[2] else 1.0
+        backends.append(Backend(parts[0], model, weight))
+    return backends or [Backend(default_url, default_model)]
+
+
+class LLMRouter:
+    """Picks a backend per call, fails over on connect errors, health-checks in the background."""
+
+    def __init__(self, backends: List[Backend]):
+        self.backends = backends
+        self.stats = {"failovers": 0}
+        self._health_task: Optional[asyncio.Task] = None
+
+    def pick(self, exclude: Set[int]) -> Optional[Backend]:
+        now = time.monotonic()
+        candidates = [b for b in self.backends if id(b) not in exclude]
+        if not candidates:
+            return None
+        healthy = [b for b in candidates if b.available(now)]
+        # All ejected: try the one that comes back soonest rather than failing outright
+        if not healthy:
+            return min(candidates, key=lambda b: b.ejected_until)
+        return min(healthy, key=Backend.load_key)
+
+    async def acall(self, max_tokens, connect_timeout, read_timeout, messages: List[Dict[str, str]], extra: Optional[Dict[str, Any]] = None) -> str:
+        tried: Set[int] = set()
+        while True:
+            backend = self.pick(tried)
+            tried.add(id(backend))
+            backend.outstanding += 1
+            backend.stats["requests"] += 1
+            t0 = time.perf_counter()
+            try:
+                raw = await acall_llm(backend.url, backend.model, max_tokens, connect_timeout, read_timeout, messages, extra)
+            except LLMConnectError as e:
+                self._connect_failed(backend, e)
+                if self.pick(tried) is None:
+                    raise
+                self.stats["failovers"] += 1
+                continue
+            except HTTPException:
+                backend.stats["errors"] += 1
+                raise
+            finally:
+                backend.outstanding -= 1
+            backend.observe((time.perf_counter() - t0) * 1000)
+            return raw
+
+    async def astream(self, max_tokens, connect_timeout, read_timeout, messages: List[Dict[str, str]], extra: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        tried: Set[int] = set()
+        while True:
+            backend = self.pick(tried)
+            tried.add(id(backend))
+            backend.outstanding += 1
+            backend.stats["requests"] += 1
+            t0 = time.perf_counter()
+            stream = astream_llm(backend.url, backend.model, max_tokens, connect_timeout, read_timeout, messages, extra)
+            try:
+                # Fail over only before the first token; after that the stream is committed
+                try:
+                    first = await stream.__anext__()
+                except StopAsyncIteration:
+                    first = None
+                except LLMConnectError as e:
+                    self._connect_failed(backend, e)
+                    if self.pick(tried) is None:
+                        raise
+                    self.stats["failovers"] += 1
+                    continue
+                if first is not None:
+                    yield first
+                    async for delta in stream:
+                        yield delta
+                backend.observe((time.perf_counter() - t0) * 1000)
+                return
+            except HTTPException as e:
+                if not isinstance(e, LLMConnectError):
+                    backend.stats["errors"] += 1
+                raise
+            finally:
+                backend.outstanding -= 1
+                await stream.aclose()
+
+    def _connect_failed(self, backend: Backend, e: HTTPException) -> None:
+        backend.stats["errors"] += 1
+        backend.stats["connect_errors"] += 1
+        backend.eject(str(e.detail))
+
+    async def probe(self, backend: Backend) -> None:
+        """GET /v1/models; ejects on failure, readmits on success."""
+        t0 = time.perf_counter()
+        try:
+            async with get_llm_session().get(backend.models_url, timeout=llm_timeout(5, 5)) as r:
+                await r.read()
+            ok, status, error = r.status == 200, r.status, None
+        except Exception as e:
+            ok, status, error = False, None, str(e) or type(e).__name__
+        backend.last_probe = {"ok": ok, "status": status, "elapsed_ms": round((time.perf_counter() - t0) * 1000, 1)}
+        if error:
+            backend.last_probe["error"] = error
+        if ok:
+            backend.ejected_until = 0.0
+        else:
+            backend.eject(f"health probe failed ({error or status})")
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.gather(*(self.probe(b) for b in self.backends))
+            await asyncio.sleep(LLM_HEALTH_INTERVAL_SEC)
+
+    def start_health_checks(self) -> None:
+        if self._health_task is None and LLM_HEALTH_INTERVAL_SEC > 0:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def stop_health_checks(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        return [b.info() for b in self.backends]
@@ -0,0 +1,47 @@
+import os
+from typing import Optional
+import aiohttp
+
+# Shared keep-alive connection pool for all async LLM calls.
+# One ClientSession per process; connections are reused across requests
+# instead of opening a new TCP connection for every generation.
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "32"))
+LLM_POOL_PER_HOST = int(os.getenv("LLM_POOL_PER_HOST", "8"))
+LLM_POOL_KEEPALIVE = float(os.getenv("LLM_POOL_KEEPALIVE", "60"))
+
+_session: Optional[aiohttp.ClientSession] = None
+
+
+def get_llm_session() -> aiohttp.ClientSession:
+    """Return the shared aiohttp session, creating it on first use.
+
+    Must be called from inside a running event loop.
+    """
+    global _session
+
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=LLM_POOL_SIZE,
+            limit_per_host=LLM_POOL_PER_HOST,
+            keepalive_timeout=LLM_POOL_KEEPALIVE,
+        )
+        _session = aiohttp.ClientSession(connector=connector)
+    return _session
+
+
+def llm_timeout(connect_timeout: float, read_timeout: float) -> aiohttp.ClientTimeout:
+    """Map the (connect, read) timeout pair used with requests onto aiohttp."""
+    return aiohttp.ClientTimeout(
+        total=None,
+        sock_connect=connect_timeout,
+        sock_read=read_timeout,
+    )
+
+
+async def close_llm_session() -> None:
+    """Close the shared session (called on app shutdown)."""
+    global _session
+
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
@@ -0,0 +1,85 @@
+import hashlib
+import os
+import threading
+from typing import Any, Dict, Optional
+
+# --------------------
+# Prompt prefix (KV cache) reuse
+# --------------------
+# With LLM_PREFIX_REUSE=1, build_view sends one byte-identical system prefix
+# (instructions + static component reference) and puts everything that varies
+# per request in the user turn, so the backend can reuse the prefix's KV cache.
+LLM_PREFIX_REUSE = os.getenv("LLM_PREFIX_REUSE", "0") == "1"
+# Backend cache hints: "llamacpp" (cache_prompt + id_slot) or "none"
+# (mlx-lm and vLLM reuse prefixes automatically and take no extra fields)
+LLM_CACHE_HINTS = os.getenv("LLM_CACHE_HINTS", "llamacpp").lower()
+# llama.cpp server slots (--parallel N); 0 = let the server pick a slot
+LLM_SLOT_COUNT = int(os.getenv("LLM_SLOT_COUNT", "0"))
+
+PREFIX_STATS: Dict[str, Any] = {
+    "responses": 0,         # LLM responses that reported prompt token usage
+    "prompt_tokens": 0,
+    "cached_tokens": 0,     # prompt tokens served from the backend's KV/prefix cache
+    "last": {},
+}
+_stats_lock = threading.Lock()
+
+
+def slot_for(session_key: Optional[str]) -> Optional[int]:
+    """Stable slot for a conversation/device so its KV cache stays on one slot."""
+    if not session_key or LLM_SLOT_COUNT <= 0:
+        return None
+    digest = hashlib.sha1(session_key.encode("utf-8")).digest()
+    return int.from_bytes(digest[:4], "big") % LLM_SLOT_COUNT
+
+
+def cache_hints(session_key: Optional[str] = None) -> Dict[str, Any]:
+    """Extra payload fields asking the backend to keep and reuse the prompt cache."""
+    if LLM_CACHE_HINTS != "llamacpp":
+        return {}
+    hints: Dict[str, Any] = {"cache_prompt": True}
+    slot = slot_for(session_key)
+    if slot is not None:
+        hints["id_slot"] = slot
+    return hints
+
+
+def record_usage(data: Any) -> None:
+    """Record prompt/cached token counts from an LLM response (or final stream chunk).
+
+    Understands OpenAI-style usage.prompt_tokens_details.cached_tokens and
+    llama.cpp timings (prompt_n = newly evaluated, cache_n = reused).
+    """
+    if not isinstance(data, dict):
+        return
+    prompt = cached = None
+    timings = data.get("timings")
+    if isinstance(timings, dict) and "prompt_n" in timings:
+        cached = int(timings.get("cache_n") or 0)
+        prompt = int(timings.get("prompt_n") or 0) + cached
+    usage = data.get("usage")
+    if prompt is None and isinstance(usage, dict) and usage.get("prompt_tokens") is not None:
+        prompt = int(usage["prompt_tokens"])
+        details = usage.get("prompt_tokens_details") or {}
+        cached = int(details.get("cached_tokens") or 0)
+    if prompt is None:
+        return
+
+    with _stats_lock:
+        PREFIX_STATS["responses"] += 1
+        PREFIX_STATS["prompt_tokens"] += prompt
+        PREFIX_STATS["cached_tokens"] += cached
+        PREFIX_STATS["last"] = {"prompt_tokens": prompt, "cached_tokens": cached}
+    print(f"[AGENT DEBUG] Prefill: {prompt} prompt tokens, {cached} reused from cache")
+
+
+def get_prefix_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        total = PREFIX_STATS["prompt_tokens"]
+        return {
+            **PREFIX_STATS,
+            "reuse_ratio": round(PREFIX_STATS["cached_tokens"] / total, 4) if total else 0.0,
+            "enabled": LLM_PREFIX_REUSE,
+            "cache_hints": LLM_CACHE_HINTS,
+            "slot_count": LLM_SLOT_COUNT,
+        }
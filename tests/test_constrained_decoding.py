@@ -0,0 +1,157 @@
+import json
+import re
+from functools import lru_cache
+from pathlib import Path
+
+from view_creation.build_agent_response_schema import (
+    ConstrainedAgentResponse,
+    build_agent_response_grammar,
+    build_agent_response_schema,
+)
+
+ROOT = Path(__file__).resolve().parent.parent
+# Recorded answer with nested Folder tags (Status -> System -> status/name)
+FOLDER_RESPONSE = ROOT / "assistantResponses" / "assistantResponse9.json"
+
+_TOKEN = re.compile(r'\s*("(?:[^"\\]|\\.)*"|\[(?:[^\]\\]|\\.)*\]|[a-z0-9-]+|\{\d+,\d+\}|[()|*+?])')
+_ESCAPES = {"t": "\t", "n": "\n", "r": "\r", "\\": "\\", '"': '"', "]": "]", "-": "-", "^": "^"}
+
+
+def _class_chars(body: str):
+    """Characters/ranges of a GBNF [...] class body."""
+    chars, i = [], 0
+    while i < len(body):
+        if body[i] == "\\":
+            if body[i + 1] == "x":
+                ch, i = chr(int(body[i + 2:i + 4], 16)), i + 4
+            else:
+                ch, i = _ESCAPES[body[i + 1]], i + 2
+        else:
+            ch, i = body[i], i + 1
+        chars.append(ch)
+    ranges, j = [], 0
+    while j < len(chars):
+        if j + 2 < len(chars) and chars[j + 1] == "-":
+            ranges.append((chars[j], chars[j + 2]))
+            j += 3
+        else:
+            ranges.append((chars[j], chars[j]))
+            j += 1
+    return ranges
+
+
+class _Grammar:
+    """Tiny GBNF recognizer: every node maps a start position to the set of possible end positions."""
+
+    def __init__(self, text: str):
+        self.rules = {}
+        for line in text.strip().splitlines():
+            name, body = line.split(" ::= ", 1)
+            tokens = _TOKEN.findall(body)
+            self.rules[name], rest = self._alt(tokens, 0)
+            assert rest == len(tokens), line
+
+    def _alt(self, tokens, i):
+        seqs = []
+        while True:
+            seq, i = self._seq(tokens, i)
+            seqs.append(seq)
+            if i < len(tokens) and tokens[i] == "|":
+                i += 1
+                continue
+            return ("alt", tuple(seqs)), i
+
+    def _seq(self, tokens, i):
+        items = []
+        while i < len(tokens) and tokens[i] not in ("|", ")"):
+            tok = tokens[i]
+            if tok == "(":
+                node, i = self._alt(tokens, i + 1)
+                i += 1  # ")"
+            elif tok.startswith('"'):
+                node, i = ("lit", json.loads(tok)), i + 1
+            elif tok.startswith("["):
+                neg = tok[1:2] == "^"
+                node, i = ("cls", neg, tuple(_class_chars(tok[2 if neg else 1:-1]))), i + 1
+            else:
+                node, i = ("ref", tok), i + 1
+            if i < len(tokens) and tokens[i] in ("*", "+", "?"):
+                lo, hi = {"*": (0, None), "+": (1, None), "?": (0, 1)}[tokens[i]]
+                node, i = ("rep", node, lo, hi), i + 1
+            elif i < len(tokens) and tokens[i].startswith("{"):
+                lo, hi = map(int, tokens[i][1:-1].split(","))
+                node, i = ("rep", node, lo, hi), i + 1
+            items.append(node)
+        return ("seq", tuple(items)), i
+
+    def matches(self, text: str) -> bool:
+        @lru_cache(maxsize=None)
+        def ends(node, pos):
+            kind = node[0]
+            if kind == "lit":
+                return frozenset([pos + len(node[1])]) if text.startswith(node[1], pos) else frozenset()
+            if kind == "cls":
+                if pos >= len(text):
+                    return frozenset()
+                hit = any(lo <= text[pos] <= hi for lo, hi in node[2])
+                return frozenset([pos + 1]) if hit != node[1] else frozenset()
+            if kind == "ref":
+                return ends(self.rules[node[1]], pos)
+            if kind == "alt":
+                return frozenset().union(*(ends(seq, pos) for seq in node[1]))
+            if kind == "seq":
+                current = frozenset([pos])
+                for item in node[1]:
+                    current = frozenset().union(*(ends(item, p) for p in current)) if current else current
+                return current
+            _, item, lo, hi = node
+            found, frontier, n = set(), {pos}, 0
+            while frontier and (hi is None or n < hi):
+                if n >= lo:
+                    found |= frontier
+                frontier = {e for p in frontier for e in ends(item, p) if e != p}
+                n += 1
+            if n >= lo:
+                found |= frontier
+            return frozenset(found)
+
+        return len(text) in ends(self.rules["root"], 0)
+
+
+def _recorded_response():
+    return json.loads(FOLDER_RESPONSE.read_text(encoding="utf-8"))
+
+
+def test_folder_tags_validate_against_schema():
+    recorded = _recorded_response()
+    parsed = ConstrainedAgentResponse.model_validate(recorded)
+    # Nothing dropped: the recorded response has no property the schema would reject
+    assert parsed.model_dump(exclude_unset=True) == recorded
+    tag = build_agent_response_schema()["$defs"]["HmiTag"]
+    assert tag["additionalProperties"] is False
+    assert tag["required"] == ["arraydim", "datatype"]
+    assert "children" in tag["properties"]
+
+
+def test_folder_tags_match_grammar():
+    grammar = _Grammar(build_agent_response_grammar())
+    # Constrained decoding emits properties in schema order
+    dumped = ConstrainedAgentResponse.model_validate(_recorded_response()).model_dump(exclude_unset=True)
+    assert grammar.matches(json.dumps(dumped, separators=(",", ":"), ensure_ascii=False))
+    assert grammar.matches(json.dumps(dumped, separators=(", ", ": "), ensure_ascii=False))
+
+    bad = json.loads(json.dumps(dumped))
+    bad["proposed_changes"]["tags_to_add"][0]["Status"]["unknown"] = 1
+    assert not grammar.matches(json.dumps(bad, separators=(",", ":")))
+
+
+def test_optional_properties_may_be_omitted():
+    grammar = _Grammar(build_agent_response_grammar())
+    base = {"message": "m", "steps": [], "proposed_changes": {
+        "hmi": {"views": [], "general": {"viewsTree": []}}, "components_to_add": []}}
+    for tag in ({"arraydim": 1, "datatype": "Folder", "config": {}},
+                {"arraydim": 1, "datatype": "Folder", "config": {"hidden": False, "editable": True}, "children": {}},
+                {"arraydim": 1, "datatype": "Number", "value": 0}):
+        doc = {**base, "proposed_changes": {**base["proposed_changes"], "tags_to_add": [{"T": tag}]}}
+        doc["proposed_changes"] = {k: doc["proposed_changes"][k] for k in ("hmi", "tags_to_add", "components_to_add")}
+        assert grammar.matches(json.dumps(doc, separators=(",", ":"))), tag
@@ -0,0 +1,193 @@
+import copy
+from typing import Any, Dict, List, Optional
+
+# Compact output mode: instead of re-emitting whole views, the model returns
+#   "patch": [ {"op": "add" | "replace" | "merge" | "remove", "path": "/hmi/views/<id>/...", "value": ...} ]
+# applied against the controller config in AgentRequest.context. Paths are JSON
+# Pointers where a list item may also be addressed by its id / name / comptName
+# ("-" appends). "merge" is a JSON merge patch (null deletes a key).
+# The result is expanded into the usual proposed_changes shape.
+
+_LIST_KEYS = ("id", "name", "comptName")
+
+
+def _controller_config(context: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """The controller config inside AgentRequest.context (bare or under "controller_config")."""
+    if not isinstance(context, dict):
+        return {}
+    cfg = context.get("controller_config")
+    if isinstance(cfg, dict):
+        return cfg
+    if "hmi" in context or "database" in context:
+        return context
+    return {}
+
+
+def _split(path: str) -> List[str]:
+    if not isinstance(path, str) or not path.startswith("/"):
+        raise ValueError(f"path must start with '/': {path!r}")
+    return [p.replace("~1", "/").replace("~0", "~") for p in path[1:].split("/")]
+
+
+def _list_index(items: List[Any], seg: str) -> Optional[int]:
+    if seg.isdigit():
+        i = int(seg)
+        return i if i < len(items) else None
+    for i, item in enumerate(items):
+        if isinstance(item, dict) and any(item.get(k) == seg for k in _LIST_KEYS):
+            return i
+    return None
+
+
+def _child(node: Any, seg: str, next_seg: Optional[str], create: bool) -> Any:
+    if isinstance(node, dict):
+        if seg not in node or node[seg] is None:
+            if not create:
+                raise KeyError(seg)
+            node[seg] = [] if next_seg == "-" or next_seg == "0" else {}
+        return node[seg]
+    if isinstance(node, list):
+        i = _list_index(node, seg)
+        if i is None:
+            raise KeyError(seg)
+        return node[i]
+    raise KeyError(seg)
+
+
+def _merge(target: Any, value: Any) -> Any:
+    """RFC 7386 JSON merge patch."""
+    if not isinstance(value, dict):
+        return copy.deepcopy(value)
+    if not isinstance(target, dict):
+        target = {}
+    for k, v in value.items():
+        if v is None:
+            target.pop(k, None)
+        else:
+            target[k] = _merge(target.get(k), v)
+    return target
+
+
+def _apply_op(doc: Dict[str, Any], op: str, segs: List[str], value: Any) -> Any:
+    """Apply one op; returns the object now at the path (None after remove)."""
+    parent: Any = doc
+    for i, seg in enumerate(segs[:-1]):
+        parent = _child(parent, seg, segs[i + 1], create=(op in ("add", "merge")))
+    last = segs[-1]
+
+    if isinstance(parent, dict):
+        if op == "remove":
+            if last not in parent:
+                raise KeyError(last)
+            parent.pop(last)
+            return None
+        if op == "replace" and last not in parent:
+            raise KeyError(last)
+        parent[last] = _merge(parent.get(last), value) if op == "merge" else copy.deepcopy(value)
+        return parent[last]
+
+    if isinstance(parent, list):
+        i = None if last == "-" else _list_index(parent, last)
+        if op == "add" and i is None:
+            if last != "-" and not isinstance(value, dict):
+                raise KeyError(last)
+            parent.append(copy.deepcopy(value))
+            return parent[-1]
+        if i is None:
+            raise KeyError(last)
+        if op == "remove":
+            parent.pop(i)
+            return None
+        parent[i] = _merge(parent[i], value) if op == "merge" else copy.deepcopy(value)
+        return parent[i]
+
+    raise KeyError(last)
+
+
+def apply_agent_patch(patch: List[Dict[str, Any]], context: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Apply `patch` to a copy of the controller config and return proposed_changes:
+    full objects for every view/tag it touched, plus ids of removed ones.
+    Raises ValueError if an op is malformed or its path does not resolve.
+    """
+    base = _controller_config(context)
+    doc = copy.deepcopy(base)
+    base_view_ids = {v.get("id") for v in (base.get("hmi") or {}).get("views") or [] if isinstance(v, dict)}
+
+    touched_views: Dict[int, Dict[str, Any]] = {}
+    touched_tags: List[str] = []
+    removed: Dict[str, List[str]] = {"views": [], "tags": []}
+    general_touched = False
+
+    for n, item in enumerate(patch or []):
+        if not isinstance(item, dict):
+            raise ValueError(f"patch op {n} is not an object")
+        op = item.get("op")
+        if op not in ("add", "replace", "merge", "remove"):
+            raise ValueError(f"patch op {n}: unsupported op {op!r}")
+        segs = _split(item.get("path", ""))
+        if op != "remove" and "value" not in item:
+            raise ValueError(f"patch op {n}: missing value")
+
+        # Resolve the view before a remove; afterwards it is gone
+        view_obj = None
+        if segs[:2] == ["hmi", "views"] and len(segs) > 3:
+            try:
+                view_obj = _child(doc["hmi"]["views"], segs[2], None, create=False)
+            except (KeyError, TypeError):
+                view_obj = None
+        if segs[:2] == ["hmi", "views"] and len(segs) == 3 and op == "remove":
+            try:
+                gone = _child(doc["hmi"]["views"], segs[2], None, create=False)
+                removed["views"].append(gone.get("id"))
+                touched_views.pop(id(gone), None)
+            except (KeyError, TypeError, AttributeError):
+                pass
+
+        try:
+            result = _apply_op(doc, op, segs, item.get("value"))
+        except (KeyError, TypeError, IndexError) as e:
+            raise ValueError(f"patch op {n}: path {item.get('path')!r} not found ({e})")
+
+        if segs[:2] == ["hmi", "views"] and len(segs) == 3 and isinstance(result, dict):
+            view_obj = result
+        if isinstance(view_obj, dict):
+            touched_views[id(view_obj)] = view_obj
+            # New components usually omit viewId; it is implied by the path
+            if len(segs) == 5 and segs[3] == "components" and isinstance(result, dict):
+                result.setdefault("viewId", view_obj.get("id"))
+        elif segs[:2] == ["hmi", "general"]:
+            general_touched = True
+        elif segs[:2] == ["database", "tags"] and len(segs) > 2:
+            if op == "remove" and len(segs) == 3:
+                removed["tags"].append(segs[2])
+            elif segs[2] not in touched_tags:
+                touched_tags.append(segs[2])
+
+    hmi = doc.setdefault("hmi", {})
+    live = {id(v) for v in hmi.get("views") or []}
+    views = [v for k, v in touched_views.items() if k in live]
+
+    # New views are listed in the views tree even if the model forgot to
+    if not isinstance(hmi.get("general"), dict):
+        hmi["general"] = {}
+    general = hmi["general"]
+    tree = general.setdefault("viewsTree", [])
+    tree_ids = {t.get("id") for t in tree if isinstance(t, dict)}
+    for v in views:
+        if v.get("id") not in base_view_ids and v.get("id") not in tree_ids:
+            tree.append({"name": v.get("name"), "type": v.get("type", "view"), "id": v.get("id")})
+            general_touched = True
+
+    tags = (doc.get("database") or {}).get("tags") or {}
+    proposed: Dict[str, Any] = {
+        "hmi": {"views": views},
+        # Same [{tagName: tag}] shape as full output mode
+        "tags_to_add": [{name: tags[name]} for name in touched_tags if name in tags],
+    }
+    if general_touched:
+        proposed["hmi"]["general"] = general
+    if removed["views"] or removed["tags"]:
+        proposed["removed"] = removed
+    return proposed
+
@@ -0,0 +1,20 @@
+from typing import Any, Dict, List
+
+
+# Turn a stored conversation into chat messages placed before the new user turn.
+def build_history_messages(conversation: Dict[str, Any]) -> List[Dict[str, str]]:
+    """
+    Rolling summary of older turns (as a system message) followed by the
+    recent turns verbatim.
+    """
+    messages: List[Dict[str, str]] = []
+    summary = (conversation or {}).get("summary")
+    if summary:
+        messages.append({
+            "role": "system",
+            "content": f"Summary of the earlier conversation with this user:\n{summary}",
+        })
+    for m in (conversation or {}).get("messages") or []:
+        if m.get("role") in ("user", "assistant") and m.get("content"):
+            messages.append({"role": m["role"], "content": m["content"]})
+    return messages
@@ -1,5 +1,9 @@
 import glob
+from functools import lru_cache
 
+# Docs are read on first use (ALL_DOCS / ALL_HMI_DOCS), not at import time
+
+@lru_cache(maxsize=1)
 def load_docs():
     texts = []
     for path in sorted(glob.glob("docs/*.txt")):
@@ -7,8 +11,7 @@ def load_docs():
             texts.append(f.read())
     return texts
 
-ALL_DOCS = load_docs()
-
+@lru_cache(maxsize=1)
 def load_hmi_docs():
     hmi_docs = ["docs/02_hmi.txt", "docs/04_hmi_views.txt"]
     texts = []
@@ -17,4 +20,9 @@ def load_hmi_docs():
             texts.append(f.read())
     return texts
 
-ALL_HMI_DOCS = load_hmi_docs()
\ No newline at end of file
+_LAZY = {"ALL_DOCS": load_docs, "ALL_HMI_DOCS": load_hmi_docs}
+
+def __getattr__(name):
+    if name in _LAZY:
+        return _LAZY[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
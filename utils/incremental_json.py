@@ -0,0 +1,116 @@
+import json
+from typing import Any, Callable, List, Optional, Tuple
+
+Path = Tuple[Any, ...]
+
+_WHITESPACE = " \t\r\n"
+_SCALAR_END = ",}]" + _WHITESPACE
+
+
+class IncrementalJSONParser:
+    """
+    Feed a JSON document in arbitrary chunks and get back every value whose
+    path is accepted by `want(path)` as soon as that value is complete.
+
+    Paths are tuples of object keys / array indices from the root, e.g.
+    ("steps", 0) or ("proposed_changes", "hmi", "views", 1).
+    Text before the first '{' or '[' and after the root closes is ignored,
+    so control tokens like <|eot_id|> do not break parsing.
+    """
+
+    def __init__(self, want: Callable[[Path], bool]):
+        self._want = want
+        self._buf = ""
+        self._pos = 0
+        # Each frame: [kind ('obj'|'arr'), path, start, key, index, expect_key]
+        self._frames: List[list] = []
+        self._in_string = False
+        self._escape = False
+        self._str_start = 0
+        self._str_is_key = False
+        self._scalar_start: Optional[int] = None
+        self.done = False
+
+    def feed(self, chunk: str) -> List[Tuple[Path, Any]]:
+        """Consume a chunk and return completed (path, value) pairs."""
+        out: List[Tuple[Path, Any]] = []
+        self._buf += chunk
+        buf = self._buf
+
+        for p in range(self._pos, len(buf)):
+            if self.done:
+                break
+            c = buf[p]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._str_is_key:
+                        self._frames[-1][3] = json.loads(buf[self._str_start:p + 1])
+                    else:
+                        self._complete(self._str_start, p + 1, out)
+                continue
+
+            if self._scalar_start is not None:
+                if c not in _SCALAR_END:
+                    continue
+                self._complete(self._scalar_start, p, out)
+                self._scalar_start = None
+
+            if not self._frames:
+                # Skip any preamble until the root container opens
+                if c in "{[":
+                    self._push(c, (), p)
+                continue
+
+            if c in _WHITESPACE:
+                continue
+
+            frame = self._frames[-1]
+            if c == '"':
+                self._in_string = True
+                self._str_start = p
+                self._str_is_key = frame[0] == "obj" and frame[5]
+            elif c == ":":
+                frame[5] = False
+            elif c == ",":
+                if frame[0] == "obj":
+                    frame[3] = None
+                    frame[5] = True
+                else:
+                    frame[4] += 1
+            elif c in "{[":
+                self._push(c, self._child_path(frame), p)
+            elif c in "}]":
+                closed = self._frames.pop()
+                if self._frames:
+                    self._complete(closed[2], p + 1, out)
+                else:
+                    self.done = True
+            else:
+                self._scalar_start = p
+
+        self._pos = len(buf)
+        return out
+
+    def _push(self, c: str, path: Path, start: int) -> None:
+        kind = "obj" if c == "{" else "arr"
+        self._frames.append([kind, path, start, None, 0, kind == "obj"])
+
+    @staticmethod
+    def _child_path(frame: list) -> Path:
+        return frame[1] + ((frame[3],) if frame[0] == "obj" else (frame[4],))
+
+    def _complete(self, start: int, end: int, out: List[Tuple[Path, Any]]) -> None:
+        path = self._child_path(self._frames[-1])
+        if not self._want(path):
+            return
+        try:
+            out.append((path, json.loads(self._buf[start:end])))
+        except json.JSONDecodeError:
+            # Malformed fragment; the final repair pass will deal with it
+            pass
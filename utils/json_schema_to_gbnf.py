@@ -0,0 +1,129 @@
+import json
+import re
+from typing import Any, Dict, List
+
+# Primitive rules shared by every grammar (llama.cpp GBNF dialect)
+_PRIMITIVES = {
+    "space": '| " " | "\\n" [ \\t]{0,20}',
+    "char": '[^"\\\\\\x7F\\x00-\\x1F] | [\\\\] (["\\\\bfnrt] | "u" [0-9a-fA-F]{4})',
+    "string": '"\\"" char* "\\"" space',
+    "integer": '("-"? ([0-9] | [1-9] [0-9]{0,15})) space',
+    "number": '("-"? ([0-9] | [1-9] [0-9]{0,15})) ("." [0-9]+)? ([eE] [-+]? [0-9]+)? space',
+    "boolean": '("true" | "false") space',
+    "null": '"null" space',
+    "value": "object | array | string | number | boolean | null",
+    "object": '"{" space ( string ":" space value ("," space string ":" space value)* )? "}" space',
+    "array": '"[" space ( value ("," space value)* )? "]" space',
+}
+
+
+def _literal(text: str) -> str:
+    # JSON string escaping is also valid GBNF literal escaping
+    return json.dumps(text)
+
+
+def _rule_name(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9-]+", "-", name).strip("-").lower() or "rule"
+
+
+class _GrammarBuilder:
+    def __init__(self, schema: Dict[str, Any]):
+        self.defs = schema.get("$defs") or schema.get("definitions") or {}
+        self.rules: Dict[str, str] = {}
+
+    def add(self, name: str, body: str) -> str:
+        name = _rule_name(name)
+        base, n = name, 1
+        while name in self.rules and self.rules[name] != body:
+            n += 1
+            name = f"{base}-{n}"
+        self.rules[name] = body
+        return name
+
+    def visit(self, schema: Dict[str, Any], name: str) -> str:
+        """Return a rule reference (or inline expression) matching `schema`."""
+        if "$ref" in schema:
+            ref = schema["$ref"].rsplit("/", 1)[-1]
+            rule = _rule_name(ref)
+            if rule not in self.rules:
+                self.rules[rule] = ""  # reserve; allows recursive refs
+                self.rules[rule] = self._body(self.defs[ref], rule)
+            return rule
+
+        for key in ("anyOf", "oneOf"):
+            if key in schema:
+                alts = [self.visit(s, f"{name}-{i}") for i, s in enumerate(schema[key])]
+                return self.add(name, " | ".join(alts))
+
+        body = self._body(schema, name)
+        if body in _PRIMITIVES or body in self.rules:
+            return body
+        return self.add(name, body)
+
+    @staticmethod
+    def _members(required: List[str], optional: List[str]) -> str:
+        """Object members: all of `required`, then any in-order subset of `optional`."""
+        if required:
+            tail = "".join(f' ( "," space {kv} )?' for kv in optional)
+            return ' "," space '.join(required) + tail
+        if not optional:
+            return ""
+        # No required member to anchor the commas: pick the first member present, then the rest
+        alts = [kv + "".join(f' ( "," space {rest} )?' for rest in optional[i + 1:])
+                for i, kv in enumerate(optional)]
+        return "( " + " | ".join(alts) + " )?"
+
+    def _body(self, schema: Dict[str, Any], name: str) -> str:
+        if "$ref" in schema or "anyOf" in schema or "oneOf" in schema:
+            return self.visit(schema, name + "-alt")
+        if "const" in schema:
+            return _literal(json.dumps(schema["const"])) + " space"
+        if "enum" in schema:
+            return "(" + " | ".join(_literal(json.dumps(v)) for v in schema["enum"]) + ") space"
+
+        typ = schema.get("type")
+        if isinstance(typ, list):
+            alts = [self.visit({**schema, "type": t}, f"{name}-{t}") for t in typ]
+            return " | ".join(alts)
+
+        if typ == "object":
+            props = schema.get("properties")
+            if props:
+                # Required properties in declaration order, then the optional ones (each may be skipped)
+                required = schema.get("required", [])
+                parts: Dict[bool, List[str]] = {True: [], False: []}
+                for key, sub in props.items():
+                    prop_rule = self.visit(sub, f"{name}-{key}")
+                    parts[key in required].append(f'{_literal(json.dumps(key))} space ":" space {prop_rule}')
+                return '"{" space ' + self._members(parts[True], parts[False]) + ' "}" space'
+            extra = schema.get("additionalProperties")
+            if isinstance(extra, dict) and extra:
+                val = self.visit(extra, f"{name}-value")
+                kv = f'string ":" space {val}'
+                return f'"{{" space ( {kv} ("," space {kv})* )? "}}" space'
+            return "object"
+
+        if typ == "array":
+            items = schema.get("items")
+            if isinstance(items, dict) and items:
+                item = self.visit(items, f"{name}-item")
+                return f'"[" space ( {item} ("," space {item})* )? "]" space'
+            return "array"
+
+        if typ in ("string", "integer", "number", "boolean", "null"):
+            return typ
+        return "value"
+
+
+def json_schema_to_gbnf(schema: Dict[str, Any]) -> str:
+    """
+    Convert a (pydantic-generated) JSON Schema into a GBNF grammar for
+    llama.cpp-style servers. Supports objects, arrays, maps, $ref/$defs,
+    anyOf/oneOf, enum/const and the JSON primitive types.
+    """
+    builder = _GrammarBuilder(schema)
+    builder.rules.update(_PRIMITIVES)
+    builder.rules["root"] = builder._body(schema, "root")
+    lines = [f"root ::= {builder.rules.pop('root')}"]
+    lines += [f"{k} ::= {v}" for k, v in builder.rules.items()]
+    return "\n".join(lines) + "\n"
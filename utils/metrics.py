@@ -0,0 +1,178 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Per-stage latency and LLM token metrics, exported in Prometheus text format
+# on /metrics (no client library needed). Stages timed while a request is
+# being handled are also echoed back in its Server-Timing header.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+_BUCKETS = tuple(float(b) for b in os.getenv(
+    "METRICS_BUCKETS", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60,120"
+).split(","))
+
+_lock = threading.Lock()
+# name -> help text / type, and (name, labels) -> value
+_HELP: Dict[str, Tuple[str, str]] = {}
+_COUNTERS: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+_HISTOGRAMS: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], List[float]] = {}
+
+# Stage timings (name, ms) of the request being handled; None outside a request
+_request_spans: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_spans", default=None)
+
+
+def _describe(name: str, kind: str, help_text: str) -> None:
+    _HELP[name] = (kind, help_text)
+
+
+_describe("durus_http_request_seconds", "histogram", "HTTP request latency by route (until the response starts).")
+_describe("durus_stage_seconds", "histogram", "Latency of one processing stage (rag_embed, llm, parse, ...).")
+_describe("durus_llm_ttft_seconds", "histogram", "LLM time to first streamed token.")
+_describe("durus_llm_tokens_per_second", "histogram", "LLM decode speed (completion tokens / decode time).")
+_describe("durus_llm_prompt_tokens_total", "counter", "Prompt tokens sent to the LLM.")
+_describe("durus_llm_completion_tokens_total", "counter", "Completion tokens generated by the LLM.")
+_describe("durus_llm_calls_total", "counter", "LLM calls by mode (call/stream) and outcome.")
+
+
+def _key(name: str, labels: Optional[Dict[str, str]]) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+    return name, tuple(sorted((labels or {}).items()))
+
+
+def inc(name: str, value: float = 1, labels: Optional[Dict[str, str]] = None) -> None:
+    if not METRICS_ENABLED:
+        return
+    k = _key(name, labels)
+    with _lock:
+        _COUNTERS[k] = _COUNTERS.get(k, 0) + value
+
+
+def observe(name: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+    """Add one sample to a histogram (buckets + sum + count)."""
+    if not METRICS_ENABLED:
+        return
+    k = _key(name, labels)
+    with _lock:
+        h = _HISTOGRAMS.get(k)
+        if h is None:
+            h = _HISTOGRAMS[k] = [0.0] * (len(_BUCKETS) + 2)
+        for i, bound in enumerate(_BUCKETS):
+            if value <= bound:
+                h[i] += 1
+        h[-2] += value
+        h[-1] += 1
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """Record a stage duration globally and on the current request's Server-Timing."""
+    observe("durus_stage_seconds", seconds, {"stage": stage})
+    spans = _request_spans.get()
+    if spans is not None:
+        spans.append((stage, seconds * 1000))
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - t0)
+
+
+def start_request() -> List[Tuple[str, float]]:
+    """Begin collecting spans for the current request (call from middleware)."""
+    spans: List[Tuple[str, float]] = []
+    _request_spans.set(spans)
+    return spans
+
+
+def server_timing(spans: List[Tuple[str, float]], total_sec: float) -> str:
+    """Server-Timing header value; repeated stages (hedged attempts, ...) are summed."""
+    merged: Dict[str, float] = {}
+    for stage, ms in spans:
+        merged[stage] = merged.get(stage, 0.0) + ms
+    parts = [f"{stage};dur={ms:.1f}" for stage, ms in merged.items()]
+    parts.append(f"total;dur={total_sec * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def record_llm_usage(mode: str, data: Any, elapsed_sec: float, ttft_sec: Optional[float] = None, chunks: int = 0) -> None:
+    """Token counts and speed of one LLM call.
+
+    Uses usage.{prompt,completion}_tokens and llama.cpp timings (prompt_ms,
+    predicted_ms) when the backend sends them; a stream without usage counts
+    content chunks as tokens and times decoding from the first token.
+    """
+    data = data if isinstance(data, dict) else {}
+    usage = data.get("usage") if isinstance(data.get("usage"), dict) else {}
+    timings = data.get("timings") if isinstance(data.get("timings"), dict) else {}
+
+    prompt = usage.get("prompt_tokens")
+    if prompt is None and "prompt_n" in timings:
+        prompt = int(timings.get("prompt_n") or 0) + int(timings.get("cache_n") or 0)
+    completion = usage.get("completion_tokens", timings.get("predicted_n"))
+    if completion is None and chunks:
+        completion = chunks
+    if prompt is not None:
+        inc("durus_llm_prompt_tokens_total", int(prompt), {"mode": mode})
+    if completion is not None:
+        inc("durus_llm_completion_tokens_total", int(completion), {"mode": mode})
+
+    if ttft_sec is not None:
+        observe("durus_llm_ttft_seconds", ttft_sec)
+    if timings.get("prompt_ms") is not None:
+        record_stage("llm_prefill", float(timings["prompt_ms"]) / 1000)
+    elif ttft_sec is not None:
+        record_stage("llm_prefill", ttft_sec)
+
+    if timings.get("predicted_ms"):
+        decode_sec = float(timings["predicted_ms"]) / 1000
+    elif ttft_sec is not None:
+        decode_sec = elapsed_sec - ttft_sec
+    else:
+        decode_sec = elapsed_sec  # non-streaming: prefill is included
+    if completion and decode_sec > 0:
+        record_stage("llm_decode", decode_sec)
+        observe("durus_llm_tokens_per_second", int(completion) / decode_sec)
+
+
+def _fmt_labels(labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    items = [f'{k}="{v}"' for k, v in labels]
+    if extra:
+        items.append(extra)
+    return "{" + ",".join(items) + "}" if items else ""
+
+
+def render_prometheus(extra_counters: Optional[Dict[str, Tuple[str, Dict[Tuple[Tuple[str, str], ...], float]]]] = None) -> str:
+    """All metrics in the Prometheus text exposition format.
+
+    `extra_counters` maps name -> (help, {labels: value}) for counters kept
+    elsewhere (e.g. PARSE_STATS), exported as-is.
+    """
+    with _lock:
+        counters = dict(_COUNTERS)
+        histograms = {k: list(v) for k, v in _HISTOGRAMS.items()}
+
+    by_name: Dict[str, List[str]] = {}
+    for (name, labels), value in sorted(counters.items()):
+        by_name.setdefault(name, []).append(f"{name}{_fmt_labels(labels)} {value:g}")
+    for (name, labels), h in sorted(histograms.items()):
+        lines = by_name.setdefault(name, [])
+        for bound, count in zip(_BUCKETS, h):
+            le = 'le="%g"' % bound
+            lines.append(f"{name}_bucket{_fmt_labels(labels, le)} {count:g}")
+        inf = 'le="+Inf"'
+        lines.append(f"{name}_bucket{_fmt_labels(labels, inf)} {h[-1]:g}")
+        lines.append(f"{name}_sum{_fmt_labels(labels)} {h[-2]:.6f}")
+        lines.append(f"{name}_count{_fmt_labels(labels)} {h[-1]:g}")
+
+    out: List[str] = []
+    for name, lines in by_name.items():
+        kind, help_text = _HELP.get(name, ("untyped", ""))
+        out += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", *lines]
+    for name, (help_text, values) in (extra_counters or {}).items():
+        out += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        out += [f"{name}{_fmt_labels(labels)} {value:g}" for labels, value in values.items()]
+    return "\n".join(out) + "\n"
@@ -0,0 +1,176 @@
+import json
+from typing import Any, Dict, List, Optional
+from fastapi import HTTPException
+from json_repair import repair_json
+from models.AgentModels import AgentResponse
+from utils.apply_agent_patch import apply_agent_patch
+from utils.metrics import span
+from utils.sanitize_llm_json import sanitize_llm_json
+from view_creation.component_defaults import COMPONENT_DEFAULTS_ENABLED, expand_component, expand_view
+
+# How often each recovery path fires. With constrained decoding enabled,
+# "clean" should dominate and "repaired" should stay near zero.
+PARSE_STATS = {
+    "total": 0,
+    "clean": 0,            # raw output parsed as-is
+    "sanitized": 0,        # needed control-token stripping / {...} slicing
+    "repaired": 0,         # needed json_repair
+    "failed": 0,           # no JSON, unrepairable, or failed validation
+    "list_unwrapped": 0,
+    "keys_normalized": 0,  # misplaced/renamed keys moved into proposed_changes
+    "patch_expanded": 0,   # compact "patch" output applied to the context
+    "defaults_expanded": 0,  # views/components filled from the component defaults registry
+}
+
+
+def _expand_patch_defaults(patch: List[Any]) -> int:
+    """Fill compact views/components written by add/replace ops; returns how many."""
+    n = 0
+    for op in patch:
+        if not isinstance(op, dict) or op.get("op") not in ("add", "replace"):
+            continue
+        value, path = op.get("value"), str(op.get("path", ""))
+        if not isinstance(value, dict) or "type" not in value:
+            continue
+        is_view = path.startswith("/hmi/views/") and path.count("/") == 3
+        op["value"] = expand_view(value) if is_view else expand_component(value)
+        n += 1
+    return n
+
+
+def _expand_defaults(pc: Dict[str, Any]) -> int:
+    """Fill compact views/components in proposed_changes; returns how many."""
+    n = 0
+    hmi = pc.get("hmi")
+    if isinstance(hmi, dict) and isinstance(hmi.get("views"), list):
+        hmi["views"] = [expand_view(v) for v in hmi["views"]]
+        n += len(hmi["views"])
+    for key in ("component_to_add", "components_to_add"):
+        if isinstance(pc.get(key), list):
+            pc[key] = [expand_component(c) for c in pc[key]]
+            n += len(pc[key])
+    return n
+
+
+def _tags_list(tags: Any) -> List[Any]:
+    """tags_to_add as [{tagName: tag}, ...] (the schema shape); a {name: tag} map is split up."""
+    if isinstance(tags, dict):
+        return [{name: tag} for name, tag in tags.items()]
+    return tags if isinstance(tags, list) else []
+
+
+def get_parse_stats():
+    """Snapshot of PARSE_STATS with derived rates."""
+    total = PARSE_STATS["total"] or 1
+    return {
+        **PARSE_STATS,
+        "repair_rate": round(PARSE_STATS["repaired"] / total, 4),
+        "failure_rate": round(PARSE_STATS["failed"] / total, 4),
+    }
+
+
+def parse_agent_response(raw: str, context: Optional[Dict[str, Any]] = None) -> AgentResponse:
+    """
+    Turn raw LLM output into a validated AgentResponse.
+    Sanitizes, parses (repairing if needed) and normalizes the JSON.
+    A compact "patch" (patch output mode) is applied to `context` and
+    expanded into proposed_changes.
+    """
+    PARSE_STATS["total"] += 1
+    try:
+        json_str = sanitize_llm_json(raw)
+    except ValueError as e:
+        PARSE_STATS["failed"] += 1
+        print("\n[AGENT DEBUG] RAW REPR (no JSON found):\n", repr(raw), "\n")
+        raise HTTPException(status_code=500, detail=f"LLM output missing JSON object: {e}")
+
+    try:
+        parsed = json.loads(json_str)
+        PARSE_STATS["clean" if json_str == raw.strip() else "sanitized"] += 1
+    except json.JSONDecodeError as e:
+        # 3) If that fails, try to repair it with json_repair
+        try:
+            with span("json_repair"):
+                repaired_str = repair_json(json_str)
+            parsed = json.loads(repaired_str)
+            PARSE_STATS["repaired"] += 1
+        except Exception as e2:
+            PARSE_STATS["failed"] += 1
+            raise HTTPException(
+                status_code=500,
+                detail=f"LLM did not return valid JSON even after repair: {e2}",
+            )
+
+    # 3) If model ever wraps in a list, unwrap element 0
+    if isinstance(parsed, list):
+        if parsed and isinstance(parsed[0], dict):
+            PARSE_STATS["list_unwrapped"] += 1
+            parsed = parsed[0]
+        else:
+            PARSE_STATS["failed"] += 1
+            raise HTTPException(
+                status_code=500,
+                detail="LLM returned a list but no dict inside.",
+            )
+
+    if not isinstance(parsed, dict):
+        PARSE_STATS["failed"] += 1
+        raise HTTPException(
+            status_code=500,
+            detail="LLM JSON top-level is not an object.",
+        )
+
+    # Patch output mode: expand ops against the request context
+    patched = isinstance(parsed.get("patch"), list)
+    if patched:
+        if COMPONENT_DEFAULTS_ENABLED:
+            PARSE_STATS["defaults_expanded"] += _expand_patch_defaults(parsed["patch"])
+        try:
+            parsed["proposed_changes"] = apply_agent_patch(parsed.pop("patch"), context)
+        except ValueError as e:
+            PARSE_STATS["failed"] += 1
+            raise HTTPException(status_code=500, detail=f"LLM patch could not be applied: {e}")
+        PARSE_STATS["patch_expanded"] += 1
+
+    # 4) Ensure required keys exist, with safe defaults
+    if "message" not in parsed:
+        parsed["message"] = "No explanation provided by model."
+
+    if "steps" not in parsed or not isinstance(parsed["steps"], list):
+        parsed["steps"] = []
+
+    if "proposed_changes" not in parsed or not isinstance(parsed["proposed_changes"], dict):
+        parsed["proposed_changes"] = {"hmi": {}}
+
+    # Normalize misplaced top-level keys into proposed_changes for compatibility
+    pc = parsed.get("proposed_changes")
+    if isinstance(pc, dict):
+        if any(k in parsed for k in ("tags_to_add", "component_to_add", "components_to_add")):
+            PARSE_STATS["keys_normalized"] += 1
+        # Accept either singular or plural variants from LLM
+        if "tags_to_add" in parsed and "tags_to_add" not in pc:
+            pc["tags_to_add"] = parsed.pop("tags_to_add")
+        if "component_to_add" in parsed and "component_to_add" not in pc:
+            pc["component_to_add"] = parsed.pop("component_to_add")
+        if "components_to_add" in parsed and "component_to_add" not in pc and "components_to_add" not in pc:
+            # prefer normalized singular key inside proposed_changes
+            pc["component_to_add"] = parsed.pop("components_to_add")
+        # Ensure keys exist with safe defaults
+        pc["tags_to_add"] = _tags_list(pc.get("tags_to_add"))
+        if "component_to_add" not in pc and "components_to_add" not in pc:
+            pc["component_to_add"] = {}
+        # Compact output: fill omitted fields from the per-type defaults
+        if COMPONENT_DEFAULTS_ENABLED and not patched:
+            PARSE_STATS["defaults_expanded"] += _expand_defaults(pc)
+
+    # 5) Build typed response
+    try:
+        resp_obj = AgentResponse(**parsed)
+    except Exception as e:
+        PARSE_STATS["failed"] += 1
+        raise HTTPException(
+            status_code=500,
+            detail=f"LLM JSON missing required fields: {e}",
+        )
+
+    return resp_obj
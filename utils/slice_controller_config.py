@@ -0,0 +1,218 @@
+import json
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+# Controller configs (database.tags, hmi.views, hmi.general, charts) run to
+# hundreds of KB. Only the parts relevant to the prompt are sent in full;
+# everything else is summarized as names/ids so the model can still reference it.
+CONTEXT_SLICE_ENABLED = os.getenv("CONTEXT_SLICE_ENABLED", "1") == "1"
+CONTEXT_MAX_VIEWS = int(os.getenv("CONTEXT_MAX_VIEWS", "3"))
+CONTEXT_MAX_TAGS = int(os.getenv("CONTEXT_MAX_TAGS", "20"))
+# Example components of a prompted type taken from other views (shape reference)
+CONTEXT_EXAMPLES_PER_TYPE = int(os.getenv("CONTEXT_EXAMPLES_PER_TYPE", "1"))
+
+_WORD = re.compile(r"[A-Za-z][A-Za-z0-9_]*")
+_CAMEL = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+_NON_ALNUM = re.compile(r"[^a-z0-9]")
+# Tag references in animation/event expressions: __tagName__ or __Folder.child__
+_TAG_REF = re.compile(r"__([A-Za-z][A-Za-z0-9_.]*?)__")
+
+# Prompt words that name a component type
+_TYPE_WORDS = {
+    "label": "label", "labels": "label", "text": "label",
+    "button": "button", "buttons": "button", "btn": "button",
+    "numericinput": "numericInput", "numeric": "numericInput", "input": "numericInput",
+    "keyboard": "keyboard", "keypad": "numericInput",
+    "nested": "view", "subview": "view", "embedded": "view",
+}
+_DATATYPE_WORDS = {"text": "Text", "string": "Text", "number": "Number", "numeric": "Number",
+                   "bool": "Boolean", "boolean": "Boolean", "folder": "Folder"}
+
+
+def _norm(s: str) -> str:
+    return _NON_ALNUM.sub("", (s or "").lower())
+
+
+def _prompt_words(prompt: str) -> Set[str]:
+    words: Set[str] = set()
+    for raw in _WORD.findall(prompt or ""):
+        words.add(raw.lower())
+        words.update(p.lower() for p in _CAMEL.split(raw) if p)
+        words.update(p.lower() for p in raw.split("_") if p)
+    return words
+
+
+def _mentioned(name: str, words: Set[str], flat_prompt: str) -> bool:
+    """Name (e.g. "User_Form", "Main View", "systemStatus") appears in the prompt."""
+    key = _norm(name)
+    if not key:
+        return False
+    if len(key) >= 4 and key in flat_prompt:
+        return True
+    return key in words
+
+
+def _flatten_tags(tags: Dict[str, Any], prefix: str = "") -> Dict[str, Dict[str, Any]]:
+    """{"Folder.child": tag} for every leaf tag; folders stay addressable by their own path."""
+    flat: Dict[str, Dict[str, Any]] = {}
+    for name, tag in (tags or {}).items():
+        if not isinstance(tag, dict):
+            continue
+        path = f"{prefix}{name}"
+        flat[path] = tag
+        if isinstance(tag.get("children"), dict):
+            flat.update(_flatten_tags(tag["children"], path + "."))
+    return flat
+
+
+def _nest_tags(tags: Dict[str, Any], paths: Iterable[str]) -> Dict[str, Any]:
+    """Selected flat paths back in the config's nested shape: parent folders keep only selected children."""
+    out: Dict[str, Any] = {}
+    for path in paths:
+        src, dst = tags, out
+        parts = path.split(".")
+        for i, name in enumerate(parts):
+            tag = src.get(name)
+            if not isinstance(tag, dict):
+                break
+            if i == len(parts) - 1:
+                dst[name] = tag  # a selected folder is sent whole
+                break
+            node = dst.get(name)
+            if node is tag:
+                break  # the whole folder is already included
+            if node is None:
+                node = dst[name] = {**{k: v for k, v in tag.items() if k != "children"}, "children": {}}
+            src, dst = tag.get("children") or {}, node["children"]
+    return out
+
+
+def _tag_summary(tags: Dict[str, Any]) -> Dict[str, Any]:
+    """name -> datatype (folders -> nested summary)."""
+    out: Dict[str, Any] = {}
+    for name, tag in (tags or {}).items():
+        if not isinstance(tag, dict):
+            continue
+        if isinstance(tag.get("children"), dict):
+            out[name] = _tag_summary(tag["children"])
+        else:
+            out[name] = tag.get("datatype")
+    return out
+
+
+def _tag_refs(obj: Any) -> Set[str]:
+    return set(_TAG_REF.findall(json.dumps(obj, ensure_ascii=False)))
+
+
+class _ConfigIndex:
+    """Lookups over one controller config, built once per request."""
+
+    def __init__(self, config: Dict[str, Any]):
+        hmi = config.get("hmi") or {}
+        self.views: List[Dict[str, Any]] = [v for v in hmi.get("views") or [] if isinstance(v, dict)]
+        self.general = hmi.get("general") or {}
+        self.tags = (config.get("database") or {}).get("tags") or {}
+        self.flat_tags = _flatten_tags(self.tags)
+        self.tags_lower = {k.lower(): k for k in self.flat_tags}
+        self.charts = config.get("charts") or []
+
+        self.components_by_type: Dict[str, List[Dict[str, Any]]] = {}
+        for v in self.views:
+            for c in v.get("components") or []:
+                if isinstance(c, dict):
+                    self.components_by_type.setdefault(c.get("type"), []).append({"view_id": v.get("id"), **c})
+
+    def resolve_tag(self, ref: str) -> Optional[str]:
+        return ref if ref in self.flat_tags else self.tags_lower.get(ref.lower())
+
+
+def _slice_config(config: Dict[str, Any], prompt: str) -> Dict[str, Any]:
+    idx = _ConfigIndex(config)
+    words = _prompt_words(prompt)
+    flat_prompt = _norm(prompt)
+
+    # Views named in the prompt, or holding a component/tag the prompt names
+    scored = []
+    for order, v in enumerate(idx.views):
+        score = 0
+        if _mentioned(v.get("name", ""), words, flat_prompt) or (v.get("id") and v["id"] in (prompt or "")):
+            score += 10
+        for c in v.get("components") or []:
+            if isinstance(c, dict) and _mentioned(c.get("comptName", ""), words, flat_prompt):
+                score += 5
+        if any(_mentioned(r.split(".")[-1], words, flat_prompt) for r in _tag_refs(v.get("components"))):
+            score += 2
+        if score:
+            scored.append((-score, order, v))
+    views = [v for _, _, v in sorted(scored, key=lambda t: t[:2])[:CONTEXT_MAX_VIEWS]]
+    view_ids = {v.get("id") for v in views}
+
+    # Tags named in the prompt, of a prompted datatype, or used by the selected views
+    tag_paths: List[str] = [p for p in idx.flat_tags if _mentioned(p.split(".")[-1], words, flat_prompt)]
+    if "tag" in words or "tags" in words:
+        wanted_types = {_DATATYPE_WORDS[w] for w in words if w in _DATATYPE_WORDS}
+        tag_paths += [p for p, t in idx.flat_tags.items() if t.get("datatype") in wanted_types]
+    for ref in sorted(_tag_refs(views)):
+        path = idx.resolve_tag(ref)
+        if path:
+            tag_paths.append(path)
+    tag_paths = list(dict.fromkeys(tag_paths))[:CONTEXT_MAX_TAGS]
+    # Flat paths are only for selection; the model sees (and copies) the nested Folder/children form
+    tags = _nest_tags(idx.tags, tag_paths)
+
+    # Existing components of prompted types elsewhere, as style/shape references
+    examples: List[Dict[str, Any]] = []
+    for ctype in sorted({_TYPE_WORDS[w] for w in words if w in _TYPE_WORDS}):
+        others = [c for c in idx.components_by_type.get(ctype, []) if c["view_id"] not in view_ids]
+        examples += others[:CONTEXT_EXAMPLES_PER_TYPE]
+
+    return {
+        "database": {"tags": tags},
+        "hmi": {"views": views, "general": idx.general},
+        "example_components": examples,
+        "summary": {
+            "note": "Everything in the controller config, by name/id; only the items above are included in full.",
+            "views": [
+                {"id": v.get("id"), "name": v.get("name"), "components": len(v.get("components") or [])}
+                for v in idx.views
+            ],
+            "tags": _tag_summary(idx.tags),
+            "charts": [
+                {k: c.get(k) for k in ("id", "name") if k in c} if isinstance(c, dict) else c
+                for c in idx.charts
+            ],
+        },
+    }
+
+
+def _is_controller_config(obj: Any) -> bool:
+    return isinstance(obj, dict) and ("hmi" in obj or "database" in obj)
+
+
+def slice_controller_config(context: Optional[Dict[str, Any]], prompt: str) -> Optional[Dict[str, Any]]:
+    """
+    Reduce AgentRequest.context to what the prompt needs.
+
+    Accepts either a bare controller config or a context holding one under
+    "controller_config"; the result keeps that shape and other context keys
+    are passed through unchanged. A slice that is not smaller than the
+    original (small configs: the summary outweighs what is left out) is
+    dropped and `context` is returned as is.
+    """
+    if not context or not CONTEXT_SLICE_ENABLED:
+        return context
+    if _is_controller_config(context):
+        sliced: Dict[str, Any] = _slice_config(context, prompt)
+    elif _is_controller_config(context.get("controller_config")):
+        sliced = {**context, "controller_config": _slice_config(context["controller_config"], prompt)}
+    else:
+        return context
+
+    before = len(json.dumps(context, separators=(",", ":")))
+    after = len(json.dumps(sliced, separators=(",", ":")))
+    if after >= before:
+        print(f"[AGENT DEBUG] Controller config kept whole: slice would be {after} >= {before} chars")
+        return context
+    print(f"[AGENT DEBUG] Controller config sliced: {before} -> {after} chars")
+    return sliced
@@ -0,0 +1,49 @@
+from functools import lru_cache
+from typing import Any, Dict, List
+from pydantic import BaseModel
+from models.AgentModels import AgentResponse, AgentStep
+from models.HmiModels import HmiPatchOp, ProposedChanges
+from utils.json_schema_to_gbnf import json_schema_to_gbnf
+
+
+class ConstrainedAgentResponse(AgentResponse):
+    """AgentResponse with proposed_changes narrowed to the HMI shapes."""
+    proposed_changes: ProposedChanges
+
+
+class ConstrainedAgentPatch(BaseModel):
+    """Patch output mode: message/steps plus edit ops instead of proposed_changes."""
+    message: str
+    steps: List[AgentStep]
+    patch: List[HmiPatchOp]
+
+
+def _model_schema(model) -> Dict[str, Any]:
+    if hasattr(model, "model_json_schema"):
+        return model.model_json_schema()
+    return model.schema()  # pydantic v1
+
+
+def _close_objects(schema: Any) -> Any:
+    """additionalProperties: false on every object with declared properties (needed for "strict")."""
+    if isinstance(schema, dict):
+        for value in schema.values():
+            _close_objects(value)
+        if "properties" in schema:
+            schema.setdefault("additionalProperties", False)
+    elif isinstance(schema, list):
+        for item in schema:
+            _close_objects(item)
+    return schema
+
+
+@lru_cache(maxsize=2)
+def build_agent_response_schema(patch_mode: bool = False) -> Dict[str, Any]:
+    """JSON Schema the model output must satisfy in constrained decoding mode."""
+    return _close_objects(_model_schema(ConstrainedAgentPatch if patch_mode else ConstrainedAgentResponse))
+
+
+@lru_cache(maxsize=2)
+def build_agent_response_grammar(patch_mode: bool = False) -> str:
+    """GBNF grammar equivalent of build_agent_response_schema() for llama.cpp."""
+    return json_schema_to_gbnf(build_agent_response_schema(patch_mode))
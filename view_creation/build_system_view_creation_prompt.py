@@ -1,3 +1,4 @@
+from view_creation.component_defaults import COMPONENT_DEFAULTS_ENABLED, compact_output_instructions
 
 
 def build_system_view_creation_prompt() -> str:
@@ -15,7 +16,7 @@ def build_system_view_creation_prompt() -> str:
         '  \"steps\": [ { \"title\": string, \"details\": string }, ... ],\n'
         '  \"proposed_changes\": {\n'
         '    \"hmi\": { \"views\": [ ... view objects to add or replace ... ],  "general": { "viewsTree": [ ... ] } },\n'
-        '    \"tags_to_add\": [ ... tag objects to be create ... ],\n'
+        '    \"tags_to_add\": [ { \"<tagName>\": tag object }, ... one entry per tag to create ... ],\n'
         '   \"components_to_add\": [ ... component objects to create ... ]\n'
         "  }\n"
         "}\n"
@@ -35,6 +36,8 @@ def build_system_view_creation_prompt() -> str:
         "  (label, button, numericInput, keyboard, nested view, etc.). \n"
         "\n"
     )
+    if COMPONENT_DEFAULTS_ENABLED:
+        prompt += compact_output_instructions()
 
     return prompt
 
@@ -0,0 +1,22 @@
+from functools import lru_cache
+from view_creation.build_system_view_creation_prompt import build_system_view_creation_prompt
+from view_creation.build_system_view_patch_prompt import build_system_view_patch_prompt
+
+
+@lru_cache(maxsize=4)
+def build_view_prompt_prefix(static_reference: str, patch_mode: bool = False) -> str:
+    """
+    System prompt + static component reference as one string.
+    Identical for every request (until the reference docs change), so the
+    backend can reuse its KV cache for it; per-request content goes after it.
+    """
+    prompt = build_system_view_patch_prompt() if patch_mode else build_system_view_creation_prompt()
+    if not static_reference:
+        return prompt
+    return (
+        prompt
+        + "Component reference (exact shapes and default values):\n"
+        + "COMPONENT_REFERENCE_START\n"
+        + static_reference
+        + "\nCOMPONENT_REFERENCE_END\n"
+    )
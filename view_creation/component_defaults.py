@@ -0,0 +1,154 @@
+import copy
+import json
+import os
+import re
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+# Component defaults registry. The example objects in
+# ai_reference/hmi_components_reference.txt are the per-type templates; with
+# COMPONENT_DEFAULTS_ENABLED=1 the model only emits ids, type, position/size,
+# tag bindings and overridden fields, and the server deep-merges each view and
+# component over its template before building the AgentResponse.
+COMPONENT_DEFAULTS_ENABLED = os.getenv("COMPONENT_DEFAULTS_ENABLED", "0") == "1"
+COMPONENT_REFERENCE_PATH = os.getenv(
+    "COMPONENT_REFERENCE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ai_reference", "hmi_components_reference.txt"),
+)
+
+_EXAMPLE = re.compile(r"^Example ([A-Za-z ]+?)(?: \(.*\))?:\s*$")
+_COMMENT = re.compile(r"/\*.*?\*/")
+# Instance values in the examples that must not leak into other components
+_INSTANCE_FIELDS = ("id", "viewId", "name", "comptName", "x", "y")
+_INSTANCE_CONFIG = {"placeholder": "", "text": "", "varReplacement": []}
+_PLACEHOLDER_EVENT = re.compile(r"^__\w+__$")
+# Reference example titles -> template key ("nested view" is a component of type "view")
+_TEMPLATE_KEYS = {"view": "view", "nested view": "nestedView"}
+
+
+def _example_blocks(text: str):
+    """Yield (title, JSON text) for every "Example <title>:" block."""
+    lines = text.splitlines()
+    i = 0
+    while i < len(lines):
+        m = _EXAMPLE.match(lines[i].strip())
+        i += 1
+        if not m:
+            continue
+        while i < len(lines) and not lines[i].startswith("{"):
+            i += 1
+        start = i
+        while i < len(lines) and lines[i].rstrip() != "}":
+            i += 1
+        yield m.group(1).strip(), "\n".join(lines[start:i + 1])
+
+
+def _neutralize(example: Dict[str, Any]) -> Dict[str, Any]:
+    """Strip instance-specific values (ids, names, text, expressions) from an example."""
+    tpl = {k: v for k, v in example.items() if k not in _INSTANCE_FIELDS}
+    config = tpl.get("config")
+    if isinstance(config, dict):
+        for key, empty in _INSTANCE_CONFIG.items():
+            if key in config and not (key == "text" and config[key] == "0"):
+                config[key] = copy.deepcopy(empty)
+    if isinstance(tpl.get("animation"), dict):
+        tpl["animation"] = {k: "" for k in tpl["animation"]}
+    if isinstance(tpl.get("events"), dict):
+        tpl["events"] = {k: v if _PLACEHOLDER_EVENT.match(str(v)) else "" for k, v in tpl["events"].items()}
+    if isinstance(tpl.get("components"), list):
+        tpl["components"] = []
+    return tpl
+
+
+@lru_cache(maxsize=1)
+def load_component_defaults() -> Dict[str, Dict[str, Any]]:
+    """{"view": ..., "label": ..., "button": ..., "nestedView": ...} templates from the reference."""
+    try:
+        with open(COMPONENT_REFERENCE_PATH, "r", encoding="utf-8") as f:
+            text = f.read()
+    except OSError as e:
+        print(f"[AGENT DEBUG] Component reference unavailable, no defaults: {e}")
+        return {}
+
+    templates: Dict[str, Dict[str, Any]] = {}
+    for title, block in _example_blocks(text):
+        try:
+            example = json.loads(_COMMENT.sub("", block))
+        except ValueError as e:
+            print(f"[AGENT DEBUG] Skipping unparsable reference example {title!r}: {e}")
+            continue
+        key = _TEMPLATE_KEYS.get(title, example.get("type") or title)
+        templates[key] = _neutralize(example)
+    print(f"[AGENT DEBUG] Component defaults loaded: {', '.join(sorted(templates))}")
+    return templates
+
+
+def _deep_merge(defaults: Any, value: Any) -> Any:
+    """`value` over `defaults`: dicts merge recursively, anything else replaces."""
+    if isinstance(defaults, dict) and isinstance(value, dict):
+        out = copy.deepcopy(defaults)
+        for k, v in value.items():
+            out[k] = _deep_merge(out.get(k), v)
+        return out
+    return copy.deepcopy(value) if value is not None or defaults is None else copy.deepcopy(defaults)
+
+
+def _ordered(obj: Dict[str, Any]) -> Dict[str, Any]:
+    """Identity fields first, as in the reference examples."""
+    out = {k: obj[k] for k in ("id", "viewId", "name") if k in obj}
+    out.update(obj)
+    return out
+
+
+def _template_for(component: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    templates = load_component_defaults()
+    ctype = component.get("type")
+    if ctype == "view":
+        return templates.get("nestedView")
+    return templates.get(ctype)
+
+
+def expand_component(component: Any) -> Any:
+    """Fill a (compact) component with its type's defaults."""
+    if not isinstance(component, dict):
+        return component
+    tpl = _template_for(component)
+    return _ordered(_deep_merge(tpl, component)) if tpl else component
+
+
+def expand_view(view: Any) -> Any:
+    """Fill a (compact) view and each of its components with defaults."""
+    if not isinstance(view, dict):
+        return view
+    tpl = load_component_defaults().get("view")
+    out = _deep_merge(tpl, view) if tpl else dict(view)
+    if isinstance(out.get("components"), list):
+        components = []
+        for c in out["components"]:
+            # Nested views point viewId at the embedded view; everything else at its parent
+            if isinstance(c, dict) and c.get("type") != "view" and "viewId" not in c:
+                c = {**c, "viewId": out.get("id", "")}
+            components.append(expand_component(c))
+        out["components"] = components
+    return _ordered(out)
+
+
+def compact_defaults_text() -> str:
+    """One minified JSON line per type, for the compact system prompt."""
+    return "\n".join(
+        f"- {key}: {json.dumps(tpl, separators=(',', ':'))}"
+        for key, tpl in load_component_defaults().items()
+    )
+
+
+def compact_output_instructions() -> str:
+    """System prompt section telling the model to omit default-valued fields."""
+    return (
+        "Compact output: the server fills every omitted view/component field from the defaults below.\n"
+        "- For views emit only id, name and changed config fields; for components emit only id, type,\n"
+        "  comptName, x, y, w, h, tag bindings (animation/events) and fields that differ from the defaults.\n"
+        "- Never repeat default style/config values.\n"
+        "Defaults per type (nestedView = component of type \"view\"):\n"
+        + compact_defaults_text()
+        + "\n\n"
+    )
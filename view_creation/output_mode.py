@@ -0,0 +1,49 @@
+import os
+import threading
+from typing import Any, Dict, Optional
+from RAG.context_packer import count_tokens
+
+# build_view output format:
+#   full  - the model re-emits every changed view/tag in proposed_changes (default)
+#   patch - the model emits compact edit ops, expanded server-side (utils/apply_agent_patch.py)
+# AgentRequest.output_mode overrides it per request, e.g. to compare both on a prompt set.
+LLM_OUTPUT_MODE = os.getenv("LLM_OUTPUT_MODE", "full").lower()
+OUTPUT_MODES = ("full", "patch")
+
+_stats_lock = threading.Lock()
+OUTPUT_STATS: Dict[str, Dict[str, float]] = {
+    mode: {"generations": 0, "output_tokens": 0, "generation_sec": 0.0} for mode in OUTPUT_MODES
+}
+
+
+def resolve_output_mode(requested: Optional[str] = None) -> str:
+    mode = (requested or LLM_OUTPUT_MODE).lower()
+    return mode if mode in OUTPUT_MODES else "full"
+
+
+def record_output(mode: str, raw: str, elapsed_sec: float) -> None:
+    """
+    Count generated tokens (LLM tokenizer) and generation time per output mode.
+    The first call may load the tokenizer: run it off the event loop.
+    """
+    tokens = count_tokens(raw)
+    with _stats_lock:
+        s = OUTPUT_STATS[mode]
+        s["generations"] += 1
+        s["output_tokens"] += tokens
+        s["generation_sec"] += elapsed_sec
+    print(f"[AGENT DEBUG] Output ({mode}): {tokens} tokens in {elapsed_sec:.2f}s")
+
+
+def get_output_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        out: Dict[str, Any] = {"default_mode": LLM_OUTPUT_MODE}
+        for mode, s in OUTPUT_STATS.items():
+            n = s["generations"] or 1
+            out[mode] = {
+                **s,
+                "generation_sec": round(s["generation_sec"], 3),
+                "avg_output_tokens": round(s["output_tokens"] / n, 1),
+                "avg_generation_sec": round(s["generation_sec"] / n, 3),
+            }
+        return out